@@ -0,0 +1,235 @@
+"""
+Response cache for read endpoints.
+
+Handlers opt in with the ``cached`` decorator. Entries are keyed by route and
+call parameters and carry tags (e.g. ``template:3`` or ``user:7``) so write
+handlers can invalidate exactly the entries they affect with ``invalidate``.
+
+The backend is chosen with CACHE_BACKEND:
+- memory (default): in-process LRU with TTL, per worker
+- redis: shared across workers and pods, needs the redis package and CACHE_URL
+- none: caching disabled
+
+Results read through a replica session are returned but not cached: after a
+write invalidates an entry, a lagging replica would otherwise put the old
+data back for CACHE_TTL, past the writer's read-your-writes window.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+class CacheBackend:
+    """Storage interface used by the response cache."""
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: int, tags: Iterable[str] = ()):
+        raise NotImplementedError
+
+    def invalidate_tags(self, tags: Iterable[str]):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+class NullCache(CacheBackend):
+    """Backend that never stores anything."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl, tags=()):
+        pass
+
+    def invalidate_tags(self, tags):
+        pass
+
+    def clear(self):
+        pass
+
+class MemoryCache(CacheBackend):
+    """Thread-safe in-process LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            tags = tuple(tags)
+            self._entries[key] = (self.clock() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, set()):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+class RedisCache(CacheBackend):
+    """
+    Shared backend on a Redis-compatible client. Values are stored as JSON
+    and each tag is a set of the keys it covers. Any client implementing
+    get/setex/sadd/expire/smembers/delete/scan_iter can be passed in.
+    """
+
+    def __init__(self, client=None, url: str = CACHE_URL, prefix: str = "workout-motivator:cache:"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl, tags=()):
+        full_key = self.prefix + key
+        self.client.setex(full_key, ttl, json.dumps(value))
+        for tag in tags:
+            tag_key = self._tag_key(tag)
+            self.client.sadd(tag_key, full_key)
+            self.client.expire(tag_key, ttl)
+
+    def invalidate_tags(self, tags):
+        for tag in tags:
+            tag_key = self._tag_key(tag)
+            keys = [key.decode() if isinstance(key, bytes) else key for key in self.client.smembers(tag_key)]
+            self.client.delete(tag_key, *keys)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def _tag_key(self, tag):
+        return f"{self.prefix}tag:{tag}"
+
+def build_backend(name: str = CACHE_BACKEND) -> CacheBackend:
+    if name == "none":
+        return NullCache()
+    if name == "redis":
+        return RedisCache()
+    return MemoryCache()
+
+_backend: CacheBackend = build_backend()
+
+def get_backend() -> CacheBackend:
+    return _backend
+
+def set_backend(backend: CacheBackend):
+    """Swap the cache backend, e.g. for a shared one or a stand-in in tests."""
+    global _backend
+    _backend = backend
+
+def invalidate(*tags: str):
+    """Drop every cached entry carrying one of the tags."""
+    try:
+        _backend.invalidate_tags(tags)
+    except Exception as e:
+        logger.error(f"Error invalidating cache tags {tags}: {str(e)}")
+
+def clear():
+    _backend.clear()
+
+def make_key(route: str, params: Dict[str, Any]) -> str:
+    return f"{route}:{json.dumps(params, sort_keys=True, default=str)}"
+
+def cached(
+    response_model: Any,
+    tags: Optional[Callable[[Dict[str, Any]], List[str]]] = None,
+    ttl: int = CACHE_TTL
+):
+    """
+    Cache a router handler's serialized response.
+    - response_model: the handler's response model, used to serialize ORM results
+    - tags: builds the entry's invalidation tags from the call parameters
+    Database sessions are left out of the key; any other parameter is part of it.
+    Results read through a replica session are not stored.
+    """
+    adapter = TypeAdapter(response_model)
+
+    def decorator(func):
+        route = f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            params = {name: value for name, value in kwargs.items() if not isinstance(value, Session)}
+            key = make_key(route, params)
+            try:
+                hit = _backend.get(key)
+            except Exception as e:
+                logger.error(f"Error reading cache entry {key}: {str(e)}")
+                hit = None
+            if hit is not None:
+                return hit
+
+            result = func(*args, **kwargs)
+            value = jsonable_encoder(adapter.validate_python(result, from_attributes=True))
+            if any(isinstance(arg, Session) and arg.info.get("replica") for arg in kwargs.values()):
+                return value
+            try:
+                _backend.set(key, value, ttl, tags(params) if tags else [])
+            except Exception as e:
+                logger.error(f"Error writing cache entry {key}: {str(e)}")
+            return value
+
+        return wrapper
+    return decorator
@@ -0,0 +1,137 @@
+"""
+In-memory snapshot of the exercise library.
+
+The catalog only changes when assets are (re)loaded, so it is read once into
+memory and the lookup indexes are built from that snapshot. Endpoints that
+can be answered from the catalog take it through the ``get_catalog``
+dependency instead of querying the database.
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import Depends
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import cache, database, models, schemas
+from .similarity import SimilarityIndex
+from .suggest import PrefixIndex
+from .tags import EQUIPMENT, MUSCLE, TagIndex, extract_tags
+
+logger = logging.getLogger(__name__)
+
+class ExerciseCatalog:
+    """Serialized exercises ordered by id, plus the indexes built over them."""
+
+    def __init__(self):
+        self.version = 0
+        self.exercises: List[Dict] = []
+        self.by_id: Dict[int, Dict] = {}
+        self.similarity: Optional[SimilarityIndex] = None
+        self.tags: Optional[TagIndex] = None
+        self.prefixes: Optional[PrefixIndex] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.version > 0
+
+    def get(self, exercise_id: int) -> Optional[Dict]:
+        return self.by_id.get(exercise_id)
+
+    def load(self, db: Session):
+        """Read the whole exercise library and rebuild every index."""
+        exercises = db.query(models.Exercise).order_by(models.Exercise.id).all()
+        tags = defaultdict(set)
+        for exercise_id, kind, name in db.execute(
+            select(models.exercise_tags.c.exercise_id, models.Tag.kind, models.Tag.name)
+            .join(models.Tag, models.Tag.id == models.exercise_tags.c.tag_id)
+        ):
+            tags[exercise_id].add((kind, name))
+        self.build(exercises, tags, self._load_popularity(db))
+
+    @staticmethod
+    def _load_popularity(db: Session) -> Dict[int, int]:
+        """Per exercise: templates using it plus sessions it was performed in."""
+        popularity = defaultdict(int)
+        for exercise_id, count in db.execute(
+            select(models.WorkoutExercise.exercise_id, func.count())
+            .group_by(models.WorkoutExercise.exercise_id)
+        ):
+            popularity[exercise_id] += count
+        for exercise_id, count in db.execute(
+            select(models.WorkoutSet.exercise_id, func.count(models.WorkoutSet.session_id.distinct()))
+            .group_by(models.WorkoutSet.exercise_id)
+        ):
+            popularity[exercise_id] += count
+        return popularity
+
+    def build(
+        self,
+        exercises: List[models.Exercise],
+        tags: Optional[Dict[int, Set[Tuple[str, str]]]] = None,
+        popularity: Optional[Dict[int, int]] = None
+    ):
+        """
+        Rebuild the snapshot. tags maps exercise ids to their (kind, name)
+        tags as stored by the loader; without it they are extracted here.
+        popularity ranks typeahead suggestions and defaults to none.
+        """
+        records = [schemas.Exercise.model_validate(exercise).model_dump() for exercise in exercises]
+        if tags is None:
+            tags = {exercise.id: extract_tags(exercise) for exercise in exercises}
+        popularity = popularity or {}
+        similarity = SimilarityIndex.build(records)
+        tag_index = self._build_tag_index(records, tags)
+        prefixes = PrefixIndex(
+            [record["title"] for record in records],
+            [popularity.get(record["id"], 0) for record in records]
+        )
+
+        with self._lock:
+            self.exercises = records
+            self.by_id = {record["id"]: record for record in records}
+            self.similarity = similarity
+            self.tags = tag_index
+            self.prefixes = prefixes
+            self.version += 1
+
+        # Cached responses derived from the previous catalog are stale now
+        cache.invalidate("catalog")
+        logger.info(f"Exercise catalog loaded: {len(records)} exercises (version {self.version})")
+
+    @staticmethod
+    def _build_tag_index(records: List[Dict], tags: Dict[int, Iterable[Tuple[str, str]]]) -> TagIndex:
+        index = TagIndex(len(records))
+        facets = {MUSCLE: "muscles", EQUIPMENT: "equipment"}
+        for position, record in enumerate(records):
+            index.add("category", record["category"], position)
+            index.add("difficulty", record["difficulty"], position)
+            for kind, name in tags.get(record["id"], ()):
+                index.add(facets[kind], name, position)
+        return index
+
+    def ensure_loaded(self, db: Session):
+        if not self.loaded:
+            self.load(db)
+
+    def clear(self):
+        with self._lock:
+            self.exercises = []
+            self.by_id = {}
+            self.similarity = None
+            self.tags = None
+            self.prefixes = None
+            self.version = 0
+
+catalog = ExerciseCatalog()
+
+def get_catalog(db: Session = Depends(database.get_read_db)) -> ExerciseCatalog:
+    """
+    Dependency returning the loaded catalog. It is normally loaded at startup;
+    the database session is only used if it has not been loaded yet.
+    """
+    catalog.ensure_loaded(db)
+    return catalog
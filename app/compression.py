@@ -0,0 +1,207 @@
+"""
+Response compression.
+
+CompressionMiddleware compresses HTTP responses with brotli or gzip,
+whichever the client accepts (brotli only if the brotli package is
+installed). Bodies under COMPRESSION_MIN_SIZE are sent as they are.
+Streamed responses are compressed chunk by chunk, and every chunk is
+flushed, so downloads still arrive progressively. Responses that already
+carry a Content-Encoding, and content types that are compressed already
+(application/gzip, images, ...), are passed through.
+
+Catalog responses only change when the catalog is reloaded. catalog_response
+compresses them once per catalog version with the highest settings and keeps
+the bytes in a small LRU, so identical bodies are not compressed again on
+every request.
+"""
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+PRECOMPRESSED_MAX_ENTRIES = int(os.getenv("PRECOMPRESSED_MAX_ENTRIES", "256"))
+
+GZIP, BROTLI = "gzip", "br"
+
+# Content types not worth compressing again
+INCOMPRESSIBLE_TYPES = ("application/gzip", "application/x-gzip", "application/zip", "image/", "video/", "audio/", "font/woff")
+
+def supported_encodings() -> Tuple[str, ...]:
+    return (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Preferred supported encoding of an Accept-Encoding header, brotli first on ties."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for encoding in supported_encodings():
+        weight = weights.get(encoding, wildcard)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+class Compressor:
+    """Incremental compressor of one response body."""
+
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        self.encoding = encoding
+        if encoding == BROTLI:
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY if level is None else level)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes, final: bool) -> bytes:
+        """Compress a chunk and flush it; the final chunk also ends the stream."""
+        if self.encoding == BROTLI:
+            data = self._brotli.process(chunk)
+            return data + (self._brotli.finish() if final else self._brotli.flush())
+        data = self._zlib.compress(chunk)
+        return data + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    return Compressor(encoding, level).compress(body, final=True)
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return not content_type.startswith(INCOMPRESSIBLE_TYPES)
+
+class CompressionMiddleware:
+    """ASGI middleware compressing HTTP responses the client accepts compressed."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor: Optional[Compressor] = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                if is_compressible(headers) and (more_body or len(body) >= self.minimum_size):
+                    compressor = Compressor(encoding)
+                    del headers["content-length"]
+                    headers["content-encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                await send(start)
+                start = None
+
+            if compressor is not None:
+                message = {
+                    "type": "http.response.body",
+                    "body": compressor.compress(body, final=not more_body),
+                    "more_body": more_body,
+                }
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+class PrecompressedCache:
+    """Encoded bodies by request key, for the current catalog version only."""
+
+    def __init__(self, max_entries: int = PRECOMPRESSED_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.version = None
+        self._entries: OrderedDict = OrderedDict()  # (key, encoding) -> body
+        self._lock = threading.Lock()
+
+    def get(self, version: int, key: str, encoding: str, build: Callable[[], bytes]) -> bytes:
+        """Body of key in an encoding ("identity" for none), built and compressed on first use."""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+            body = self._entries.get((key, encoding))
+            if body is not None:
+                self._entries.move_to_end((key, encoding))
+                return body
+
+        if encoding == "identity":
+            body = build()
+        else:
+            # Compressed once per catalog version, so the slowest settings pay off
+            body = compress(self.get(version, key, "identity", build), encoding, level=11 if encoding == BROTLI else 9)
+
+        with self._lock:
+            if version == self.version:
+                self._entries[(key, encoding)] = body
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.version = None
+
+precompressed = PrecompressedCache()
+
+def catalog_response(request: Request, version: int, response_model: Any, build: Callable[[], Any]) -> Response:
+    """
+    JSON response of a catalog endpoint. build() returns the content and is
+    only called when this request's body is not cached for the catalog version.
+    """
+    key = f"{request.url.path}?{urlencode(sorted(request.query_params.multi_items()))}"
+    encoding = negotiate(request.headers.get("accept-encoding")) or "identity"
+
+    def render() -> bytes:
+        adapter = TypeAdapter(response_model)
+        return adapter.dump_json(adapter.validate_python(build(), from_attributes=True))
+
+    body = precompressed.get(version, key, "identity", render)
+    if len(body) < COMPRESSION_MIN_SIZE:
+        encoding = "identity"
+    elif encoding != "identity":
+        body = precompressed.get(version, key, encoding, render)
+    headers: Dict[str, str] = {"Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,12 +1,20 @@
-from sqlalchemy import create_engine, inspect, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import (
+    create_engine, event, func, inspect, select, text,
+    Column, Date, DateTime, Integer, MetaData, String, Table
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from fastapi import Request, Response
+import itertools
 import os
 import logging
-import psycopg2
+import time
 from urllib.parse import quote_plus
-from datetime import datetime
+from datetime import date, datetime
+import gzip
 import json
-from . import models
+from . import models, partitioning
 from .base import Base
 
 # Create a logger
@@ -16,110 +24,245 @@ logger = logging.getLogger(__name__)
 DB_NAME = os.getenv("POSTGRES_DB", "workout_motivator_db")
 DB_USER = os.getenv("POSTGRES_USER", "postgres")
 DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
-DB_HOST = "workout-motivator-db"
-DB_PORT = 5432
+DB_HOST = os.getenv("POSTGRES_HOST", "workout-motivator-db")
+DB_PORT = int(os.getenv("POSTGRES_PORT", "5432"))
 
-# Construct SQLAlchemy URL with proper URL encoding for special characters
-SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{quote_plus(DB_PASSWORD)}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Construct SQLAlchemy URL with proper URL encoding for special characters.
+# DATABASE_URL overrides it; DATABASE_REPLICA_URLS lists read replicas.
+SQLALCHEMY_DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql://{DB_USER}:{quote_plus(DB_PASSWORD)}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Reads of a client go to the primary for this long after it wrote
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+STICKY_PRIMARY_COOKIE = "db_primary_until"
+
+# SQLite connection settings, e.g. DATABASE_URL=sqlite:////data/workout-motivator.db
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+def _is_memory_database(url) -> bool:
+    return url.database in (None, "", ":memory:") or "mode=memory" in str(url)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune every new SQLite connection: WAL lets readers run alongside the writer"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def create_database_engine(url: str, **kwargs):
+    """
+    Engine for a Postgres or SQLite URL. SQLite connections may be used from
+    any threadpool thread; file databases get one pooled connection per
+    thread, in-memory databases share a single connection.
+    """
+    database_url = make_url(url)
+    if database_url.get_backend_name() != "sqlite":
+        return create_engine(database_url, **kwargs)
+
+    kwargs.setdefault("connect_args", {}).update(check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    if _is_memory_database(database_url):
+        kwargs.setdefault("poolclass", StaticPool)
+    else:
+        kwargs.setdefault("pool_size", 10)
+        kwargs.setdefault("max_overflow", 10)
+    sqlite_engine = create_engine(database_url, **kwargs)
+    event.listen(sqlite_engine, "connect", _set_sqlite_pragmas)
+    return sqlite_engine
+
+engine = create_database_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+replica_engines = [create_database_engine(url) for url in REPLICA_URLS]
 
-def get_db():
-    db = SessionLocal()
+# Number of rows fetched per round trip and inserted per batch by backup/restore
+BACKUP_CHUNK_SIZE = int(os.getenv("BACKUP_CHUNK_SIZE", "1000"))
+
+class DatabaseRouter:
+    """
+    Sends writes to the primary and reads to the replicas in turn. A client
+    that has just written carries a cookie keeping its reads on the primary
+    until the replicas have caught up.
+    """
+
+    def __init__(self, primary: sessionmaker, replicas=(), sticky_seconds: int = READ_YOUR_WRITES_SECONDS):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.sticky_seconds = sticky_seconds
+        self._next_replica = itertools.cycle(self.replicas)
+
+    def write_session(self, response: Response = None) -> Session:
+        db = self.primary()
+        db.info["response"] = response
+        db.info["sticky_seconds"] = self.sticky_seconds
+        return db
+
+    def read_session(self, request: Request = None) -> Session:
+        if self.replicas and not self._sticky(request):
+            db = next(self._next_replica)()
+            # Replicas may lag, so what is read here must not refill the response cache
+            db.info["replica"] = True
+        else:
+            db = self.primary()
+        db.info["read_only"] = True
+        return db
+
+    @staticmethod
+    def _sticky(request: Request) -> bool:
+        if request is None:
+            return False
+        try:
+            return float(request.cookies.get(STICKY_PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+db_router = DatabaseRouter(
+    SessionLocal,
+    [sessionmaker(autocommit=False, autoflush=False, bind=replica) for replica in replica_engines]
+)
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush_write(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_statement_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        if orm_execute_state.session.info.get("read_only"):
+            raise RuntimeError("Write attempted through a read-only database session")
+        orm_execute_state.session.info["wrote"] = True
+
+@event.listens_for(Session, "before_flush")
+def _reject_read_only_flush(session, flush_context, instances):
+    if session.info.get("read_only") and (session.new or session.deleted or session.dirty):
+        raise RuntimeError("Write attempted through a read-only database session")
+
+@event.listens_for(Session, "after_commit")
+def _stick_to_primary(session):
+    """After a request commits a write, keep the client's reads on the primary for a while."""
+    response = session.info.get("response")
+    if response is None or not session.info.pop("wrote", False):
+        return
+    sticky_seconds = session.info["sticky_seconds"]
+    response.set_cookie(
+        STICKY_PRIMARY_COOKIE,
+        str(int(time.time()) + sticky_seconds + 1),
+        max_age=sticky_seconds + 1,
+        httponly=True,
+        samesite="lax"
+    )
+
+def get_db(response: Response = None):
+    """Session on the primary, for handlers that write"""
+    db = db_router.write_session(response)
     try:
         yield db
     finally:
         db.close()
 
-def backup_data(db):
-    """Backup existing data before migration"""
+def get_read_db(request: Request = None):
+    """Read-only session on a replica, or on the primary right after this client wrote"""
+    db = db_router.read_session(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_session_factory():
+    """Session factory for work outliving a request, e.g. live session flushes"""
+    return SessionLocal
+
+def _serialize_value(value):
+    """Convert a column value into something json can encode"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _deserialize_row(table, row):
+    """Convert json values back into column values for the given table"""
+    for name, value in row.items():
+        if value is None or name not in table.c:
+            continue
+        column_type = table.c[name].type
+        if isinstance(column_type, DateTime):
+            row[name] = datetime.fromisoformat(value)
+        elif isinstance(column_type, Date):
+            row[name] = date.fromisoformat(value)
+    return row
+
+def _insert_chunk(db, table, rows):
+    """Bulk insert a chunk of rows with a single executemany"""
+    if table is None or not rows:
+        return
+    db.execute(table.insert(), rows)
+
+def _fill_session_start_times(db):
+    """Copy session start times to sets restored from backups taken before sets carried them"""
+    sets = models.WorkoutSet.__table__
+    sessions = models.WorkoutSession.__table__
+    db.execute(
+        sets.update()
+        .where(sets.c.session_start_time.is_(None))
+        .values(session_start_time=select(sessions.c.start_time).where(sessions.c.id == sets.c.session_id).scalar_subquery())
+    )
+
+def _reset_sequences(db):
+    """Move serial sequences past the ids restored from a backup"""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for table in Base.metadata.sorted_tables:
+        if 'id' not in table.c or not table.c.id.autoincrement:
+            continue
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table.name}"
+        ))
+
+def backup_data(db, chunk_size=BACKUP_CHUNK_SIZE):
+    """Backup existing data before migration.
+
+    Every table is streamed with a server-side cursor and written as one
+    gzipped NDJSON line per row, so memory use does not grow with table size.
+    Tables are written in dependency order so the file can be restored as is.
+    Only the tables and columns the database already has are backed up, as
+    a database from before a migration lacks the newer ones.
+    """
     try:
         logger.info("Creating data backup...")
-        backup = {
-            'exercises': [],
-            'workout_templates': [],
-            'workout_sessions': []
-        }
-
-        # Backup exercises
-        exercises = db.query(models.Exercise).all()
-        for exercise in exercises:
-            backup['exercises'].append({
-                'id': exercise.id,
-                'title': exercise.title,
-                'description': exercise.description,
-                'category': exercise.category,
-                'difficulty': exercise.difficulty,
-                'instructions': exercise.instructions,
-                'benefits': exercise.benefits,
-                'muscles_worked': exercise.muscles_worked,
-                'variations': exercise.variations,
-                'image_path': exercise.image_path,
-                'animation_path': exercise.animation_path
-            })
-
-        # Backup workout templates
-        templates = db.query(models.WorkoutTemplate).all()
-        for template in templates:
-            template_data = {
-                'id': template.id,
-                'title': template.title,
-                'description': template.description,
-                'user_id': template.user_id,
-                'difficulty': template.difficulty,
-                'estimated_duration': template.estimated_duration,
-                'created_at': template.created_at.isoformat() if template.created_at else None,
-                'updated_at': template.updated_at.isoformat() if template.updated_at else None,
-                'exercises': []
-            }
-            
-            for exercise in template.exercises:
-                template_data['exercises'].append({
-                    'exercise_id': exercise.exercise_id,
-                    'sets': exercise.sets,
-                    'reps': exercise.reps,
-                    'weight': exercise.weight,
-                    'duration': exercise.duration,
-                    'distance': exercise.distance,
-                    'notes': exercise.notes
-                })
-            
-            backup['workout_templates'].append(template_data)
-
-        # Backup workout sessions
-        sessions = db.query(models.WorkoutSession).all()
-        for session in sessions:
-            session_data = {
-                'id': session.id,
-                'template_id': session.template_id,
-                'user_id': session.user_id,
-                'start_time': session.start_time.isoformat() if session.start_time else None,
-                'end_time': session.end_time.isoformat() if session.end_time else None,
-                'completed': session.completed,
-                'notes': session.notes,
-                'sets': []
-            }
-            
-            for set in session.sets:
-                session_data['sets'].append({
-                    'exercise_id': set.exercise_id,
-                    'set_number': set.set_number,
-                    'reps': set.reps,
-                    'weight': set.weight,
-                    'duration': set.duration,
-                    'distance': set.distance,
-                    'completed': set.completed,
-                    'notes': set.notes
-                })
-            
-            backup['workout_sessions'].append(session_data)
+        backup_file = f'backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.ndjson.gz'
+        inspector = inspect(db.get_bind())
+        existing_tables = set(inspector.get_table_names())
+
+        with gzip.open(backup_file, 'wt', encoding='utf-8') as f:
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    logger.info(f"- {table.name}: not in this database, skipped")
+                    continue
+                existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+                rows = db.execute(
+                    select(*(column for column in table.c if column.name in existing_columns))
+                    .execution_options(yield_per=chunk_size)
+                ).mappings()
+
+                count = 0
+                for row in rows:
+                    record = {
+                        'table': table.name,
+                        'row': {key: _serialize_value(value) for key, value in row.items()}
+                    }
+                    f.write(json.dumps(record))
+                    f.write('\n')
+                    count += 1
+                logger.info(f"- {table.name}: {count} rows")
 
-        # Save backup to file
-        backup_file = f'backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-        with open(backup_file, 'w') as f:
-            json.dump(backup, f, indent=2)
-        
         logger.info(f"Backup created successfully: {backup_file}")
         return backup_file
     
@@ -127,39 +270,34 @@ def backup_data(db):
         logger.error(f"Error creating backup: {str(e)}")
         raise
 
-def restore_from_backup(backup_file, db):
-    """Restore data from backup file"""
+def restore_from_backup(backup_file, db, chunk_size=BACKUP_CHUNK_SIZE):
+    """Restore data from backup file.
+
+    The file is read line by line and rows are bulk inserted in chunks of
+    ``chunk_size``, so only one chunk is held in memory at a time.
+    """
     try:
         logger.info(f"Restoring data from backup: {backup_file}")
-        with open(backup_file, 'r') as f:
-            backup = json.load(f)
-
-        # Restore exercises
-        for exercise_data in backup['exercises']:
-            exercise = models.Exercise(**exercise_data)
-            db.add(exercise)
-
-        # Restore workout templates
-        for template_data in backup['workout_templates']:
-            exercises = template_data.pop('exercises')
-            template = models.WorkoutTemplate(**template_data)
-            
-            for exercise_data in exercises:
-                template_exercise = models.WorkoutExercise(**exercise_data)
-                template.exercises.append(template_exercise)
-            
-            db.add(template)
+        tables = Base.metadata.tables
+        current_table = None
+        chunk = []
 
-        # Restore workout sessions
-        for session_data in backup['workout_sessions']:
-            sets = session_data.pop('sets')
-            session = models.WorkoutSession(**session_data)
-            
-            for set_data in sets:
-                workout_set = models.WorkoutSet(**set_data)
-                session.sets.append(workout_set)
-            
-            db.add(session)
+        with gzip.open(backup_file, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                table = tables[record['table']]
+
+                if table is not current_table or len(chunk) >= chunk_size:
+                    _insert_chunk(db, current_table, chunk)
+                    current_table, chunk = table, []
+
+                chunk.append(_deserialize_row(table, record['row']))
+
+        _insert_chunk(db, current_table, chunk)
+        _fill_session_start_times(db)
+        _reset_sequences(db)
 
         db.commit()
         logger.info("Data restored successfully")
@@ -182,12 +320,26 @@ def init_db(max_retries=5, retry_delay=5):
             connection = engine.connect()
             connection = connection.execution_options(isolation_level="AUTOCOMMIT")
 
-            # Drop and recreate schema
-            connection.execute(text("DROP SCHEMA IF EXISTS public CASCADE"))
-            connection.execute(text("CREATE SCHEMA IF NOT EXISTS public"))
+            # Drop and recreate schema; SQLite has no schemas, so drop every table instead
+            if engine.dialect.name == "sqlite":
+                existing = MetaData()
+                existing.reflect(bind=connection)
+                existing.drop_all(bind=connection)
+            else:
+                connection.execute(text("DROP SCHEMA IF EXISTS public CASCADE"))
+                connection.execute(text("CREATE SCHEMA IF NOT EXISTS public"))
             
-            # Create all tables
-            Base.metadata.create_all(bind=engine)
+            # Create all tables, with sessions and sets as monthly partitions when enabled
+            if partitioning.PARTITIONING_ENABLED and partitioning.is_supported(engine):
+                regular_tables = [
+                    table for table in Base.metadata.sorted_tables
+                    if table.name not in partitioning.PARTITION_KEYS
+                ]
+                Base.metadata.create_all(bind=engine, tables=regular_tables)
+                partitioning.create_partitioned_tables(engine)
+                partitioning.ensure_partitions(engine)
+            else:
+                Base.metadata.create_all(bind=engine)
             
             logger.info("Database initialized successfully")
             connection.close()
@@ -205,6 +357,21 @@ def init_db(max_retries=5, retry_delay=5):
     logger.error(f"Database initialization failed after {max_retries} attempts")
     raise last_exception
 
+def ensure_indexes(bind=None):
+    """
+    Create any index declared on the models that is missing from the database.
+    Existing databases pick up new indexes this way without being recreated.
+    """
+    bind = bind or engine
+    with bind.connect() as connection:
+        existing_tables = set(inspect(connection).get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        connection.commit()
+
 def recreate_database():
     """Recreate all database tables with proper handling of dependencies."""
     try:
@@ -247,11 +414,125 @@ def verify_database_integrity():
     finally:
         db.close()
 
-def migrate_data():
-    """Migrate data from old schema to new schema if needed"""
+# Legacy tables (workout_assets -> exercises, workouts + exercise_assets -> templates).
+# exercise_assets holds one row per exercise in a legacy workout, pointing at
+# workouts.id through workout_id and at workout_assets.id through asset_id.
+LEGACY_ASSET_COLUMNS = (
+    "title", "description", "category", "difficulty", "instructions", "benefits",
+    "muscles_worked", "variations", "image_path", "animation_path"
+)
+
+# Bookkeeping for the legacy migration. It lives outside Base.metadata so it is
+# neither dropped by init_db nor included in backups, and it is what makes the
+# migration resumable: every migrated legacy row gets an (kind, old_id) entry
+# committed together with the rows created from it.
+migration_metadata = MetaData()
+legacy_id_map = Table(
+    'legacy_id_map',
+    migration_metadata,
+    Column('kind', String, primary_key=True),
+    Column('old_id', Integer, primary_key=True),
+    Column('new_id', Integer, nullable=False)
+)
+
+MIGRATION_CHUNK_SIZE = int(os.getenv("MIGRATION_CHUNK_SIZE", "5000"))
+
+def _migrate_legacy_assets(db):
+    """Copy workout_assets into exercises and record the id mapping server-side"""
+    columns = ", ".join(LEGACY_ASSET_COLUMNS)
+    source_columns = ", ".join(f"a.{column}" for column in LEGACY_ASSET_COLUMNS)
+    result = db.execute(text(f"""
+        WITH inserted AS (
+            INSERT INTO exercises ({columns}, created_at, updated_at)
+            SELECT {source_columns}, now() AT TIME ZONE 'utc', now() AT TIME ZONE 'utc'
+            FROM workout_assets a
+            WHERE NOT EXISTS (
+                SELECT 1 FROM legacy_id_map m WHERE m.kind = 'asset' AND m.old_id = a.id
+            )
+            ON CONFLICT (title) DO NOTHING
+            RETURNING id, title
+        )
+        INSERT INTO legacy_id_map (kind, old_id, new_id)
+        SELECT 'asset', a.id, e.id
+        FROM workout_assets a
+        JOIN (SELECT id, title FROM inserted UNION SELECT id, title FROM exercises) e
+            ON e.title = a.title
+        WHERE NOT EXISTS (
+            SELECT 1 FROM legacy_id_map m WHERE m.kind = 'asset' AND m.old_id = a.id
+        )
+        RETURNING old_id
+    """))
+    return len(result.fetchall())
+
+def _migrate_legacy_workouts_chunk(db, after_id, chunk_size):
+    """Migrate the next chunk of legacy workouts.
+
+    Template ids are drawn from the sequence inside the INSERT ... SELECT so the
+    old -> new mapping never leaves the server. Returns the last legacy id
+    covered by the chunk (None when there is nothing left) and the number of
+    workouts migrated in it.
+    """
+    upper_id = db.execute(text("""
+        SELECT max(id) FROM (
+            SELECT id FROM workouts WHERE id > :after_id ORDER BY id LIMIT :chunk_size
+        ) chunk
+    """), {"after_id": after_id, "chunk_size": chunk_size}).scalar()
+    if upper_id is None:
+        return None, 0
+
+    migrated_ids = db.execute(text("""
+        WITH src AS MATERIALIZED (
+            SELECT w.id, w.title, w.description, w.user_id, w.created_at, w.updated_at,
+                   nextval(pg_get_serial_sequence('workout_templates', 'id')) AS new_id
+            FROM workouts w
+            WHERE w.id > :after_id AND w.id <= :upper_id
+              AND NOT EXISTS (
+                  SELECT 1 FROM legacy_id_map m WHERE m.kind = 'workout' AND m.old_id = w.id
+              )
+        ), templates AS (
+            INSERT INTO workout_templates (id, title, description, user_id, created_at, updated_at)
+            SELECT new_id, title, description, user_id, created_at, updated_at FROM src
+            RETURNING id
+        )
+        INSERT INTO legacy_id_map (kind, old_id, new_id)
+        SELECT 'workout', src.id, src.new_id FROM src JOIN templates t ON t.id = src.new_id
+        RETURNING old_id
+    """), {"after_id": after_id, "upper_id": upper_id}).scalars().all()
+
+    if migrated_ids:
+        # Template exercises, ordered the way they were stored in the legacy workout
+        db.execute(text("""
+            INSERT INTO workout_template_exercises
+                (template_id, exercise_id, sets, reps, weight, duration, distance, "order")
+            SELECT tm.new_id, am.new_id, ea.sets, ea.reps, ea.weight, ea.duration, ea.distance,
+                   row_number() OVER (PARTITION BY ea.workout_id ORDER BY ea.id)
+            FROM exercise_assets ea
+            JOIN legacy_id_map tm ON tm.kind = 'workout' AND tm.old_id = ea.workout_id
+            LEFT JOIN legacy_id_map am ON am.kind = 'asset' AND am.old_id = ea.asset_id
+            WHERE ea.workout_id = ANY(:migrated_ids)
+        """), {"migrated_ids": migrated_ids})
+
+        # A completed legacy workout becomes a completed session of its template
+        db.execute(text("""
+            INSERT INTO workout_sessions (template_id, user_id, start_time, end_time, completed)
+            SELECT m.new_id, w.user_id, w.date, w.updated_at, true
+            FROM workouts w
+            JOIN legacy_id_map m ON m.kind = 'workout' AND m.old_id = w.id
+            WHERE w.id = ANY(:migrated_ids) AND w.completed
+        """), {"migrated_ids": migrated_ids})
+
+    return upper_id, len(migrated_ids)
+
+def migrate_data(chunk_size=MIGRATION_CHUNK_SIZE):
+    """Migrate data from old schema to new schema if needed.
+
+    The migration is set based and runs in chunks of ``chunk_size`` legacy
+    workouts, each committed in its own transaction. If it fails part way,
+    running it again skips everything already recorded in legacy_id_map and
+    continues with the remaining rows.
+    """
     logger.info("Checking if data migration is needed...")
     db = SessionLocal()
-    backup_file = None
     
     try:
         # Check if old tables exist
@@ -261,88 +542,42 @@ def migrate_data():
             'exercise_assets' in inspector.get_table_names()
         )
 
-        if has_old_schema:
-            logger.info("Old schema detected. Starting data migration...")
-            
-            # Create backup before migration
-            backup_file = backup_data(db)
-            
-            # Create a mapping of old exercise IDs to new ones
-            exercise_id_mapping = {}
-            
-            # Migrate workout assets to exercises
-            old_assets = db.query(models.WorkoutAsset).all()
-            for asset in old_assets:
-                new_exercise = models.Exercise(
-                    title=asset.title,
-                    description=asset.description,
-                    category=asset.category,
-                    difficulty=asset.difficulty,
-                    instructions=asset.instructions,
-                    benefits=asset.benefits,
-                    muscles_worked=asset.muscles_worked,
-                    variations=asset.variations,
-                    image_path=asset.image_path,
-                    animation_path=asset.animation_path
-                )
-                db.add(new_exercise)
-                db.flush()  # Get the new ID
-                exercise_id_mapping[asset.id] = new_exercise.id
-            
-            # Migrate workouts to workout templates
-            old_workouts = db.query(models.Workout).all()
-            for workout in old_workouts:
-                new_template = models.WorkoutTemplate(
-                    title=workout.title,
-                    description=workout.description,
-                    user_id=workout.user_id,
-                    created_at=workout.created_at,
-                    updated_at=workout.updated_at
-                )
-                db.add(new_template)
-                db.flush()
-                
-                # Migrate workout exercises to template exercises
-                for old_exercise in workout.exercises:
-                    template_exercise = models.WorkoutExercise(
-                        template_id=new_template.id,
-                        exercise_id=exercise_id_mapping.get(old_exercise.id),
-                        sets=old_exercise.sets,
-                        reps=old_exercise.reps,
-                        weight=old_exercise.weight,
-                        duration=old_exercise.duration,
-                        distance=old_exercise.distance
-                    )
-                    db.add(template_exercise)
-                
-                # Create a session for completed workouts
-                if workout.completed:
-                    session = models.WorkoutSession(
-                        template_id=new_template.id,
-                        user_id=workout.user_id,
-                        start_time=workout.date,
-                        end_time=workout.updated_at,
-                        completed=True
-                    )
-                    db.add(session)
-            
+        if not has_old_schema:
+            return
+
+        logger.info("Old schema detected. Starting data migration...")
+        migration_metadata.create_all(bind=engine)
+
+        # Only back up before the first run; a resumed run builds on committed chunks
+        already_migrated = db.execute(select(func.count()).select_from(legacy_id_map)).scalar()
+        if not already_migrated:
+            backup_data(db)
+
+        # Exercises first so template exercises can be mapped to them
+        migrated_assets = _migrate_legacy_assets(db)
+        db.commit()
+        logger.info(f"Migrated {migrated_assets} workout assets to exercises")
+
+        total = db.execute(text("SELECT count(*) FROM workouts")).scalar()
+        done = db.execute(
+            select(func.count()).select_from(legacy_id_map).where(legacy_id_map.c.kind == 'workout')
+        ).scalar()
+
+        after_id = 0
+        while True:
+            after_id, migrated = _migrate_legacy_workouts_chunk(db, after_id, chunk_size)
+            if after_id is None:
+                break
             db.commit()
-            logger.info("Data migration completed successfully")
+            done += migrated
+            logger.info(f"Migrated {done}/{total} workouts (up to legacy id {after_id})")
+
+        logger.info("Data migration completed successfully")
 
     except Exception as e:
         logger.error(f"Error during data migration: {str(e)}")
+        logger.error("Completed chunks are kept; run the migration again to resume")
         db.rollback()
-        
-        # Attempt to restore from backup if available
-        if backup_file:
-            logger.info("Attempting to restore from backup...")
-            try:
-                recreate_database()  # Reset to clean state
-                restore_from_backup(backup_file, db)
-                logger.info("Successfully restored from backup")
-            except Exception as restore_error:
-                logger.error(f"Failed to restore from backup: {str(restore_error)}")
-                raise Exception(f"Migration failed and restore failed: {str(e)}\nRestore error: {str(restore_error)}")
         raise
     finally:
         db.close()
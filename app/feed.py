@@ -0,0 +1,106 @@
+"""
+Partner activity feed.
+
+Events are written once to activity_events and fanned out at write time to
+feed_items, one row per partner, so reading a feed is a single keyset scan
+of the reader's own rows. Feeds are trimmed to FEED_MAX_ITEMS per user.
+
+Users with more than FEED_FANOUT_LIMIT partners are not fanned out; readers
+pull their latest events at read time and merge them into the pushed ones.
+"""
+import os
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, select, tuple_
+from sqlalchemy.orm import Session, aliased
+
+from . import models
+from .leaderboards import partner_ids
+
+FEED_MAX_ITEMS = int(os.getenv("FEED_MAX_ITEMS", "200"))
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", "500"))
+
+WORKOUT_STARTED = "workout_started"
+WORKOUT_COMPLETED = "workout_completed"
+PERSONAL_RECORD = "personal_record"
+
+def publish(
+    db: Session,
+    actor_id: Optional[int],
+    kind: str,
+    session_id: Optional[int] = None,
+    details: Optional[Dict] = None
+) -> Optional[models.ActivityEvent]:
+    """
+    Record an event and push it to the actor's partners' feeds. The caller
+    commits, so the event is stored together with the change it describes.
+    """
+    if actor_id is None:
+        return None
+    event = models.ActivityEvent(actor_id=actor_id, kind=kind, session_id=session_id, details=details)
+    db.add(event)
+    db.flush()
+
+    recipients = partner_ids(db, actor_id)
+    if not recipients or len(recipients) > FEED_FANOUT_LIMIT:
+        # Followers of very connected users pull these events when reading
+        return event
+
+    db.execute(insert(models.FeedItem), [
+        {"user_id": recipient, "event_id": event.id} for recipient in recipients
+    ])
+    _trim(db, recipients)
+    return event
+
+def _trim(db: Session, user_ids: List[int]):
+    """Drop feed rows beyond the newest FEED_MAX_ITEMS of each user, in one statement."""
+    items = models.FeedItem.__table__
+    ranked = (
+        select(
+            items.c.user_id,
+            items.c.event_id,
+            func.row_number().over(partition_by=items.c.user_id, order_by=items.c.event_id.desc()).label("position")
+        )
+        .where(items.c.user_id.in_(user_ids))
+        .subquery()
+    )
+    overflow = select(ranked.c.user_id, ranked.c.event_id).where(ranked.c.position > FEED_MAX_ITEMS)
+    db.execute(delete(items).where(tuple_(items.c.user_id, items.c.event_id).in_(overflow)))
+
+def _pulled_actor_ids(db: Session, user_id: int) -> List[int]:
+    """Partners of user_id whose events are not fanned out."""
+    partners = models.accountability_partners
+    their_partners = aliased(partners)
+    partner_count = (
+        select(func.count())
+        .select_from(their_partners)
+        .where(their_partners.c.user_id == partners.c.partner_id)
+        .scalar_subquery()
+    )
+    return db.execute(
+        select(partners.c.partner_id).where(partners.c.user_id == user_id, partner_count > FEED_FANOUT_LIMIT)
+    ).scalars().all()
+
+def read_feed(db: Session, user_id: int, before: Optional[int] = None, limit: int = 20) -> List[models.ActivityEvent]:
+    """
+    Newest events first. before is the id of the last event of the previous
+    page; keyset pagination keeps every page an index range scan.
+    """
+    events = models.ActivityEvent
+    pushed = (
+        select(events)
+        .join(models.FeedItem, models.FeedItem.event_id == events.id)
+        .where(models.FeedItem.user_id == user_id)
+    )
+    if before is not None:
+        pushed = pushed.where(models.FeedItem.event_id < before)
+    page = db.execute(pushed.order_by(models.FeedItem.event_id.desc()).limit(limit)).scalars().all()
+
+    pulled_actor_ids = _pulled_actor_ids(db, user_id)
+    if pulled_actor_ids:
+        pulled = select(events).where(events.actor_id.in_(pulled_actor_ids))
+        if before is not None:
+            pulled = pulled.where(events.id < before)
+        page += db.execute(pulled.order_by(events.id.desc()).limit(limit)).scalars().all()
+        page = sorted({event.id: event for event in page}.values(), key=lambda event: -event.id)[:limit]
+    return page
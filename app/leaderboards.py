@@ -0,0 +1,141 @@
+"""
+Weekly accountability-partner leaderboards.
+
+Each user has one user_weekly_stats row per week holding sessions completed,
+training volume and the running streak of weeks with a completed session.
+Rows are upserted as sessions complete and sets are logged, so a leaderboard
+reads one or two rows per partner however long their history is. Edits of
+sets already completed are applied as a volume delta.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import case, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+METRICS = ("sessions_completed", "volume", "streak")
+
+def week_start(value) -> date:
+    """Monday of the week containing value."""
+    if isinstance(value, datetime):
+        value = value.date()
+    return value - timedelta(days=value.weekday())
+
+def _upsert(db: Session):
+    """INSERT ... ON CONFLICT statement for user_weekly_stats on the session's database."""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(models.UserWeeklyStats)
+
+def record_session_completed(db: Session, session: models.WorkoutSession):
+    """
+    Count a newly completed session in the week it started. The first
+    completed session of a week extends the streak of the previous week.
+    The caller commits.
+    """
+    if session.user_id is None:
+        return
+    stats = models.UserWeeklyStats.__table__
+    week = week_start(session.start_time)
+    previous_streak = db.execute(
+        select(stats.c.streak).where(
+            stats.c.user_id == session.user_id,
+            stats.c.week_start == week - timedelta(weeks=1),
+            stats.c.sessions_completed > 0
+        )
+    ).scalar() or 0
+
+    statement = _upsert(db).values(
+        user_id=session.user_id,
+        week_start=week,
+        sessions_completed=1,
+        volume=0.0,
+        streak=previous_streak + 1
+    )
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[stats.c.user_id, stats.c.week_start],
+        set_={
+            "sessions_completed": stats.c.sessions_completed + 1,
+            "streak": case(
+                (stats.c.sessions_completed == 0, statement.excluded.streak),
+                else_=stats.c.streak
+            ),
+        }
+    ))
+
+def set_volume(workout_set) -> float:
+    """Training volume a set counts for: reps x weight once completed."""
+    if not workout_set.completed:
+        return 0.0
+    return (workout_set.reps or 0) * (workout_set.weight or 0)
+
+def record_volume(db: Session, session: models.WorkoutSession, volume: float):
+    """
+    Add volume, negative when completed sets were edited down or reopened,
+    to the week the session started. The caller commits.
+    """
+    if session.user_id is None or not volume:
+        return
+    stats = models.UserWeeklyStats.__table__
+    statement = _upsert(db).values(
+        user_id=session.user_id,
+        week_start=week_start(session.start_time),
+        sessions_completed=0,
+        volume=volume,
+        streak=0
+    )
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[stats.c.user_id, stats.c.week_start],
+        set_={"volume": stats.c.volume + statement.excluded.volume}
+    ))
+
+def record_sets_logged(db: Session, session: models.WorkoutSession, sets: Iterable[models.WorkoutSet]):
+    """Add the volume of newly written completed sets to the week their session started. The caller commits."""
+    record_volume(db, session, sum(set_volume(workout_set) for workout_set in sets))
+
+def partner_ids(db: Session, user_id: int) -> List[int]:
+    partners = models.accountability_partners
+    return db.execute(
+        select(partners.c.partner_id).where(partners.c.user_id == user_id)
+    ).scalars().all()
+
+def leaderboard(db: Session, user_id: int, week: date, metric: str = "sessions_completed") -> List[Dict]:
+    """
+    Rank a user and their partners for the week starting at week. A streak
+    still counts while the week is in progress: without a completed session
+    yet this week, last week's streak is shown.
+    """
+    stats = models.UserWeeklyStats.__table__
+    user_ids = [user_id] + partner_ids(db, user_id)
+    rows = db.execute(
+        select(stats).where(
+            stats.c.user_id.in_(user_ids),
+            stats.c.week_start.in_([week, week - timedelta(weeks=1)])
+        )
+    ).mappings().all()
+    current = {row["user_id"]: row for row in rows if row["week_start"] == week}
+    previous = {row["user_id"]: row for row in rows if row["week_start"] != week}
+    usernames = dict(db.execute(
+        select(models.User.id, models.User.username).where(models.User.id.in_(user_ids))
+    ).all())
+
+    entries = []
+    for entry_user_id in user_ids:
+        row: Optional[Dict] = current.get(entry_user_id)
+        streak = row["streak"] if row and row["sessions_completed"] else 0
+        if not streak and entry_user_id in previous and previous[entry_user_id]["sessions_completed"]:
+            streak = previous[entry_user_id]["streak"]
+        entries.append({
+            "user_id": entry_user_id,
+            "username": usernames.get(entry_user_id),
+            "sessions_completed": row["sessions_completed"] if row else 0,
+            "volume": row["volume"] if row else 0.0,
+            "streak": streak,
+        })
+
+    entries.sort(key=lambda entry: (-entry[metric], entry["user_id"]))
+    for rank, entry in enumerate(entries, start=1):
+        entry["rank"] = rank
+    return entries
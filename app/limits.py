@@ -0,0 +1,227 @@
+"""
+Per-client rate limiting and adaptive concurrency limiting.
+
+LoadSheddingMiddleware rejects work early instead of letting it queue on the
+threadpool and the database pool:
+- every client has a token bucket (RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST);
+  an empty bucket answers 429
+- requests in flight are capped by an AIMD limit that grows while responses
+  start within CONCURRENCY_TARGET_LATENCY and shrinks when they do not;
+  over the limit the answer is 503
+Both carry a Retry-After header. Workout tracking writes may use the whole
+limit, other requests part of it and catalog reads the smallest part, so
+writes still get through when reads saturate the pod.
+
+Buckets and limits live in the process: with several gunicorn workers each
+enforces them on its own share of the traffic (see app.server).
+"""
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+from starlette.responses import JSONResponse
+
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "60"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+
+CONCURRENCY_LIMIT_INITIAL = int(os.getenv("CONCURRENCY_LIMIT_INITIAL", "20"))
+CONCURRENCY_LIMIT_MIN = int(os.getenv("CONCURRENCY_LIMIT_MIN", "4"))
+CONCURRENCY_LIMIT_MAX = int(os.getenv("CONCURRENCY_LIMIT_MAX", "100"))
+CONCURRENCY_TARGET_LATENCY = float(os.getenv("CONCURRENCY_TARGET_LATENCY", "0.25"))  # seconds
+
+# Proxies in front of the app appending to X-Forwarded-For (1 behind the ingress)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Paths never limited
+EXEMPT_PATHS = {"/health", "/metrics"}
+
+# Share of the concurrency limit each priority may use
+HIGH, NORMAL, LOW = "high", "normal", "low"
+PRIORITY_SHARES = {HIGH: 1.0, NORMAL: 0.9, LOW: 0.75}
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`."""
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now: float) -> Tuple[bool, float]:
+        """Take a token; otherwise return the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate
+
+class ClientRateLimiter:
+    """Token buckets of the most recently seen clients."""
+
+    def __init__(
+        self,
+        rate: float = RATE_LIMIT_PER_SECOND,
+        burst: int = RATE_LIMIT_BURST,
+        max_clients: int = RATE_LIMIT_MAX_CLIENTS,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    def allow(self, client: str) -> Tuple[bool, float]:
+        if not self.enabled:
+            return True, 0.0
+        now = self.clock()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket.take(now)
+
+    def reset(self):
+        self._buckets.clear()
+
+class AdaptiveConcurrencyLimit:
+    """
+    Additive increase / multiplicative decrease of the number of requests
+    allowed in flight, driven by the latency until each response starts.
+    """
+
+    def __init__(
+        self,
+        initial: int = CONCURRENCY_LIMIT_INITIAL,
+        minimum: int = CONCURRENCY_LIMIT_MIN,
+        maximum: int = CONCURRENCY_LIMIT_MAX,
+        target_latency: float = CONCURRENCY_TARGET_LATENCY,
+        backoff: float = 0.9,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self.limit = float(self.initial)
+        self.in_flight = 0
+        self._last_decrease = -math.inf
+
+    def try_acquire(self, priority: str = NORMAL) -> bool:
+        if self.in_flight >= max(1, int(self.limit * PRIORITY_SHARES[priority])):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def observe(self, latency: float):
+        if latency > self.target_latency:
+            # Back off at most once per target latency so one burst of slow
+            # responses does not collapse the limit
+            now = self.clock()
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait: about the time the requests in flight need."""
+        return max(1, math.ceil(self.target_latency * self.in_flight / max(self.limit, 1)))
+
+rate_limiter = ClientRateLimiter()
+concurrency_limit = AdaptiveConcurrencyLimit()
+
+def reset():
+    """Forget client buckets and restart the concurrency limit, e.g. between tests."""
+    rate_limiter.reset()
+    concurrency_limit.reset()
+
+def request_priority(method: str, path: str) -> str:
+    if path.startswith("/workout-tracking") and method not in ("GET", "HEAD", "OPTIONS"):
+        return HIGH
+    if method in ("GET", "HEAD") and (path.startswith("/exercises") or path.startswith("/assets")):
+        return LOW
+    return NORMAL
+
+def client_key(scope) -> str:
+    """
+    Address a request is rate limited as. Each of the TRUSTED_PROXY_HOPS
+    proxies in front of the app appends its peer to X-Forwarded-For, so the
+    client is the entry that many places from the right; anything left of it
+    was sent by the client and is ignored. Otherwise the peer address.
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [
+            address.strip()
+            for name, value in scope.get("headers", ()) if name == b"x-forwarded-for"
+            for address in value.decode("latin-1").split(",")
+        ]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+class LoadSheddingMiddleware:
+    """ASGI middleware applying the rate and concurrency limits to HTTP requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        allowed, wait = rate_limiter.allow(client_key(scope))
+        if not allowed:
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        if not concurrency_limit.try_acquire(request_priority(scope["method"], scope["path"])):
+            response = JSONResponse(
+                {"detail": "Server is busy, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(concurrency_limit.retry_after())}
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        observed = False
+
+        async def send_and_observe(message):
+            nonlocal observed
+            if message["type"] == "http.response.start" and not observed:
+                observed = True
+                concurrency_limit.observe(time.monotonic() - started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_observe)
+        finally:
+            concurrency_limit.release()
@@ -0,0 +1,244 @@
+"""
+Live workout session channel.
+
+Devices following a session connect to its WebSocket. Set updates they send
+are broadcast to every subscriber through the broker right away, and written
+to workout_sets in batches: updates to the same set are coalesced in memory
+and flushed every LIVE_FLUSH_INTERVAL seconds, or as soon as
+LIVE_FLUSH_MAX_PENDING sets are waiting.
+
+Backpressure:
+- a sender that outpaces the flushes waits for the flush before its next
+  message is read
+- a subscriber whose outgoing queue is full is disconnected with code 1013
+  and reconnects to resync
+
+A flush that fails keeps its updates pending for the next one and tells
+the subscribers with an {"type": "error"} message.
+
+The broker is in-process; set_broker swaps in one that fans out across
+replicas (e.g. over Redis pub/sub) with the same interface.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import cache, leaderboards, models, records
+
+logger = logging.getLogger(__name__)
+
+LIVE_FLUSH_INTERVAL = float(os.getenv("LIVE_FLUSH_INTERVAL", "1.0"))
+LIVE_FLUSH_MAX_PENDING = int(os.getenv("LIVE_FLUSH_MAX_PENDING", "50"))
+LIVE_SEND_QUEUE_SIZE = int(os.getenv("LIVE_SEND_QUEUE_SIZE", "100"))
+
+SetKey = Tuple[int, int]  # (exercise_id, set_number)
+
+class Subscription:
+    """One subscriber's bounded queue of outgoing messages."""
+
+    def __init__(self, session_id: int, max_size: Optional[int] = None):
+        self.session_id = session_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size or LIVE_SEND_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, message: Dict[str, Any]):
+        """Queue a message; a full queue marks the subscriber as too slow."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+class Broker:
+    """Publish/subscribe interface for live session messages."""
+
+    def subscribe(self, session_id: int) -> Subscription:
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription: Subscription):
+        raise NotImplementedError
+
+    async def publish(self, session_id: int, message: Dict[str, Any]):
+        raise NotImplementedError
+
+class InProcessBroker(Broker):
+    """Delivers messages to the subscribers connected to this process."""
+
+    def __init__(self):
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+
+    def subscribe(self, session_id):
+        subscription = Subscription(session_id)
+        self._subscriptions.setdefault(session_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscriptions = self._subscriptions.get(subscription.session_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.session_id]
+
+    async def publish(self, session_id, message):
+        for subscription in list(self._subscriptions.get(session_id, ())):
+            subscription.offer(message)
+
+_broker: Broker = InProcessBroker()
+
+def get_broker() -> Broker:
+    return _broker
+
+def set_broker(broker: Broker):
+    global _broker
+    _broker = broker
+
+def write_set_updates(session_factory: Callable[[], Session], session_id: int, updates: Dict[SetKey, Dict]) -> int:
+    """
+    Apply coalesced set updates in one transaction: existing sets of the
+    session are updated, the others inserted, and the weekly volume moved by
+    the change in completed volume. Returns the sets written.
+    """
+    db = session_factory()
+    try:
+        session = db.get(models.WorkoutSession, session_id)
+        if session is None:
+            return 0
+        exercise_ids = {exercise_id for exercise_id, _ in updates}
+        known = {
+            exercise_id for (exercise_id,) in
+            db.query(models.Exercise.id).filter(models.Exercise.id.in_(exercise_ids))
+        }
+        unknown = exercise_ids - known
+        if unknown:
+            logger.warning(f"Dropping live updates of session {session_id} for unknown exercises {sorted(unknown)}")
+
+        existing = {
+            (workout_set.exercise_id, workout_set.set_number): workout_set
+            for workout_set in db.query(models.WorkoutSet).filter(
+                models.WorkoutSet.session_id == session_id,
+                models.WorkoutSet.exercise_id.in_(known),
+                models.WorkoutSet.set_number.in_({set_number for _, set_number in updates})
+            )
+        }
+        # Sets completed now or edited while completed; volume is applied as the change
+        completed_sets = []
+        volume = 0.0
+        written = 0
+        for (exercise_id, set_number), fields in updates.items():
+            if exercise_id in unknown:
+                continue
+            workout_set = existing.get((exercise_id, set_number))
+            if workout_set is not None:
+                volume -= leaderboards.set_volume(workout_set)
+            else:
+                workout_set = models.WorkoutSet(
+                    session_id=session_id,
+                    session_start_time=session.start_time,
+                    exercise_id=exercise_id,
+                    set_number=set_number,
+                    completed=False,
+                    created_at=datetime.utcnow()
+                )
+                db.add(workout_set)
+            for name, value in fields.items():
+                setattr(workout_set, name, value)
+            volume += leaderboards.set_volume(workout_set)
+            if workout_set.completed:
+                completed_sets.append(workout_set)
+            written += 1
+
+        leaderboards.record_volume(db, session, volume)
+        # Records only ever rise here; one lowered by an edit waits for the scheduled rebuild
+        records.record_sets(db, session, completed_sets)
+        db.commit()
+        cache.invalidate("sessions", f"user:{session.user_id}")
+        return written
+    finally:
+        db.close()
+
+class Channel:
+    """Pending set updates of one session and the task flushing them."""
+
+    def __init__(self, session_id: int, session_factory: Callable[[], Session]):
+        self.session_id = session_id
+        self.session_factory = session_factory
+        self.pending: Dict[SetKey, Dict] = {}
+        self.members = 0
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(LIVE_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing live session {self.session_id}: {str(e)}")
+
+    async def add(self, key: SetKey, fields: Dict):
+        """Coalesce an update into the pending ones, flushing first when too many are waiting."""
+        self.pending.setdefault(key, {}).update(fields)
+        if len(self.pending) >= LIVE_FLUSH_MAX_PENDING:
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            updates, self.pending = self.pending, {}
+            try:
+                written = await run_in_threadpool(write_set_updates, self.session_factory, self.session_id, updates)
+            except Exception as e:
+                # Put the batch back under the updates that arrived meanwhile; the next flush retries it
+                for key, fields in updates.items():
+                    self.pending[key] = {**fields, **self.pending.get(key, {})}
+                logger.error(f"Error writing live updates of session {self.session_id}: {str(e)}")
+                await get_broker().publish(self.session_id, {"type": "error", "detail": "Set updates not saved yet, retrying"})
+                return
+        await get_broker().publish(self.session_id, {"type": "flushed", "sets": written})
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self.pending:
+            logger.error(f"Dropping {len(self.pending)} unsaved set updates of live session {self.session_id}")
+
+class ChannelRegistry:
+    """Open channels by session id, shared by all connections to a session."""
+
+    def __init__(self):
+        self._channels: Dict[int, Channel] = {}
+
+    def join(self, session_id: int, session_factory: Callable[[], Session]) -> Channel:
+        channel = self._channels.get(session_id)
+        if channel is None:
+            channel = self._channels[session_id] = Channel(session_id, session_factory)
+            channel.start()
+        channel.members += 1
+        return channel
+
+    async def leave(self, channel: Channel):
+        """The last connection leaving flushes what is pending and closes the channel."""
+        channel.members -= 1
+        if channel.members == 0:
+            self._channels.pop(channel.session_id, None)
+            await channel.close()
+
+    async def close_all(self):
+        channels, self._channels = list(self._channels.values()), {}
+        for channel in channels:
+            await channel.close()
+
+channels = ChannelRegistry()
@@ -3,6 +3,7 @@ import json
 import shutil
 from sqlalchemy.orm import Session
 from . import models, database
+from .tags import sync_exercise_tags
 import logging
 import re
 from pathlib import Path
@@ -181,6 +182,9 @@ def load_assets(db: Session):
                             continue
                 
         db.commit()
+
+        # Normalized muscle / equipment tags for filtering
+        sync_exercise_tags(db)
         logger.info("Asset loading completed successfully")
         
     except Exception as e:
@@ -2,13 +2,19 @@ from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import distinct
 from typing import List, Optional
 from . import models, schemas
 from .database import engine, get_db, recreate_database, init_db, SessionLocal
 from .load_assets import load_assets as load_all_exercise_assets
-from .routers import exercises, workout_templates, workout_tracking
+from .catalog import catalog
+from .live import channels as live_channels
+from . import write_behind
+from .limits import LoadSheddingMiddleware
+from .compression import CompressionMiddleware
+from .routers import exercises, partners, workout_templates, workout_tracking
 import logging
 import os
 from pathlib import Path
@@ -20,12 +26,24 @@ logging.basicConfig(level=logging.INFO)
 # Create FastAPI app
 app = FastAPI(title="Workout Tracker API")
 
+# Middleware added later wraps the earlier ones, so requests pass through
+# CORS first, then load shedding, then compression: CORS headers are set on
+# 429 / 503 responses too, and only responses of routes are compressed.
+
+# Compress responses; added first so it wraps the routes directly
+if os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes"):
+    app.add_middleware(CompressionMiddleware)
+
+# Shed load before it queues on the threadpool and the database pool
+if os.getenv("LOAD_SHEDDING_ENABLED", "true").lower() in ("1", "true", "yes"):
+    app.add_middleware(LoadSheddingMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://20.31.46.9", "http://108.141.13.160"],
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"],
     allow_headers=["*"],
     expose_headers=["*"],
     max_age=3600,
@@ -35,6 +53,7 @@ app.add_middleware(
 app.include_router(exercises.router, prefix="/exercises", tags=["exercises"])
 app.include_router(workout_templates.router, prefix="/workout-templates", tags=["workouts"])
 app.include_router(workout_tracking.router, prefix="/workout-tracking", tags=["tracking"])
+app.include_router(partners.router, prefix="/partners", tags=["partners"])
 
 # Mount assets directory only if it exists
 ASSETS_DIR = Path(__file__).parent / "assets"
@@ -43,21 +62,47 @@ if ASSETS_DIR.exists():
 else:
     logger.warning(f"Assets directory {ASSETS_DIR} does not exist. Static file serving is disabled.")
 
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Starting application...")
+# Set once the database and catalog are ready in this process, or in the
+# prefork master this worker was forked from
+initialized = False
+
+def initialize():
+    """Prepare the database and build the in-memory catalog, once per server."""
+    global initialized
+    if initialized:
+        return
     try:
         # Recreate database tables
         recreate_database()
         
         # Initialize database with exercise assets
         load_all_exercise_assets(SessionLocal())
+
+        # Build the in-memory exercise catalog and its indexes
+        db = SessionLocal()
+        try:
+            catalog.load(db)
+        finally:
+            db.close()
         
+        initialized = True
         logger.info("Database initialization completed successfully")
     except Exception as e:
         logger.error(f"Error during startup: {str(e)}")
         raise
 
+@app.on_event("startup")
+async def startup_event():
+    logger.info("Starting application...")
+    initialize()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Write the pending set updates of live sessions
+    await live_channels.close_all()
+    # Write the sets still queued in the write-behind buffer
+    await run_in_threadpool(write_behind.set_buffer.close)
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Workout Tracker API"}
@@ -65,3 +110,8 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/metrics")
+async def metrics():
+    """Queue depth and batch counters of the set write-behind buffer."""
+    return {"set_buffer": write_behind.set_buffer.stats()}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Table, Boolean, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, Float, Table, Boolean, Text, Index, UniqueConstraint, JSON, event, select
 from sqlalchemy.orm import relationship
 from .base import Base
 import datetime
@@ -8,7 +8,18 @@ accountability_partners = Table(
     'accountability_partners',
     Base.metadata,
     Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
-    Column('partner_id', Integer, ForeignKey('users.id'), primary_key=True)
+    Column('partner_id', Integer, ForeignKey('users.id'), primary_key=True),
+    # The primary key covers lookups by user_id; this covers the reverse direction
+    Index('ix_accountability_partners_partner_id', 'partner_id')
+)
+
+# Association table between exercises and their muscle / equipment tags
+exercise_tags = Table(
+    'exercise_tags',
+    Base.metadata,
+    Column('exercise_id', Integer, ForeignKey('exercises.id'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    Index('ix_exercise_tags_tag_id', 'tag_id')
 )
 
 class User(Base):
@@ -52,33 +63,54 @@ class Exercise(Base):
     # Relationships
     template_exercises = relationship("WorkoutExercise", back_populates="exercise")
     workout_sets = relationship("WorkoutSet", back_populates="exercise")
+    tags = relationship("Tag", secondary=exercise_tags, back_populates="exercises")
 
     def __repr__(self):
         return f"<Exercise {self.title}>"
 
+class Tag(Base):
+    """Normalized muscle or equipment tag, e.g. ("muscle", "glutes")."""
+    __tablename__ = "tags"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # "muscle" or "equipment"
+    name = Column(String, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("kind", "name", name="uq_tags_kind_name"),
+    )
+
+    exercises = relationship("Exercise", secondary=exercise_tags, back_populates="tags")
+
 class WorkoutTemplate(Base):
     __tablename__ = "workout_templates"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     description = Column(Text)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     difficulty = Column(String, index=True)
     estimated_duration = Column(Integer)  # in minutes
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, onupdate=datetime.datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # bumped on every change
 
     # Relationships
     user = relationship("User", back_populates="workout_templates")
-    exercises = relationship("WorkoutExercise", back_populates="template", cascade="all, delete-orphan")
+    exercises = relationship(
+        "WorkoutExercise",
+        back_populates="template",
+        cascade="all, delete-orphan",
+        order_by="WorkoutExercise.order"
+    )
     sessions = relationship("WorkoutSession", back_populates="template", cascade="all, delete-orphan")
 
 class WorkoutExercise(Base):
     __tablename__ = "workout_template_exercises"
 
     id = Column(Integer, primary_key=True, index=True)
-    template_id = Column(Integer, ForeignKey("workout_templates.id"))
-    exercise_id = Column(Integer, ForeignKey("exercises.id"))
+    template_id = Column(Integer, ForeignKey("workout_templates.id"), index=True)
+    exercise_id = Column(Integer, ForeignKey("exercises.id"), index=True)
     sets = Column(Integer)
     reps = Column(Integer)
     weight = Column(Float)
@@ -95,17 +127,31 @@ class WorkoutSession(Base):
     __tablename__ = "workout_sessions"
 
     id = Column(Integer, primary_key=True, index=True)
-    template_id = Column(Integer, ForeignKey("workout_templates.id"))
+    template_id = Column(Integer, ForeignKey("workout_templates.id"), index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     start_time = Column(DateTime, default=datetime.datetime.utcnow)
     end_time = Column(DateTime)
     completed = Column(Boolean, default=False)
     notes = Column(Text)
 
+    __table_args__ = (
+        # History and stats: a user's sessions, optionally by completion, newest first.
+        # Also serves as the user_id foreign key index.
+        Index("ix_workout_sessions_user_completed_start", user_id, completed, start_time.desc()),
+    )
+
     # Relationships
     template = relationship("WorkoutTemplate", back_populates="sessions")
     user = relationship("User", back_populates="workout_sessions")
-    sets = relationship("WorkoutSet", back_populates="session", cascade="all, delete-orphan")
+    # Joined on the start time too, so loading a session's sets prunes set partitions
+    sets = relationship(
+        "WorkoutSet",
+        primaryjoin="and_(WorkoutSession.id == foreign(WorkoutSet.session_id), "
+                    "WorkoutSession.start_time == foreign(WorkoutSet.session_start_time))",
+        back_populates="session",
+        cascade="all, delete-orphan",
+        order_by="WorkoutSet.id"
+    )
 
 class WorkoutSet(Base):
     __tablename__ = "workout_sets"
@@ -120,7 +166,99 @@ class WorkoutSet(Base):
     distance = Column(Float)    # in meters
     completed = Column(Boolean, default=False)
     notes = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Copy of the session's start_time; the partition key when partitioned, so
+    # a set always lives in the month partition of its session
+    session_start_time = Column(DateTime)
+
+    __table_args__ = (
+        # Sets of a session in order; also serves as the session_id foreign key index
+        Index("ix_workout_sets_session_exercise_set", session_id, exercise_id, set_number),
+        # Sets of an exercise joined to their sessions (per-user history of an exercise)
+        Index("ix_workout_sets_exercise_session", exercise_id, session_id),
+    )
 
     # Relationships
-    session = relationship("WorkoutSession", back_populates="sets")
+    session = relationship(
+        "WorkoutSession",
+        primaryjoin="and_(WorkoutSession.id == foreign(WorkoutSet.session_id), "
+                    "WorkoutSession.start_time == foreign(WorkoutSet.session_start_time))",
+        back_populates="sets"
+    )
     exercise = relationship("Exercise", back_populates="workout_sets")
+
+@event.listens_for(WorkoutSet, "before_insert")
+def _copy_session_start_time(mapper, connection, target):
+    """Fill session_start_time of sets added by session_id alone."""
+    if target.session_start_time is None and target.session_id is not None:
+        target.session_start_time = connection.scalar(
+            select(WorkoutSession.start_time).where(WorkoutSession.id == target.session_id)
+        )
+
+class UserWeeklyStats(Base):
+    """
+    Per-user weekly aggregates for partner leaderboards, updated incrementally
+    when sessions complete and sets are logged. Weeks start on Monday.
+    """
+    __tablename__ = "user_weekly_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    week_start = Column(Date, primary_key=True)
+    sessions_completed = Column(Integer, nullable=False, default=0)
+    volume = Column(Float, nullable=False, default=0.0)  # sum of reps x weight of completed sets
+    streak = Column(Integer, nullable=False, default=0)  # consecutive weeks with a completed session
+
+class ActivityEvent(Base):
+    """
+    Something a user did that their partners see in their feed. session_id
+    has no foreign key because workout_sessions may be partitioned.
+    """
+    __tablename__ = "activity_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    actor_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)  # workout_started, workout_completed, ...
+    session_id = Column(Integer)
+    details = Column(JSON)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        # Pulling the latest events of actors whose events are not fanned out
+        Index("ix_activity_events_actor_id_id", actor_id, id.desc()),
+    )
+
+class FeedItem(Base):
+    """An activity event fanned out to the feed of one of the actor's partners."""
+    __tablename__ = "feed_items"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    event_id = Column(Integer, ForeignKey("activity_events.id", ondelete="CASCADE"), primary_key=True)
+
+    event = relationship("ActivityEvent")
+
+class PersonalRecord(Base):
+    """
+    A user's best performance of an exercise, one row per record kind,
+    updated as sets are written. Max reps records are kept per weight
+    (at_weight); the other kinds have at_weight 0. set_id and session_id
+    have no foreign key because workout_sets and workout_sessions may be
+    partitioned.
+    """
+    __tablename__ = "personal_records"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    exercise_id = Column(Integer, ForeignKey("exercises.id"), primary_key=True)
+    kind = Column(String, primary_key=True)  # max_weight, max_reps, estimated_1rm, max_duration, max_distance
+    at_weight = Column(Float, primary_key=True, default=0.0)
+    value = Column(Float, nullable=False)
+    previous_value = Column(Float)  # the record this one beat, if any
+    reps = Column(Integer)
+    weight = Column(Float)
+    set_id = Column(Integer)
+    session_id = Column(Integer)
+    achieved_at = Column(DateTime)
+
+    __table_args__ = (
+        # Records set in a session
+        Index("ix_personal_records_session_id", session_id),
+    )
@@ -0,0 +1,231 @@
+"""
+Optional monthly range partitioning for workout_sessions and workout_sets.
+
+When PARTITIONING_ENABLED is set (Postgres only), init_db creates both tables
+as partitioned parents with one partition per month and a default partition
+for rows outside the pre-created range. The maintenance command keeps future
+partitions ahead of the calendar, moving any rows of a new month out of the
+default partition, and archives old ones:
+
+    python -m app.partitioning maintain --months-ahead 3
+    python -m app.partitioning archive --older-than-months 12 --archive-dir /archive
+
+Archiving copies a partition to a gzipped CSV file, then detaches and drops
+it in the same transaction. A run interrupted part way leaves the partition
+attached, and the next run archives it again.
+"""
+import argparse
+import gzip
+import logging
+import os
+import re
+from datetime import date, datetime
+from pathlib import Path
+
+from sqlalchemy import text
+
+from .base import Base
+
+logger = logging.getLogger(__name__)
+
+PARTITIONING_ENABLED = os.getenv("PARTITIONING_ENABLED", "false").lower() in ("1", "true", "yes")
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "archive")
+
+# Partitioned table -> column it is range partitioned on. Sets carry their
+# session's start time, so both tables split on the same months and a set is
+# found in the partition of its session.
+PARTITION_KEYS = {
+    "workout_sessions": "start_time",
+    "workout_sets": "session_start_time",
+}
+
+def month_start(value: date) -> date:
+    """First day of the month containing value."""
+    return date(value.year, value.month, 1)
+
+def add_months(value: date, months: int) -> date:
+    """First day of the month `months` months after the month of value."""
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def partition_name(table_name: str, month: date) -> str:
+    return f"{table_name}_{month:%Y_%m}"
+
+def parse_partition_month(table_name: str, name: str):
+    """Return the month of a partition created by this module, or None."""
+    match = re.fullmatch(rf"{re.escape(table_name)}_(\d{{4}})_(\d{{2}})", name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+def is_supported(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+def partitioned_table_ddl(table, key: str, dialect) -> str:
+    """
+    CREATE TABLE statement for a range partitioned copy of a model table.
+    Postgres requires the partition key in the primary key, and foreign keys
+    pointing at another partitioned table are left to the application.
+    """
+    quote = dialect.identifier_preparer.quote
+    lines = []
+    for column in table.columns:
+        if column.name == "id":
+            lines.append("id SERIAL")
+            continue
+        not_null = " NOT NULL" if column.name == key or not column.nullable else ""
+        lines.append(f"{quote(column.name)} {column.type.compile(dialect=dialect)}{not_null}")
+    lines.append(f"PRIMARY KEY (id, {quote(key)})")
+    for foreign_key in table.foreign_keys:
+        target = foreign_key.column.table.name
+        if target in PARTITION_KEYS:
+            continue
+        lines.append(
+            f"FOREIGN KEY ({quote(foreign_key.parent.name)}) REFERENCES {target} ({quote(foreign_key.column.name)})"
+        )
+    columns = ",\n    ".join(lines)
+    return f"CREATE TABLE {table.name} (\n    {columns}\n) PARTITION BY RANGE ({quote(key)})"
+
+def create_partitioned_tables(bind):
+    """Create the partitioned parents, their default partitions and indexes."""
+    with bind.begin() as connection:
+        for table_name, key in PARTITION_KEYS.items():
+            table = Base.metadata.tables[table_name]
+            connection.execute(text(partitioned_table_ddl(table, key, connection.dialect)))
+            connection.execute(text(
+                f"CREATE TABLE {table_name}_default PARTITION OF {table_name} DEFAULT"
+            ))
+            # Indexes on the parent are created on every partition by Postgres
+            for index in table.indexes:
+                index.create(connection)
+    logger.info(f"Created partitioned tables: {', '.join(PARTITION_KEYS)}")
+
+def is_partitioned(connection, table_name: str) -> bool:
+    return connection.execute(text("""
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = :table_name
+    """), {"table_name": table_name}).first() is not None
+
+def list_partitions(connection, table_name: str):
+    """Names of the partitions currently attached to table_name."""
+    return connection.execute(text("""
+        SELECT child.relname FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = :table_name
+        ORDER BY child.relname
+    """), {"table_name": table_name}).scalars().all()
+
+def _create_partition(connection, table_name: str, key: str, month: date) -> str:
+    """
+    Create the partition of a month. Postgres refuses while the default
+    partition holds rows of that month, so those are moved into it: the
+    default is detached, the partition created, the rows moved and the
+    default attached again, all in the caller's transaction.
+    """
+    name = partition_name(table_name, month)
+    default = f"{table_name}_default"
+    bounds = {"start": month, "end": add_months(month, 1)}
+    in_month = f"{key} >= :start AND {key} < :end"
+    create = (
+        f"CREATE TABLE {name} PARTITION OF {table_name} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+    if connection.execute(text(f"SELECT 1 FROM {default} WHERE {in_month} LIMIT 1"), bounds).first() is None:
+        connection.execute(text(create))
+        return name
+
+    connection.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {default}"))
+    connection.execute(text(create))
+    moved = connection.execute(text(f"INSERT INTO {table_name} SELECT * FROM {default} WHERE {in_month}"), bounds).rowcount
+    connection.execute(text(f"DELETE FROM {default} WHERE {in_month}"), bounds)
+    connection.execute(text(f"ALTER TABLE {table_name} ATTACH PARTITION {default} DEFAULT"))
+    logger.info(f"Moved {moved} rows from {default} to {name}")
+    return name
+
+def ensure_partitions(bind, months_ahead: int = PARTITION_MONTHS_AHEAD, today: date = None):
+    """Create the monthly partitions from the current month up to months_ahead."""
+    first_month = month_start(today or datetime.utcnow().date())
+    created = []
+    with bind.begin() as connection:
+        for table_name, key in PARTITION_KEYS.items():
+            if not is_partitioned(connection, table_name):
+                logger.info(f"{table_name} is not partitioned, skipping")
+                continue
+            existing = set(list_partitions(connection, table_name))
+            for offset in range(months_ahead + 1):
+                month = add_months(first_month, offset)
+                if partition_name(table_name, month) in existing:
+                    continue
+                created.append(_create_partition(connection, table_name, key, month))
+    for name in created:
+        logger.info(f"Created partition {name}")
+    return created
+
+def _copy_to_file(connection, table_name: str, path: Path):
+    """Stream a table to a gzipped CSV file with COPY, inside the connection's transaction."""
+    with gzip.open(path, "wb") as f:
+        connection.connection.cursor().copy_expert(f"COPY {table_name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+
+def archive_partitions(bind, older_than_months: int, archive_dir: str = PARTITION_ARCHIVE_DIR, today: date = None):
+    """
+    Write every monthly partition that ended more than older_than_months ago
+    to archive_dir as <partition>.csv.gz, then detach and drop it.
+    """
+    cutoff = add_months(month_start(today or datetime.utcnow().date()), -older_than_months)
+    archive_path = Path(archive_dir)
+    archive_path.mkdir(parents=True, exist_ok=True)
+    archived = []
+
+    for table_name in PARTITION_KEYS:
+        with bind.connect() as connection:
+            if not is_partitioned(connection, table_name):
+                continue
+            partitions = list_partitions(connection, table_name)
+
+        for name in partitions:
+            month = parse_partition_month(table_name, name)
+            if month is None or add_months(month, 1) > cutoff:
+                continue
+
+            # One transaction: the partition is only detached and dropped once its
+            # archive file is complete, and stays attached if anything fails before
+            target = archive_path / f"{name}.csv.gz"
+            with bind.begin() as connection:
+                # Blocks writes to the partition, not reads, so the file has every row
+                connection.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+                _copy_to_file(connection, name, target)
+                connection.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {name}"))
+                connection.execute(text(f"DROP TABLE {name}"))
+
+            logger.info(f"Archived partition {name} to {target}")
+            archived.append(str(target))
+    return archived
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain workout_sessions / workout_sets partitions")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    maintain = subcommands.add_parser("maintain", help="pre-create upcoming monthly partitions")
+    maintain.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+
+    archive = subcommands.add_parser("archive", help="detach, archive and drop old partitions")
+    archive.add_argument("--older-than-months", type=int, required=True)
+    archive.add_argument("--archive-dir", default=PARTITION_ARCHIVE_DIR)
+
+    args = parser.parse_args(argv)
+
+    from .database import engine
+    if not is_supported(engine):
+        parser.error("Partitioning requires a PostgreSQL database")
+
+    if args.command == "maintain":
+        ensure_partitions(engine, months_ahead=args.months_ahead)
+    else:
+        archive_partitions(engine, args.older_than_months, args.archive_dir)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,218 @@
+"""
+Personal records.
+
+personal_records holds each user's best completed set per exercise and kind:
+- max_weight: heaviest weight
+- max_reps: most reps, per weight lifted
+- estimated_1rm: best one-rep max estimated with the Epley formula
+- max_duration, max_distance
+
+record_sets compares newly written sets with the current records and upserts
+only the ones they beat, so listing a user's records is a primary key range
+scan however long their history is. Beating an existing record is published
+to the partner feed.
+
+Records only ever rise this way: a record whose set is later edited down or
+reopened stays until rebuild, which recomputes the table from workout_sets.
+It backfills the table and runs nightly
+(kubernetes/personal-records-rebuild-cronjob.yml):
+
+    python -m app.records rebuild [--user-id 7]
+"""
+import argparse
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, true
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import feed, models
+
+logger = logging.getLogger(__name__)
+
+MAX_WEIGHT = "max_weight"
+MAX_REPS = "max_reps"
+ESTIMATED_1RM = "estimated_1rm"
+MAX_DURATION = "max_duration"
+MAX_DISTANCE = "max_distance"
+KINDS = (MAX_WEIGHT, MAX_REPS, ESTIMATED_1RM, MAX_DURATION, MAX_DISTANCE)
+
+# Sets read per round trip and records inserted per statement by rebuild
+REBUILD_CHUNK_SIZE = 1000
+
+RecordKey = Tuple[int, str, float]  # (exercise_id, kind, at_weight)
+
+def estimated_1rm(weight: float, reps: int) -> float:
+    """Epley formula, weight x (1 + reps / 30); a single rep is the weight itself."""
+    return weight if reps == 1 else round(weight * (1 + reps / 30), 2)
+
+def set_records(workout_set) -> List[Tuple[str, float, float]]:
+    """(kind, at_weight, value) of each record a set competes for."""
+    if not workout_set.completed:
+        return []
+    weight, reps = workout_set.weight, workout_set.reps
+    records = []
+    if weight:
+        records.append((MAX_WEIGHT, 0.0, weight))
+    if reps:
+        records.append((MAX_REPS, weight or 0.0, reps))
+    if weight and reps:
+        records.append((ESTIMATED_1RM, 0.0, estimated_1rm(weight, reps)))
+    if workout_set.duration:
+        records.append((MAX_DURATION, 0.0, workout_set.duration))
+    if workout_set.distance:
+        records.append((MAX_DISTANCE, 0.0, workout_set.distance))
+    return records
+
+def _offer(best: Dict, key: Tuple, workout_set, value: float) -> None:
+    """Keep the set as the best of key if it beats the one kept so far; ties keep the earlier set."""
+    current = best.get(key)
+    if current is None or value > current["value"]:
+        best[key] = {
+            "exercise_id": workout_set.exercise_id,
+            "kind": key[-2],
+            "at_weight": key[-1],
+            "value": value,
+            "previous_value": current["value"] if current else None,
+            "reps": workout_set.reps,
+            "weight": workout_set.weight,
+            "set_id": workout_set.id,
+            "session_id": workout_set.session_id,
+            "achieved_at": workout_set.created_at or datetime.utcnow(),
+        }
+
+def best_sets(sets: Iterable) -> Dict[RecordKey, Dict]:
+    """The best of the given sets for every record they compete for."""
+    best = {}
+    for workout_set in sets:
+        for kind, at_weight, value in set_records(workout_set):
+            _offer(best, (workout_set.exercise_id, kind, at_weight), workout_set, value)
+    return best
+
+def _upsert(db: Session):
+    """INSERT ... ON CONFLICT statement for personal_records on the session's database."""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(models.PersonalRecord)
+
+def record_sets(db: Session, session: models.WorkoutSession, sets: Iterable[models.WorkoutSet]) -> List[Dict]:
+    """
+    Update the records of the session's user with newly written sets and
+    return the records written. The caller commits.
+    """
+    sets = [workout_set for workout_set in sets if workout_set.completed]
+    if session.user_id is None or not sets:
+        return []
+    if any(workout_set.id is None for workout_set in sets):
+        db.flush()
+    candidates = best_sets(sets)
+    if not candidates:
+        return []
+
+    records = models.PersonalRecord
+    current = {
+        (exercise_id, kind, at_weight): value
+        for exercise_id, kind, at_weight, value in db.execute(
+            select(records.exercise_id, records.kind, records.at_weight, records.value).where(
+                records.user_id == session.user_id,
+                records.exercise_id.in_({exercise_id for exercise_id, _, _ in candidates})
+            )
+        )
+    }
+    # Inserted rows have no previous value; updated ones take it from the row replaced
+    new_records = [
+        {**candidate, "user_id": session.user_id, "previous_value": None}
+        for key, candidate in candidates.items()
+        if key not in current or candidate["value"] > current[key]
+    ]
+    if not new_records:
+        return []
+
+    table = records.__table__
+    statement = _upsert(db).values(new_records)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.exercise_id, table.c.kind, table.c.at_weight],
+        set_={
+            "value": statement.excluded.value,
+            "previous_value": table.c.value,
+            "reps": statement.excluded.reps,
+            "weight": statement.excluded.weight,
+            "set_id": statement.excluded.set_id,
+            "session_id": statement.excluded.session_id,
+            "achieved_at": statement.excluded.achieved_at,
+        },
+        # A concurrent write may have set a better record meanwhile
+        where=table.c.value < statement.excluded.value
+    )
+    # Only the rows actually inserted or updated are returned
+    written = sorted(
+        (dict(row) for row in db.execute(statement.returning(*table.c)).mappings()),
+        key=lambda record: (record["exercise_id"], record["kind"], record["at_weight"])
+    )
+
+    # A first record of an exercise is not news; beating one is
+    beaten = [record for record in written if record["previous_value"] is not None]
+    if beaten:
+        feed.publish(db, session.user_id, feed.PERSONAL_RECORD, session.id, {
+            "records": [
+                {name: record[name] for name in ("exercise_id", "kind", "at_weight", "value", "previous_value")}
+                for record in beaten
+            ]
+        })
+    return written
+
+def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    Recompute the records of one user, or of everyone, from all their
+    completed sets in a single pass. Commits; returns the records written.
+    """
+    records = models.PersonalRecord
+    sets = models.WorkoutSet
+    sessions = models.WorkoutSession
+
+    statement = delete(records)
+    query = (
+        select(
+            sessions.user_id, sets.id, sets.session_id, sets.exercise_id, sets.reps, sets.weight,
+            sets.duration, sets.distance, sets.completed, sets.created_at
+        )
+        .join(sessions, sessions.id == sets.session_id)
+        .where(sets.completed == true(), sessions.user_id.isnot(None))
+        .order_by(sets.created_at, sets.id)
+        .execution_options(yield_per=REBUILD_CHUNK_SIZE)
+    )
+    if user_id is not None:
+        statement = statement.where(records.user_id == user_id)
+        query = query.where(sessions.user_id == user_id)
+    db.execute(statement)
+
+    best = {}
+    for row in db.execute(query):
+        for kind, at_weight, value in set_records(row):
+            _offer(best, (row.user_id, row.exercise_id, kind, at_weight), row, value)
+
+    rows = [{**record, "user_id": key[0]} for key, record in best.items()]
+    for start in range(0, len(rows), REBUILD_CHUNK_SIZE):
+        db.execute(insert(records), rows[start:start + REBUILD_CHUNK_SIZE])
+    db.commit()
+    logger.info(f"Rebuilt {len(rows)} personal records" + (f" of user {user_id}" if user_id is not None else ""))
+    return len(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the personal_records table")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild_command = subcommands.add_parser("rebuild", help="recompute records from workout_sets")
+    rebuild_command.add_argument("--user-id", type=int, help="only rebuild this user's records")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        rebuild(db, args.user_id)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
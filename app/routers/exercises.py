@@ -1,47 +1,158 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Union
 from .. import models, schemas, database
+from ..catalog import ExerciseCatalog, get_catalog
+from ..catalog import catalog as exercise_catalog
+from ..compression import catalog_response
+from ..suggest import SUGGEST_MAX_LIMIT
+from ..tags import parse_tag_list
 from sqlalchemy import func
 
 router = APIRouter()
 
-@router.get("/", response_model=schemas.PaginatedWorkoutAssets)
+# Most exercises one batch request may fetch
+BATCH_MAX_IDS = 200
+
+def _parse_ids(ids: str) -> List[int]:
+    """Parse a comma separated list of ids, e.g. "1,2,3"."""
+    try:
+        return [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+
+# Exercise fields in response order; id is always returned
+EXERCISE_FIELDS = list(schemas.Exercise.model_fields)
+
+def _parse_fields(fields: Optional[str], view: str) -> Optional[List[str]]:
+    """Fields to return: those asked for, those of the summary view, or None for all."""
+    if fields:
+        names = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = sorted(names - set(EXERCISE_FIELDS))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown exercise fields: {unknown}")
+    elif view == "summary":
+        names = set(schemas.ExerciseSummary.model_fields)
+    else:
+        return None
+    return [name for name in EXERCISE_FIELDS if name == "id" or name in names]
+
+def _fetch_batch(db: Session, exercise_ids: List[int]):
+    """
+    Exercises by id in request order, each once, from the catalog when it is
+    loaded or else in one query.
+    """
+    exercise_ids = list(dict.fromkeys(exercise_ids))
+    if len(exercise_ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_IDS} ids can be fetched at once")
+    if exercise_catalog.loaded:
+        found = {exercise_id: exercise_catalog.get(exercise_id) for exercise_id in exercise_ids}
+    else:
+        found = {
+            exercise.id: exercise for exercise in
+            db.query(models.Exercise).filter(models.Exercise.id.in_(exercise_ids))
+        } if exercise_ids else {}
+    return {
+        "exercises": [found[exercise_id] for exercise_id in exercise_ids if found.get(exercise_id) is not None],
+        "missing": [exercise_id for exercise_id in exercise_ids if found.get(exercise_id) is None],
+    }
+
+def _similar_response(catalog: ExerciseCatalog, matches):
+    return [{**catalog.get(exercise_id), "score": score} for exercise_id, score in matches]
+
+def _filter_catalog(
+    catalog: ExerciseCatalog,
+    skip: int,
+    limit: int,
+    category: Optional[str],
+    difficulty: Optional[str],
+    search: Optional[str],
+    muscles: List[str],
+    equipment: List[str]
+):
+    """
+    Answer an exercise listing from the catalog's tag bitmaps. Values within
+    a facet are alternatives (glutes OR hamstrings), facets are combined with
+    AND. Facet counts are computed over the matching exercises.
+    """
+    index = catalog.tags
+    mask = index.all
+    if muscles:
+        mask &= index.match_any("muscles", muscles)
+    if equipment:
+        mask &= index.match_any("equipment", equipment)
+    if category:
+        mask &= index.match_any("category", [category])
+    if difficulty:
+        mask &= index.match_any("difficulty", [difficulty])
+
+    positions = index.positions(mask)
+    if search:
+        needle = search.lower()
+        positions = [
+            position for position in positions
+            if needle in (catalog.exercises[position]["title"] or "").lower()
+            or needle in (catalog.exercises[position]["description"] or "").lower()
+        ]
+        mask = sum(1 << position for position in positions)
+
+    return {
+        "exercises": [catalog.exercises[position] for position in positions[skip:skip + limit]],
+        "total": len(positions),
+        "facets": index.facet_counts(mask),
+    }
+
+# Full exercises by default; summaries with view=summary; only the requested fields with fields=
+@router.get("/", response_model=Union[
+    schemas.PaginatedWorkoutAssets, schemas.PaginatedExerciseSummaries, schemas.PaginatedExerciseFields
+])
 def get_exercises(
+    request: Request,
     skip: int = 0,
     limit: int = 10,
     category: str = None,
     difficulty: str = None,
     search: str = None,
-    db: Session = Depends(database.get_db)
+    muscles: str = Query(None, description="Comma separated muscle tags, e.g. glutes,hamstrings"),
+    equipment: str = Query(None, description="Comma separated equipment tags, e.g. dumbbell"),
+    fields: str = Query(None, description="Comma separated exercise fields to return, e.g. title,image_path"),
+    view: str = Query("full", pattern="^(full|summary)$"),
+    db: Session = Depends(database.get_read_db)
 ):
     """
     Get all exercises from the exercise library with filtering options.
+    Lists are served from the in-memory catalog and their bodies are
+    compressed once per catalog version. Filtering by muscles or equipment
+    also returns facet counts.
+    - fields: return only these fields of each exercise (and its id)
+    - view: summary returns id, title, category, difficulty and image_path,
+      leaving out the long text fields; fields takes precedence over view
     """
-    query = db.query(models.Exercise)
-    
-    if category:
-        query = query.filter(models.Exercise.category == category)
-    if difficulty:
-        query = query.filter(models.Exercise.difficulty == difficulty)
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (models.Exercise.title.ilike(search_term)) |
-            (models.Exercise.description.ilike(search_term))
-        )
-    
-    total = query.count()
-    exercises = query.offset(skip).limit(limit).all()
-    
-    return {
-        "exercises": exercises,
-        "total": total,
-    }
+    columns = _parse_fields(fields, view)
+    if fields:
+        page_model = schemas.PaginatedExerciseFields
+    elif columns:
+        page_model = schemas.PaginatedExerciseSummaries
+    else:
+        page_model = schemas.PaginatedWorkoutAssets
+
+    muscle_tags = parse_tag_list(muscles)
+    equipment_tags = parse_tag_list(equipment)
+    catalog = get_catalog(db)
+
+    def build():
+        page = _filter_catalog(catalog, skip, limit, category, difficulty, search, muscle_tags, equipment_tags)
+        if not (muscle_tags or equipment_tags):
+            del page["facets"]
+        if columns:
+            page["exercises"] = [{name: exercise[name] for name in columns} for exercise in page["exercises"]]
+        return page
+
+    return catalog_response(request, catalog.version, page_model, build)
 
 # Move the categories endpoint above the /{exercise_id} endpoint to prevent path conflict
 @router.get("/categories", response_model=List[schemas.CategoryCount])
-def get_categories(db: Session = Depends(database.get_db)):
+def get_categories(db: Session = Depends(database.get_read_db)):
     """
     Get all available exercise categories with counts.
     """
@@ -60,12 +171,85 @@ def get_categories(db: Session = Depends(database.get_db)):
         for category, count in categories
     ]
 
+@router.get("/suggest", response_model=List[schemas.ExerciseSuggestion])
+def suggest_exercises(
+    request: Request,
+    q: str = Query(..., description="Typed prefix of an exercise title or of one of its words"),
+    limit: int = Query(8, ge=1, le=SUGGEST_MAX_LIMIT),
+    catalog: ExerciseCatalog = Depends(get_catalog)
+):
+    """
+    Typeahead for exercise titles, answered from the catalog's prefix index.
+    Titles starting with q come first, then titles with a word starting with q;
+    ties go to the exercises used most in templates and sessions.
+    """
+    return catalog_response(
+        request, catalog.version, List[schemas.ExerciseSuggestion],
+        lambda: [catalog.exercises[position] for position in catalog.prefixes.search(q, limit)]
+    )
+
+@router.get("/similar", response_model=List[schemas.SimilarExercise])
+def get_similar_to_exercises(
+    request: Request,
+    ids: str = Query(..., description="Comma separated exercise ids, e.g. all exercises of a template"),
+    limit: int = Query(10, ge=1, le=50),
+    catalog: ExerciseCatalog = Depends(get_catalog)
+):
+    """
+    Get exercises similar to a group of exercises, such as a whole template.
+    The given exercises themselves are never returned.
+    """
+    exercise_ids = _parse_ids(ids)
+    missing = [exercise_id for exercise_id in exercise_ids if exercise_id not in catalog.similarity]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Exercises not found: {missing}")
+    return catalog_response(
+        request, catalog.version, List[schemas.SimilarExercise],
+        lambda: _similar_response(catalog, catalog.similarity.similar_to_many(exercise_ids, limit))
+    )
+
+@router.get("/batch", response_model=schemas.ExerciseBatch)
+def get_exercise_batch(
+    ids: str = Query(..., description="Comma separated exercise ids, e.g. 3,1,2"),
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Get several exercises in one request, in the order of ids. Ids that do
+    not exist are listed in missing instead of failing the request.
+    """
+    return _fetch_batch(db, _parse_ids(ids))
+
+@router.post("/batch", response_model=schemas.ExerciseBatch)
+def post_exercise_batch(batch: schemas.ExerciseBatchRequest, db: Session = Depends(database.get_read_db)):
+    """
+    Same as GET /exercises/batch, for lists of ids too long for a URL.
+    """
+    return _fetch_batch(db, batch.ids)
+
+@router.get("/{exercise_id}/similar", response_model=List[schemas.SimilarExercise])
+def get_similar_exercises(
+    request: Request,
+    exercise_id: int,
+    limit: int = Query(10, ge=1, le=25),
+    catalog: ExerciseCatalog = Depends(get_catalog)
+):
+    """
+    Get the exercises most similar to one exercise, from the precomputed
+    TF-IDF neighbour table. Served from memory without touching the database.
+    """
+    if exercise_id not in catalog.similarity:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+    return catalog_response(
+        request, catalog.version, List[schemas.SimilarExercise],
+        lambda: _similar_response(catalog, catalog.similarity.similar(exercise_id, limit))
+    )
+
 @router.get("/{exercise_id}", response_model=schemas.WorkoutAssetDetail)
-def get_exercise(exercise_id: int, db: Session = Depends(database.get_db)):
+def get_exercise(request: Request, exercise_id: int, catalog: ExerciseCatalog = Depends(get_catalog)):
     """
-    Get detailed information about a specific exercise.
+    Get detailed information about a specific exercise, from the catalog.
     """
-    exercise = db.query(models.Exercise).filter(models.Exercise.id == exercise_id).first()
-    if not exercise:
+    exercise = catalog.get(exercise_id)
+    if exercise is None:
         raise HTTPException(status_code=404, detail="Exercise not found")
-    return exercise
+    return catalog_response(request, catalog.version, schemas.WorkoutAssetDetail, lambda: exercise)
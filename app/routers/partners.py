@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, insert, or_
+from typing import List
+from datetime import date, datetime
+from .. import models, schemas, database, feed, leaderboards
+
+router = APIRouter()
+
+def _get_user_or_404(db: Session, user_id: int) -> models.User:
+    user = db.get(models.User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail=f"User {user_id} not found")
+    return user
+
+@router.get("/{user_id}", response_model=List[schemas.Partner])
+def get_partners(user_id: int, db: Session = Depends(database.get_read_db)):
+    """
+    Get a user's accountability partners.
+    """
+    user = _get_user_or_404(db, user_id)
+    return user.partners
+
+@router.post("/{user_id}/{partner_id}", response_model=List[schemas.Partner])
+def add_partner(user_id: int, partner_id: int, db: Session = Depends(database.get_db)):
+    """
+    Pair two users as accountability partners. Partnerships are mutual.
+    """
+    if user_id == partner_id:
+        raise HTTPException(status_code=400, detail="A user cannot partner with themselves")
+    user = _get_user_or_404(db, user_id)
+    _get_user_or_404(db, partner_id)
+
+    if partner_id not in leaderboards.partner_ids(db, user_id):
+        db.execute(insert(models.accountability_partners), [
+            {"user_id": user_id, "partner_id": partner_id},
+            {"user_id": partner_id, "partner_id": user_id},
+        ])
+        db.commit()
+        db.expire(user)
+    return user.partners
+
+@router.delete("/{user_id}/{partner_id}")
+def remove_partner(user_id: int, partner_id: int, db: Session = Depends(database.get_db)):
+    """
+    End a partnership for both users.
+    """
+    partners = models.accountability_partners
+    result = db.execute(delete(partners).where(or_(
+        and_(partners.c.user_id == user_id, partners.c.partner_id == partner_id),
+        and_(partners.c.user_id == partner_id, partners.c.partner_id == user_id),
+    )))
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Partnership not found")
+    db.commit()
+    return {"message": "Partnership removed successfully"}
+
+@router.get("/{user_id}/leaderboard", response_model=schemas.Leaderboard)
+def get_leaderboard(
+    user_id: int,
+    week: date = None,
+    metric: str = Query("sessions_completed", pattern=f"^({'|'.join(leaderboards.METRICS)})$"),
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Get the weekly leaderboard of a user and their partners.
+    - week: any day of the week to rank, defaults to the current week
+    - metric: sessions_completed, volume or streak
+    Reads only the precomputed weekly rows of the user and their partners.
+    """
+    _get_user_or_404(db, user_id)
+    week_start = leaderboards.week_start(week or datetime.utcnow())
+    return {
+        "week_start": week_start,
+        "metric": metric,
+        "entries": leaderboards.leaderboard(db, user_id, week_start, metric),
+    }
+
+@router.get("/{user_id}/feed", response_model=schemas.FeedPage)
+def get_feed(
+    user_id: int,
+    before: int = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Get the activity feed of a user's partners, newest first.
+    - before: next_before of the previous page
+    """
+    _get_user_or_404(db, user_id)
+    items = feed.read_feed(db, user_id, before, limit)
+    return {
+        "items": items,
+        "next_before": items[-1].id if len(items) == limit else None,
+    }
@@ -1,10 +1,241 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas, database
+from sqlalchemy.orm import Session, aliased, selectinload
+from sqlalchemy import Integer, and_, column, delete, func, insert, select, true, update, values
+from typing import Any, Dict, Iterable, List, Optional, Set
+from datetime import datetime
+from .. import models, schemas, database, cache
 
 router = APIRouter()
 
+# Upper bound on the number of templates accepted by a single import request
+IMPORT_MAX_TEMPLATES = 500
+
+def _validate_exercise_ids(db: Session, exercise_ids: Iterable[int]):
+    """Check that every referenced exercise exists, using a single query."""
+    requested = set(exercise_ids)
+    if not requested:
+        return
+    found = set(db.scalars(select(models.Exercise.id).where(models.Exercise.id.in_(requested))))
+    missing = sorted(requested - found)
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Exercises not found: {missing}")
+
+def _insert_templates(db: Session, templates: List[schemas.WorkoutTemplateCreate]) -> List[int]:
+    """
+    Insert templates and all of their exercises with one bulk INSERT per table.
+    Returns the new template ids in the order the templates were given.
+    """
+    template_ids = db.scalars(
+        insert(models.WorkoutTemplate).returning(models.WorkoutTemplate.id, sort_by_parameter_order=True),
+        [template.model_dump(exclude={"exercises"}) for template in templates]
+    ).all()
+
+    exercise_rows = [
+        {
+            **exercise.model_dump(),
+            "template_id": template_id,
+            "order": exercise.order if exercise.order is not None else position,
+        }
+        for template_id, template in zip(template_ids, templates)
+        for position, exercise in enumerate(template.exercises, start=1)
+    ]
+    if exercise_rows:
+        db.execute(insert(models.WorkoutExercise), exercise_rows)
+    return template_ids
+
+def _load_templates(db: Session, template_ids: List[int]) -> List[models.WorkoutTemplate]:
+    """Load templates with their exercises, preserving the order of template_ids."""
+    templates = (
+        db.query(models.WorkoutTemplate)
+        .options(selectinload(models.WorkoutTemplate.exercises).joinedload(models.WorkoutExercise.exercise))
+        .filter(models.WorkoutTemplate.id.in_(template_ids))
+        .all()
+    )
+    by_id = {template.id: template for template in templates}
+    return [by_id[template_id] for template_id in template_ids]
+
+def _last_performance_sets(db: Session, user_id: int, exercise_ids: Set[int]):
+    """
+    Query for the sets of each exercise in the user's latest session with it.
+    Postgres finds that session per exercise with a LATERAL ... LIMIT 1 over
+    ix_workout_sets_exercise_session; other databases compare each session
+    with a correlated max(start_time), and ties on start_time are left to the
+    caller.
+    """
+    sets = models.WorkoutSet
+    sessions = models.WorkoutSession
+    other_sets = aliased(models.WorkoutSet)
+    other_sessions = aliased(models.WorkoutSession)
+    if db.get_bind().dialect.name == "postgresql":
+        requested = values(column("exercise_id", Integer), name="requested").data(
+            [(exercise_id,) for exercise_id in sorted(exercise_ids)]
+        )
+        latest = (
+            select(other_sessions.id.label("session_id"), other_sessions.start_time.label("performed_at"))
+            .join(other_sets, other_sets.session_id == other_sessions.id)
+            .where(other_sessions.user_id == user_id, other_sets.exercise_id == requested.c.exercise_id)
+            .order_by(other_sessions.start_time.desc(), other_sessions.id.desc())
+            .limit(1)
+            .lateral("latest")
+        )
+        return (
+            select(*sets.__table__.c, latest.c.performed_at)
+            .select_from(requested)
+            .join(latest, true())
+            .join(sets, and_(sets.session_id == latest.c.session_id, sets.exercise_id == requested.c.exercise_id))
+        )
+
+    latest_start = (
+        select(func.max(other_sessions.start_time))
+        .join(other_sets, other_sets.session_id == other_sessions.id)
+        .where(other_sessions.user_id == user_id, other_sets.exercise_id == sets.exercise_id)
+        .scalar_subquery()
+    )
+    return (
+        select(*sets.__table__.c, sessions.start_time.label("performed_at"))
+        .join(sessions, sessions.id == sets.session_id)
+        .where(
+            sessions.user_id == user_id,
+            sets.exercise_id.in_(exercise_ids),
+            sessions.start_time == latest_start
+        )
+    )
+
+def _last_performances(db: Session, user_id: int, exercise_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Per exercise, the user's sets of it in the most recent session that included it, in one query."""
+    exercise_ids = set(exercise_ids)
+    if user_id is None or not exercise_ids:
+        return {}
+    query = _last_performance_sets(db, user_id, exercise_ids).subquery()
+    performances = {}
+    for row in db.execute(
+        select(query).order_by(query.c.exercise_id, query.c.session_id.desc(), query.c.set_number)
+    ).mappings():
+        performance = performances.setdefault(row["exercise_id"], {
+            "session_id": row["session_id"],
+            "performed_at": row["performed_at"],
+            "sets": [],
+        })
+        # Sessions started at the same time: the later one wins
+        if row["session_id"] == performance["session_id"]:
+            performance["sets"].append(row)
+    return performances
+
+def _diff_template_exercises(
+    existing: List[models.WorkoutExercise],
+    desired: List[Dict[str, Any]]
+):
+    """
+    Compare the desired exercise list with the stored rows.
+    Entries are matched to stored rows by id, or by order when no id is given.
+    Returns (inserts, updates, delete_ids) where updates only carry changed columns.
+    """
+    by_id = {row.id: row for row in existing}
+    by_order = {row.order: row for row in existing if row.order is not None}
+    claimed = {entry["id"] for entry in desired if entry.get("id") is not None}
+    matched = set()
+    inserts, updates = [], []
+
+    for position, entry in enumerate(desired, start=1):
+        entry = dict(entry)
+        row_id = entry.pop("id", None)
+        if row_id is not None:
+            row = by_id.get(row_id)
+            if row is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Exercise entry {row_id} does not belong to this template"
+                )
+        else:
+            if entry.get("order") is None:
+                entry["order"] = position
+            row = by_order.get(entry["order"])
+            if row is not None and (row.id in matched or row.id in claimed):
+                row = None
+
+        if row is None:
+            if entry.get("exercise_id") is None:
+                raise HTTPException(status_code=400, detail="exercise_id is required for new exercises")
+            inserts.append(entry)
+            continue
+
+        if row.id in matched:
+            raise HTTPException(status_code=400, detail=f"Exercise entry {row.id} is listed more than once")
+        matched.add(row.id)
+
+        changes = {key: value for key, value in entry.items() if getattr(row, key) != value}
+        if changes:
+            updates.append({"id": row.id, **changes})
+
+    delete_ids = [row.id for row in existing if row.id not in matched]
+    return inserts, updates, delete_ids
+
+def _apply_template_changes(
+    db: Session,
+    template: models.WorkoutTemplate,
+    fields: Dict[str, Any],
+    exercises: Optional[List[Dict[str, Any]]],
+    expected_version: Optional[int] = None
+):
+    """
+    Write only what differs from the stored template.
+    When expected_version is given the update is rejected with 409 if the
+    template was changed in the meantime (optimistic concurrency, no row locks).
+    """
+    if expected_version is not None and template.version != expected_version:
+        raise HTTPException(status_code=409, detail="Workout template was modified by another request")
+
+    changes = {key: value for key, value in fields.items() if getattr(template, key) != value}
+
+    inserts, updates, delete_ids = [], [], []
+    if exercises is not None:
+        inserts, updates, delete_ids = _diff_template_exercises(template.exercises, exercises)
+        _validate_exercise_ids(
+            db,
+            (entry["exercise_id"] for entry in inserts + updates if entry.get("exercise_id") is not None)
+        )
+
+    if not (changes or inserts or updates or delete_ids):
+        return
+
+    # Bumping the version doubles as the concurrency check for the whole template
+    version_check = models.WorkoutTemplate.version == template.version
+    result = db.execute(
+        update(models.WorkoutTemplate)
+        .where(models.WorkoutTemplate.id == template.id, version_check)
+        .values(version=models.WorkoutTemplate.version + 1, updated_at=datetime.utcnow(), **changes)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Workout template was modified by another request")
+
+    if delete_ids:
+        db.execute(
+            delete(models.WorkoutExercise)
+            .where(models.WorkoutExercise.id.in_(delete_ids))
+            .execution_options(synchronize_session=False)
+        )
+    if updates:
+        db.execute(update(models.WorkoutExercise), updates)
+    if inserts:
+        db.execute(insert(models.WorkoutExercise), [{**entry, "template_id": template.id} for entry in inserts])
+
+    db.commit()
+    db.expire_all()
+    cache.invalidate(f"template:{template.id}")
+
+def _get_template_or_404(db: Session, workout_id: int) -> models.WorkoutTemplate:
+    workout = (
+        db.query(models.WorkoutTemplate)
+        .options(selectinload(models.WorkoutTemplate.exercises))
+        .filter(models.WorkoutTemplate.id == workout_id)
+        .first()
+    )
+    if not workout:
+        raise HTTPException(status_code=404, detail="Workout template not found")
+    return workout
+
 @router.post("/", response_model=schemas.WorkoutTemplate)
 def create_workout_template(
     workout: schemas.WorkoutTemplateCreate,
@@ -13,26 +244,54 @@ def create_workout_template(
     """
     Create a new workout template using exercises from the exercise library.
     """
-    db_workout = models.WorkoutTemplate(**workout.dict())
-    db.add(db_workout)
+    _validate_exercise_ids(db, (exercise.exercise_id for exercise in workout.exercises))
+    template_ids = _insert_templates(db, [workout])
+    db.commit()
+    return _load_templates(db, template_ids)[0]
+
+@router.post("/import", response_model=List[schemas.WorkoutTemplate])
+def import_workout_templates(
+    workouts: List[schemas.WorkoutTemplateCreate],
+    db: Session = Depends(database.get_db)
+):
+    """
+    Create many workout templates at once, e.g. for coach or program imports.
+    Either all templates are created or none are.
+    """
+    if len(workouts) > IMPORT_MAX_TEMPLATES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot import more than {IMPORT_MAX_TEMPLATES} templates at once"
+        )
+    if not workouts:
+        return []
+
+    _validate_exercise_ids(
+        db, (exercise.exercise_id for workout in workouts for exercise in workout.exercises)
+    )
+    template_ids = _insert_templates(db, workouts)
     db.commit()
-    db.refresh(db_workout)
-    return db_workout
+    return _load_templates(db, template_ids)
 
 @router.get("/", response_model=List[schemas.WorkoutTemplate])
 def get_workout_templates(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(database.get_db)
+    user_id: int = None,
+    db: Session = Depends(database.get_read_db)
 ):
     """
-    Get all workout templates.
+    Get all workout templates, optionally only those of one user.
     """
-    workouts = db.query(models.WorkoutTemplate).offset(skip).limit(limit).all()
+    query = db.query(models.WorkoutTemplate)
+    if user_id is not None:
+        query = query.filter(models.WorkoutTemplate.user_id == user_id)
+    workouts = query.offset(skip).limit(limit).all()
     return workouts
 
 @router.get("/{workout_id}", response_model=schemas.WorkoutTemplate)
-def get_workout_template(workout_id: int, db: Session = Depends(database.get_db)):
+@cache.cached(schemas.WorkoutTemplate, tags=lambda params: [f"template:{params['workout_id']}"])
+def get_workout_template(workout_id: int, db: Session = Depends(database.get_read_db)):
     """
     Get a specific workout template.
     """
@@ -41,6 +300,35 @@ def get_workout_template(workout_id: int, db: Session = Depends(database.get_db)
         raise HTTPException(status_code=404, detail="Workout template not found")
     return workout
 
+@router.get("/{workout_id}/expanded", response_model=schemas.ExpandedWorkoutTemplate)
+def get_expanded_workout_template(
+    workout_id: int,
+    user_id: int = None,
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Get a workout template ready to train: its exercises in order with their
+    details, each with the sets of the last session that included it.
+    - user_id: whose sessions to look at, defaults to the template's owner
+    """
+    workout = (
+        db.query(models.WorkoutTemplate)
+        .options(selectinload(models.WorkoutTemplate.exercises).joinedload(models.WorkoutExercise.exercise))
+        .filter(models.WorkoutTemplate.id == workout_id)
+        .first()
+    )
+    if not workout:
+        raise HTTPException(status_code=404, detail="Workout template not found")
+    performances = _last_performances(
+        db,
+        user_id if user_id is not None else workout.user_id,
+        (exercise.exercise_id for exercise in workout.exercises)
+    )
+    expanded = schemas.WorkoutTemplate.model_validate(workout, from_attributes=True).model_dump()
+    for exercise in expanded["exercises"]:
+        exercise["last_performance"] = performances.get(exercise["exercise_id"])
+    return expanded
+
 @router.put("/{workout_id}", response_model=schemas.WorkoutTemplate)
 def update_workout_template(
     workout_id: int,
@@ -50,16 +338,36 @@ def update_workout_template(
     """
     Update a workout template.
     """
-    workout = db.query(models.WorkoutTemplate).filter(models.WorkoutTemplate.id == workout_id).first()
-    if not workout:
-        raise HTTPException(status_code=404, detail="Workout template not found")
-    
-    for key, value in workout_update.dict().items():
-        setattr(workout, key, value)
-    
-    db.commit()
-    db.refresh(workout)
-    return workout
+    workout = _get_template_or_404(db, workout_id)
+    _apply_template_changes(
+        db,
+        workout,
+        workout_update.model_dump(exclude={"exercises"}),
+        [exercise.model_dump() for exercise in workout_update.exercises]
+    )
+    return _load_templates(db, [workout_id])[0]
+
+@router.patch("/{workout_id}", response_model=schemas.WorkoutTemplate)
+def patch_workout_template(
+    workout_id: int,
+    workout_patch: schemas.WorkoutTemplatePatch,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Partially update a workout template.
+    - version: the version the client last read; a stale version returns 409
+    - exercises: when given, the full desired list. Entries with an id update
+      that row, entries without one are matched by order or added, and rows
+      left out are removed. Only changed rows are written.
+    """
+    workout = _get_template_or_404(db, workout_id)
+    patch = workout_patch.model_dump(exclude_unset=True, exclude={"version", "exercises"})
+    exercises = None
+    if workout_patch.exercises is not None:
+        exercises = [exercise.model_dump(exclude_unset=True) for exercise in workout_patch.exercises]
+
+    _apply_template_changes(db, workout, patch, exercises, expected_version=workout_patch.version)
+    return _load_templates(db, [workout_id])[0]
 
 @router.delete("/{workout_id}")
 def delete_workout_template(workout_id: int, db: Session = Depends(database.get_db)):
@@ -70,6 +378,9 @@ def delete_workout_template(workout_id: int, db: Session = Depends(database.get_
     if not workout:
         raise HTTPException(status_code=404, detail="Workout template not found")
     
+    user_id = workout.user_id
     db.delete(workout)
     db.commit()
+    # Deleting a template also deletes its sessions
+    cache.invalidate(f"template:{workout_id}", "sessions", f"user:{user_id}")
     return {"message": "Workout template deleted successfully"}
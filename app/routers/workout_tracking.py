@@ -1,18 +1,167 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, false, func, insert, literal, select, true
 from typing import List
 from datetime import datetime
-from .. import models, schemas, database
+import asyncio
+import csv
+import io
+import json
+import zlib
+from .. import models, schemas, database, cache, feed, leaderboards, live, records, write_behind
 
 router = APIRouter()
 
+# Rows fetched per round trip from the server-side cursor used by the export
+EXPORT_CHUNK_SIZE = 1000
+
+# Flattened session + set columns written by the export, in output order
+EXPORT_COLUMNS = [
+    models.WorkoutSession.id.label("session_id"),
+    models.WorkoutSession.template_id,
+    models.WorkoutSession.user_id,
+    models.WorkoutSession.start_time,
+    models.WorkoutSession.end_time,
+    models.WorkoutSession.completed.label("session_completed"),
+    models.WorkoutSession.notes.label("session_notes"),
+    models.WorkoutSet.id.label("set_id"),
+    models.WorkoutSet.exercise_id,
+    models.WorkoutSet.set_number,
+    models.WorkoutSet.reps,
+    models.WorkoutSet.weight,
+    models.WorkoutSet.duration,
+    models.WorkoutSet.distance,
+    models.WorkoutSet.completed.label("set_completed"),
+    models.WorkoutSet.notes.label("set_notes"),
+]
+
+def _session_filters(user_id=None, completed=None, start=None, end=None):
+    """
+    Filters shared by the session queries. A start/end range on start_time
+    also lets Postgres prune partitions when sessions are partitioned.
+    """
+    filters = []
+    if user_id is not None:
+        filters.append(models.WorkoutSession.user_id == user_id)
+    if completed is not None:
+        filters.append(models.WorkoutSession.completed == completed)
+    if start is not None:
+        filters.append(models.WorkoutSession.start_time >= start)
+    if end is not None:
+        filters.append(models.WorkoutSession.start_time < end)
+    return filters
+
+def _history_cache_tags(params):
+    """History entries are tagged by user, or as all-sessions when not filtered by user."""
+    user_id = params.get("user_id")
+    return ["sessions"] if user_id is None else [f"user:{user_id}"]
+
+def _invalidate_sessions(user_id):
+    cache.invalidate("sessions", f"user:{user_id}")
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _export_lines(rows, export_format):
+    """Render result rows as CSV or NDJSON text, one chunk per cursor batch"""
+    names = [column.key for column in EXPORT_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        writer.writerow(names)
+
+    for partition in rows.partitions():
+        for row in partition:
+            values = [_export_value(value) for value in row]
+            if export_format == "csv":
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(names, values))))
+                buffer.write("\n")
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _gzip_stream(chunks):
+    """Compress a stream of text chunks into a gzip stream on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _planned_set_numbers(db: Session, template_id: int):
+    """
+    Return a FROM clause joining the template's exercises to one row per planned
+    set, and the column holding the set number. Postgres uses generate_series;
+    other databases use an equivalent recursive CTE.
+    """
+    planned_sets = func.coalesce(models.WorkoutExercise.sets, 1)
+    if db.get_bind().dialect.name == "postgresql":
+        series = func.generate_series(1, planned_sets).table_valued("set_number")
+        return models.WorkoutExercise.__table__.join(series, true()), series.c.set_number
+
+    max_sets = (
+        select(func.max(planned_sets))
+        .where(models.WorkoutExercise.template_id == template_id)
+        .scalar_subquery()
+    )
+    numbers = select(literal(1).label("set_number")).cte("set_numbers", recursive=True)
+    numbers = numbers.union_all(
+        select(numbers.c.set_number + 1).where(numbers.c.set_number < max_sets)
+    )
+    from_clause = models.WorkoutExercise.__table__.join(numbers, numbers.c.set_number <= planned_sets)
+    return from_clause, numbers.c.set_number
+
+def _materialize_planned_sets(db: Session, session: models.WorkoutSession, template_id: int):
+    """Create the session's WorkoutSet rows from the template with one INSERT ... SELECT."""
+    from_clause, set_number = _planned_set_numbers(db, template_id)
+    planned = (
+        select(
+            literal(session.id),
+            models.WorkoutExercise.exercise_id,
+            set_number,
+            models.WorkoutExercise.reps,
+            models.WorkoutExercise.weight,
+            models.WorkoutExercise.duration,
+            models.WorkoutExercise.distance,
+            false(),
+            literal(session.start_time),
+            literal(session.start_time),
+        )
+        .select_from(from_clause)
+        .where(models.WorkoutExercise.template_id == template_id)
+        .order_by(models.WorkoutExercise.order, models.WorkoutExercise.id, set_number)
+    )
+    db.execute(
+        insert(models.WorkoutSet).from_select(
+            [
+                "session_id", "exercise_id", "set_number", "reps", "weight",
+                "duration", "distance", "completed", "created_at", "session_start_time"
+            ],
+            planned
+        )
+    )
+
 @router.post("/start/{workout_id}", response_model=schemas.WorkoutSession)
 def start_workout(
     workout_id: int,
+    prefill: bool = False,
     db: Session = Depends(database.get_db)
 ):
     """
     Start tracking a workout session based on a workout template.
+    - prefill: create the planned sets (sets x reps/weight/duration/distance of
+      every template exercise, in template order) as part of the session
     """
     template = db.query(models.WorkoutTemplate).filter(models.WorkoutTemplate.id == workout_id).first()
     if not template:
@@ -27,8 +176,16 @@ def start_workout(
     )
     
     db.add(workout_session)
+    db.flush()
+    if prefill:
+        _materialize_planned_sets(db, workout_session, template.id)
+    feed.publish(
+        db, workout_session.user_id, feed.WORKOUT_STARTED, workout_session.id,
+        {"template_id": template.id, "title": template.title}
+    )
     db.commit()
     db.refresh(workout_session)
+    _invalidate_sessions(workout_session.user_id)
     return workout_session
 
 @router.post("/{session_id}/complete", response_model=schemas.WorkoutSession)
@@ -43,40 +200,268 @@ def complete_workout(
     if not session:
         raise HTTPException(status_code=404, detail="Workout session not found")
     
+    if not session.completed:
+        leaderboards.record_session_completed(db, session)
+        feed.publish(db, session.user_id, feed.WORKOUT_COMPLETED, session.id)
     session.completed = True
     session.end_time = datetime.utcnow()
     
     db.commit()
     db.refresh(session)
+    _invalidate_sessions(session.user_id)
     return session
 
+def log_sets(db: Session, session: models.WorkoutSession, sets: List[schemas.WorkoutSetCreate]):
+    """Insert sets performed in a session and update the weekly aggregates and personal records, in one transaction."""
+    workout_sets = [
+        models.WorkoutSet(
+            session_id=session.id,
+            session_start_time=session.start_time,
+            created_at=datetime.utcnow(),
+            **workout_set.model_dump()
+        )
+        for workout_set in sets
+    ]
+    db.add_all(workout_sets)
+    leaderboards.record_sets_logged(db, session, workout_sets)
+    records.record_sets(db, session, workout_sets)
+    db.commit()
+    return workout_sets
+
+@router.post("/{session_id}/sets", response_model=List[schemas.WorkoutSet])
+def log_workout_sets(
+    session_id: int,
+    sets: List[schemas.WorkoutSetCreate],
+    db: Session = Depends(database.get_db)
+):
+    """
+    Log performed sets for a tracked workout session.
+    With SET_WRITE_BEHIND the sets are written in a batch with those of
+    concurrent requests, and the response waits until that batch is committed.
+    """
+    session = db.query(models.WorkoutSession).filter(models.WorkoutSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Workout session not found")
+
+    exercise_ids = {workout_set.exercise_id for workout_set in sets}
+    found = set(db.execute(
+        select(models.Exercise.id).where(models.Exercise.id.in_(exercise_ids))
+    ).scalars())
+    if exercise_ids - found:
+        raise HTTPException(status_code=400, detail=f"Exercises not found: {sorted(exercise_ids - found)}")
+
+    if write_behind.SET_WRITE_BEHIND:
+        user_id = session.user_id
+        rows = [
+            {"session_id": session_id, "created_at": datetime.utcnow(), **workout_set.model_dump()}
+            for workout_set in sets
+        ]
+        # Release the connection while the batch is written, and keep this
+        # client's reads on the primary as for any other write
+        db.info["wrote"] = True
+        db.commit()
+        try:
+            future = write_behind.set_buffer.submit(session_id, rows)
+        except write_behind.BufferFull:
+            raise HTTPException(status_code=503, detail="Too many sets pending, retry later", headers={"Retry-After": "1"})
+        workout_sets = future.result()
+        _invalidate_sessions(user_id)
+        return workout_sets
+
+    workout_sets = log_sets(db, session, sets)
+    for workout_set in workout_sets:
+        db.refresh(workout_set)
+    _invalidate_sessions(session.user_id)
+    return workout_sets
+
+async def _send_live_messages(websocket: WebSocket, subscription: live.Subscription):
+    """Forward broker messages to one subscriber, dropping it once it falls too far behind."""
+    while True:
+        message = await subscription.queue.get()
+        if subscription.overflowed:
+            await websocket.close(code=1013, reason="Subscriber too slow, reconnect to resync")
+            return
+        await websocket.send_json(message)
+
+@router.websocket("/{session_id}/live")
+async def live_workout_session(
+    websocket: WebSocket,
+    session_id: int,
+    session_factory: sessionmaker = Depends(database.get_session_factory)
+):
+    """
+    Live channel of a workout session. Clients send set updates as JSON, e.g.
+    {"exercise_id": 1, "set_number": 2, "reps": 8, "completed": true}, and
+    receive every update of the session as {"type": "set", "set": {...}}.
+    Updates are written to the session's sets in batches, each reported with
+    {"type": "flushed", "sets": <count>}.
+    """
+    def session_exists() -> bool:
+        # A short-lived session, so no pooled connection is held for the socket's lifetime
+        db = session_factory()
+        try:
+            return db.query(models.WorkoutSession.id).filter(models.WorkoutSession.id == session_id).first() is not None
+        finally:
+            db.close()
+
+    if not await run_in_threadpool(session_exists):
+        await websocket.close(code=1008, reason="Workout session not found")
+        return
+    await websocket.accept()
+
+    broker = live.get_broker()
+    channel = live.channels.join(session_id, session_factory)
+    subscription = broker.subscribe(session_id)
+    sender = asyncio.create_task(_send_live_messages(websocket, subscription))
+    try:
+        while True:
+            receive = asyncio.ensure_future(websocket.receive_json())
+            await asyncio.wait({receive, sender}, return_when=asyncio.FIRST_COMPLETED)
+            if not receive.done():
+                # The sender dropped this subscriber
+                receive.cancel()
+                break
+            try:
+                update = schemas.LiveSetUpdate.model_validate(receive.result())
+            except (ValidationError, ValueError) as e:
+                subscription.offer({"type": "error", "detail": str(e)})
+                continue
+            fields = update.model_dump(exclude_unset=True, exclude={"exercise_id", "set_number"})
+            await broker.publish(session_id, {"type": "set", "set": update.model_dump(exclude_unset=True)})
+            await channel.add((update.exercise_id, update.set_number), fields)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        broker.unsubscribe(subscription)
+        await live.channels.leave(channel)
+
 @router.get("/history", response_model=List[schemas.WorkoutSession])
+@cache.cached(List[schemas.WorkoutSession], tags=_history_cache_tags)
 def get_workout_history(
     skip: int = 0,
     limit: int = 100,
     completed: bool = None,
-    db: Session = Depends(database.get_db)
+    user_id: int = None,
+    start: datetime = None,
+    end: datetime = None,
+    db: Session = Depends(database.get_read_db)
 ):
     """
     Get workout tracking history with filtering options.
+    - start/end: only sessions started in [start, end)
     """
-    query = db.query(models.WorkoutSession)
-    if completed is not None:
-        query = query.filter(models.WorkoutSession.completed == completed)
-    
+    query = db.query(models.WorkoutSession).filter(*_session_filters(user_id, completed, start, end))
     sessions = query.order_by(models.WorkoutSession.start_time.desc()).offset(skip).limit(limit).all()
     return sessions
 
+@router.get("/export")
+def export_workout_history(
+    export_format: str = Query("ndjson", alias="format", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    user_id: int = None,
+    start: datetime = None,
+    end: datetime = None,
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Export workout sessions joined with their sets as CSV or NDJSON.
+    - format: csv or ndjson, one line per set (sessions without sets get one line)
+    - gzip: compress the download on the fly
+    - user_id: only export sessions of this user
+    - start/end: only sessions started in [start, end)
+    """
+    # Sets carry their session's start time, so the session range also prunes set partitions
+    set_join = and_(
+        models.WorkoutSet.session_id == models.WorkoutSession.id,
+        models.WorkoutSet.session_start_time == models.WorkoutSession.start_time
+    )
+    if start is not None:
+        set_join = set_join & (models.WorkoutSet.session_start_time >= start)
+    if end is not None:
+        set_join = set_join & (models.WorkoutSet.session_start_time < end)
+
+    query = (
+        select(*EXPORT_COLUMNS)
+        .outerjoin(models.WorkoutSet, set_join)
+        .where(*_session_filters(user_id, start=start, end=end))
+        .order_by(
+            models.WorkoutSession.start_time,
+            models.WorkoutSession.id,
+            models.WorkoutSet.set_number,
+            models.WorkoutSet.id
+        )
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+
+    # The dependency session stays open until the response has been sent,
+    # so rows are pulled from the cursor while the body is being streamed
+    rows = db.execute(query)
+    content = _export_lines(rows, export_format)
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    filename = f"workout-history.{export_format}"
+
+    if gzip:
+        content = _gzip_stream(content)
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.get("/stats")
-def get_workout_stats(db: Session = Depends(database.get_db)):
+def get_workout_stats(
+    user_id: int = None,
+    start: datetime = None,
+    end: datetime = None,
+    db: Session = Depends(database.get_read_db)
+):
     """
     Get workout tracking statistics.
+    - start/end: only count sessions started in [start, end)
     """
-    total_sessions = db.query(models.WorkoutSession).count()
-    completed_sessions = db.query(models.WorkoutSession).filter(models.WorkoutSession.completed == True).count()
+    query = db.query(models.WorkoutSession).filter(*_session_filters(user_id, start=start, end=end))
+
+    total_sessions = query.count()
+    completed_sessions = query.filter(models.WorkoutSession.completed == True).count()
     
     return {
         "total_sessions": total_sessions,
         "completed_sessions": completed_sessions,
         "completion_rate": completed_sessions / total_sessions if total_sessions > 0 else 0
     }
+
+@router.get("/records", response_model=List[schemas.PersonalRecord])
+def get_personal_records(
+    user_id: int,
+    exercise_id: int = None,
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Get a user's personal records, optionally of one exercise. Read from the
+    incrementally maintained personal_records table by primary key.
+    """
+    query = db.query(models.PersonalRecord).filter(models.PersonalRecord.user_id == user_id)
+    if exercise_id is not None:
+        query = query.filter(models.PersonalRecord.exercise_id == exercise_id)
+    return query.order_by(
+        models.PersonalRecord.exercise_id, models.PersonalRecord.kind, models.PersonalRecord.at_weight
+    ).all()
+
+@router.get("/{session_id}/records", response_model=List[schemas.PersonalRecord])
+def get_session_personal_records(session_id: int, db: Session = Depends(database.get_read_db)):
+    """
+    Get the personal records set in a workout session that still stand,
+    e.g. to celebrate them once the session is logged.
+    """
+    if not db.query(models.WorkoutSession.id).filter(models.WorkoutSession.id == session_id).first():
+        raise HTTPException(status_code=404, detail="Workout session not found")
+    return (
+        db.query(models.PersonalRecord)
+        .filter(models.PersonalRecord.session_id == session_id)
+        .order_by(models.PersonalRecord.exercise_id, models.PersonalRecord.kind, models.PersonalRecord.at_weight)
+        .all()
+    )
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
-from datetime import datetime
+from typing import Any, Dict, Optional, List
+from datetime import date, datetime
 
 # Exercise Library Schemas
 class ExerciseBase(BaseModel):
@@ -28,14 +28,49 @@ class Exercise(ExerciseBase):
 class WorkoutAssetDetail(Exercise):
     pass
 
+class SimilarExercise(Exercise):
+    score: float  # cosine similarity, 0..1
+
+class ExerciseBatchRequest(BaseModel):
+    ids: List[int] = Field(..., max_length=200)
+
+class ExerciseBatch(BaseModel):
+    exercises: List[WorkoutAssetDetail]  # in the order requested
+    missing: List[int]  # requested ids that do not exist
+
+class ExerciseSuggestion(BaseModel):
+    id: int
+    title: str
+    category: Optional[str] = None
+    image_path: Optional[str] = None
+
 class PaginatedWorkoutAssets(BaseModel):
     exercises: List[Exercise]
     total: int
+    facets: Optional[Dict[str, Dict[str, int]]] = None  # facet -> value -> count, with tag filters
 
     class Config:
         orm_mode = True
         from_attributes = True
 
+class ExerciseSummary(BaseModel):
+    """What exercise list screens show, without the long text fields."""
+    id: int
+    title: str
+    category: Optional[str] = None
+    difficulty: Optional[str] = None
+    image_path: Optional[str] = None
+
+class PaginatedExerciseSummaries(BaseModel):
+    exercises: List[ExerciseSummary]
+    total: int
+    facets: Optional[Dict[str, Dict[str, int]]] = None
+
+class PaginatedExerciseFields(BaseModel):
+    exercises: List[Dict[str, Any]]  # only the requested fields, plus id
+    total: int
+    facets: Optional[Dict[str, Dict[str, int]]] = None
+
 # Workout Template Schemas
 class WorkoutExerciseBase(BaseModel):
     exercise_id: int
@@ -45,6 +80,7 @@ class WorkoutExerciseBase(BaseModel):
     duration: Optional[int] = None  # in seconds
     distance: Optional[float] = None  # in meters
     notes: Optional[str] = None
+    order: Optional[int] = None  # position in the workout, defaults to list position
 
 class WorkoutExerciseCreate(WorkoutExerciseBase):
     pass
@@ -59,15 +95,35 @@ class WorkoutExercise(WorkoutExerciseBase):
 class WorkoutTemplateBase(BaseModel):
     title: str
     description: Optional[str] = None
-    user_id: str
+    user_id: int
     difficulty: Optional[str] = None
     estimated_duration: Optional[int] = None  # in minutes
 
 class WorkoutTemplateCreate(WorkoutTemplateBase):
     exercises: List[WorkoutExerciseCreate]
 
+class WorkoutExercisePatch(BaseModel):
+    id: Optional[int] = None  # existing entry to keep or update; omit to match by order or add
+    exercise_id: Optional[int] = None
+    sets: Optional[int] = None
+    reps: Optional[int] = None
+    weight: Optional[float] = None
+    duration: Optional[int] = None  # in seconds
+    distance: Optional[float] = None  # in meters
+    notes: Optional[str] = None
+    order: Optional[int] = None
+
+class WorkoutTemplatePatch(BaseModel):
+    version: int  # version the client last read, used for optimistic concurrency
+    title: Optional[str] = None
+    description: Optional[str] = None
+    difficulty: Optional[str] = None
+    estimated_duration: Optional[int] = None  # in minutes
+    exercises: Optional[List[WorkoutExercisePatch]] = None
+
 class WorkoutTemplate(WorkoutTemplateBase):
     id: int
+    version: int = 1
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = None
     exercises: List[WorkoutExercise]
@@ -86,7 +142,7 @@ class WorkoutSetBase(BaseModel):
     notes: Optional[str] = None
 
 class WorkoutSetCreate(WorkoutSetBase):
-    pass
+    completed: bool = False
 
 class WorkoutSet(WorkoutSetBase):
     id: int
@@ -95,9 +151,47 @@ class WorkoutSet(WorkoutSetBase):
     class Config:
         orm_mode = True
 
+class LastPerformance(BaseModel):
+    """The sets of an exercise in the most recent session that included it."""
+    session_id: int
+    performed_at: Optional[datetime] = None
+    sets: List[WorkoutSet]
+
+class PersonalRecord(BaseModel):
+    exercise_id: int
+    kind: str  # max_weight, max_reps, estimated_1rm, max_duration, max_distance
+    at_weight: float = 0.0  # the weight of max_reps records
+    value: float
+    previous_value: Optional[float] = None  # the record this one beat, if any
+    reps: Optional[int] = None
+    weight: Optional[float] = None
+    set_id: Optional[int] = None
+    session_id: Optional[int] = None
+    achieved_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ExpandedWorkoutExercise(WorkoutExercise):
+    last_performance: Optional[LastPerformance] = None
+
+class ExpandedWorkoutTemplate(WorkoutTemplate):
+    exercises: List[ExpandedWorkoutExercise]
+
+class LiveSetUpdate(BaseModel):
+    """A set change sent over a live session WebSocket; unset fields are left as they are."""
+    exercise_id: int
+    set_number: int
+    reps: Optional[int] = None
+    weight: Optional[float] = None
+    duration: Optional[int] = None  # in seconds
+    distance: Optional[float] = None  # in meters
+    completed: Optional[bool] = None
+    notes: Optional[str] = None
+
 class WorkoutSessionBase(BaseModel):
     template_id: int
-    user_id: str
+    user_id: int
     start_time: datetime = Field(default_factory=datetime.utcnow)
     notes: Optional[str] = None
 
@@ -113,6 +207,42 @@ class WorkoutSession(WorkoutSessionBase):
     class Config:
         orm_mode = True
 
+# Partner Schemas
+class Partner(BaseModel):
+    id: int
+    username: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    username: Optional[str] = None
+    sessions_completed: int
+    volume: float
+    streak: int
+
+class Leaderboard(BaseModel):
+    week_start: date
+    metric: str
+    entries: List[LeaderboardEntry]
+
+class FeedEvent(BaseModel):
+    id: int
+    actor_id: int
+    kind: str
+    session_id: Optional[int] = None
+    details: Optional[Dict] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class FeedPage(BaseModel):
+    items: List[FeedEvent]
+    next_before: Optional[int] = None  # pass as before= to get the next page
+
 # Utility Schemas
 class CategoryCount(BaseModel):
     category: str
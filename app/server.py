@@ -0,0 +1,113 @@
+"""
+Prefork multi-worker serving with gunicorn and uvicorn workers.
+
+gunicorn.conf.py preloads the app in the master, which then prepares the
+database, builds the exercise catalog with its indexes and renders the
+OpenAPI schema once. Workers are forked afterwards and share that memory
+copy-on-write; their startup event finds the work already done.
+
+    gunicorn app.main:app
+
+Worker count comes from WEB_CONCURRENCY, otherwise from the container's CPU
+quota times WORKERS_PER_CPU.
+
+Some backends keep their state in each worker's memory:
+- the response cache with CACHE_BACKEND=memory: an invalidation would only
+  clear the worker handling the write
+- the in-process live broker: subscribers of a session would only see the
+  updates sent through their own worker
+While either is configured the automatic worker count is 1, and the master
+refuses to start with more workers (WEB_CONCURRENCY or gunicorn -w). Use
+CACHE_BACKEND=redis (or none) and a shared broker (live.set_broker) to run
+several workers.
+
+Rate and concurrency limits and the write-behind buffer stay per worker even
+then: each worker enforces the limits on its share of the traffic, so the
+master logs that a pod's limits are the configured ones times the worker count.
+"""
+import gc
+import logging
+import math
+import os
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+WORKERS_PER_CPU = float(os.getenv("WORKERS_PER_CPU", "2"))
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "8"))
+
+def cgroup_cpu_quota(root: Path = Path("/sys/fs/cgroup")) -> Optional[float]:
+    """CPUs allowed by the cgroup (v2 cpu.max or v1 cfs quota), None when unlimited."""
+    try:
+        cpu_max = root / "cpu.max"
+        if cpu_max.exists():
+            quota, period = cpu_max.read_text().split()[:2]
+            if quota == "max":
+                return None
+            return int(quota) / int(period)
+        quota_file = root / "cpu" / "cpu.cfs_quota_us"
+        if quota_file.exists():
+            quota = int(quota_file.read_text())
+            period = int((root / "cpu" / "cpu.cfs_period_us").read_text())
+            return quota / period if quota > 0 else None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read the cgroup CPU quota: {str(e)}")
+    return None
+
+def available_cpus() -> float:
+    quota = cgroup_cpu_quota()
+    cpus = os.cpu_count() or 1
+    return min(quota, cpus) if quota else cpus
+
+def per_process_backends() -> List[str]:
+    """Configured backends whose state the workers would need to share."""
+    from . import cache, live
+
+    backends = []
+    if cache.CACHE_BACKEND == "memory":
+        backends.append("CACHE_BACKEND=memory")
+    if isinstance(live.get_broker(), live.InProcessBroker):
+        backends.append("the in-process live broker")
+    return backends
+
+def worker_count() -> int:
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.environ["WEB_CONCURRENCY"]))
+    if per_process_backends():
+        return 1
+    return max(1, min(MAX_WORKERS, math.ceil(available_cpus() * WORKERS_PER_CPU)))
+
+def check_workers(workers: int):
+    """Refuse to run several workers on per-process backends."""
+    if workers <= 1:
+        return
+    backends = per_process_backends()
+    if backends:
+        raise RuntimeError(
+            f"{workers} workers configured, but {' and '.join(backends)} cannot be shared between workers; "
+            "configure shared backends or run one worker"
+        )
+    logger.warning(f"Rate and concurrency limits are enforced per worker: {workers} times the configured ones per pod")
+
+def prepare_master():
+    """Heavy, shared initialization in the master, before any worker is forked."""
+    from . import main
+    from .database import engine
+
+    main.initialize()
+    main.app.openapi()
+
+    # Workers must not reuse the master's database connections
+    engine.dispose()
+
+    # Keep everything allocated so far out of the collector, so collections in
+    # the workers do not touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Master prepared; gc froze {gc.get_freeze_count()} objects")
+
+def after_fork():
+    """Per-worker reset of state that must not be shared across processes."""
+    from .database import engine
+    engine.dispose(close=False)
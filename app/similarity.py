@@ -0,0 +1,138 @@
+"""
+TF-IDF similarity between exercises.
+
+Every exercise becomes an L2-normalized TF-IDF vector built from its title,
+muscles worked, description and category. The vectors are stacked into one
+NumPy matrix, so cosine similarity is a matrix product. The top-k neighbours
+of every exercise are precomputed when the index is built, so looking up one
+exercise is a table read.
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+# How much each field contributes to an exercise's term counts
+FIELD_WEIGHTS = {
+    "title": 3,
+    "muscles_worked": 2,
+    "category": 1,
+    "description": 1,
+}
+
+# Neighbours precomputed per exercise
+SIMILAR_TOP_K = 25
+
+# Rows of the similarity matrix computed at once while precomputing neighbours
+BLOCK_SIZE = 256
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into", "is",
+    "it", "its", "of", "on", "or", "that", "the", "this", "to", "while", "with", "your",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens without stop words."""
+    if not text:
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+def exercise_terms(exercise: Dict) -> Counter:
+    """Weighted term counts of an exercise."""
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(exercise.get(field) or ""):
+            terms[token] += weight
+    return terms
+
+class SimilarityIndex:
+    """Exercise vectors plus the precomputed top-k neighbour table."""
+
+    def __init__(self, ids: Sequence[int], vectors: np.ndarray, neighbours: np.ndarray, scores: np.ndarray):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.positions = {int(exercise_id): position for position, exercise_id in enumerate(ids)}
+        self.vectors = vectors
+        self.neighbours = neighbours
+        self.scores = scores
+
+    @classmethod
+    def build(cls, exercises: Sequence[Dict], top_k: int = SIMILAR_TOP_K) -> "SimilarityIndex":
+        ids = [exercise["id"] for exercise in exercises]
+        documents = [exercise_terms(exercise) for exercise in exercises]
+
+        vocabulary: Dict[str, int] = {}
+        for terms in documents:
+            for token in terms:
+                vocabulary.setdefault(token, len(vocabulary))
+
+        counts = np.zeros((len(documents), max(len(vocabulary), 1)), dtype=np.float32)
+        for row, terms in enumerate(documents):
+            for token, count in terms.items():
+                counts[row, vocabulary[token]] = count
+
+        # Sublinear term frequency and smoothed inverse document frequency
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+        vectors = np.where(counts > 0, 1 + np.log(np.maximum(counts, 1)), 0) * idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+        neighbours, scores = cls._top_k(vectors, min(top_k, max(len(ids) - 1, 0)))
+        return cls(ids, vectors, neighbours, scores)
+
+    @staticmethod
+    def _top_k(vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions and scores of each row's k most similar other rows, best first."""
+        count = vectors.shape[0]
+        neighbours = np.zeros((count, k), dtype=np.int32)
+        scores = np.zeros((count, k), dtype=np.float32)
+        if k == 0:
+            return neighbours, scores
+
+        for start in range(0, count, BLOCK_SIZE):
+            block = vectors[start:start + BLOCK_SIZE] @ vectors.T
+            rows = np.arange(block.shape[0])
+            block[rows, rows + start] = -np.inf  # never recommend an exercise for itself
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            neighbours[start:start + block.shape[0]] = np.take_along_axis(top, order, axis=1)
+            scores[start:start + block.shape[0]] = np.take_along_axis(top_scores, order, axis=1)
+        return neighbours, scores
+
+    def __contains__(self, exercise_id: int) -> bool:
+        return exercise_id in self.positions
+
+    def similar(self, exercise_id: int, limit: int) -> List[Tuple[int, float]]:
+        """Most similar exercises to one exercise, read from the precomputed table."""
+        position = self.positions[exercise_id]
+        limit = min(limit, self.neighbours.shape[1])
+        return [
+            (int(self.ids[neighbour]), float(score))
+            for neighbour, score in zip(self.neighbours[position, :limit], self.scores[position, :limit])
+        ]
+
+    def similar_to_many(self, exercise_ids: Iterable[int], limit: int) -> List[Tuple[int, float]]:
+        """
+        Most similar exercises to a group of exercises (e.g. a whole template),
+        ranked against the normalized sum of their vectors.
+        """
+        positions = sorted({self.positions[exercise_id] for exercise_id in exercise_ids})
+        if not positions:
+            return []
+        query = self.vectors[positions].sum(axis=0)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = self.vectors @ (query / norm)
+        scores[positions] = -np.inf
+
+        limit = min(limit, len(scores) - len(positions))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[position]), float(scores[position])) for position in top]
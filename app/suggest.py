@@ -0,0 +1,77 @@
+"""
+Prefix index for exercise title typeahead.
+
+Every title is normalized (lowercase, punctuation and underscores folded to
+single spaces) and indexed under the full title and under the suffix starting
+at each later word, so "gob" finds "Dumbbell Goblet Squat". The keys live in
+one sorted array and a query is two binary searches. Matches on the start of
+the title rank before matches on a later word, then more popular exercises
+first. Results for one- and two-letter prefixes, the widest ranges, are
+precomputed when the index is built.
+"""
+import re
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+# Largest number of suggestions a query may ask for
+SUGGEST_MAX_LIMIT = 20
+
+# Prefixes up to this length have their results precomputed
+PRECOMPUTED_PREFIX_LENGTH = 2
+
+TITLE_MATCH = 0
+WORD_MATCH = 1
+
+_SEPARATORS = re.compile(r"[^a-z0-9]+")
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase text with runs of other characters folded to one space."""
+    return _SEPARATORS.sub(" ", (text or "").lower()).strip()
+
+class PrefixIndex:
+    """Sorted (key, match kind, position) entries over catalog positions."""
+
+    def __init__(self, titles: Sequence[str], popularity: Sequence[int]):
+        self.titles = [normalize(title) for title in titles]
+        self.popularity = list(popularity)
+        # Tie-breakers within a match kind: popularity, then shorter titles
+        self._order = [
+            (-self.popularity[position], len(title), title, position)
+            for position, title in enumerate(self.titles)
+        ]
+
+        entries = []
+        for position, title in enumerate(self.titles):
+            if not title:
+                continue
+            entries.append((title, TITLE_MATCH, position))
+            for match in re.finditer(" ", title):
+                entries.append((title[match.end():], WORD_MATCH, position))
+        entries.sort()
+        self.keys = [key for key, _, _ in entries]
+        self.entries = [(kind, position) for _, kind, position in entries]
+
+        self._precomputed: Dict[str, List[int]] = {}
+        short_prefixes = {key[:length] for key in self.keys for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1)}
+        for prefix in short_prefixes:
+            self._precomputed[prefix] = self._search(prefix, SUGGEST_MAX_LIMIT)
+
+    def _search(self, prefix: str, limit: int) -> List[int]:
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + "\uffff", start)
+        best: Dict[int, int] = {}
+        for kind, position in self.entries[start:end]:
+            if best.get(position, WORD_MATCH + 1) > kind:
+                best[position] = kind
+        ranked = sorted(best.items(), key=lambda item: (item[1], self._order[item[0]]))
+        return [position for position, _ in ranked[:limit]]
+
+    def search(self, query: str, limit: int) -> List[int]:
+        """Catalog positions of the best matches for a typed prefix."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        precomputed = self._precomputed.get(prefix)
+        if precomputed is not None and limit <= SUGGEST_MAX_LIMIT:
+            return precomputed[:limit]
+        return self._search(prefix, limit)
@@ -0,0 +1,178 @@
+"""
+Normalized muscle and equipment tags for exercises.
+
+Muscles come from the bullet list in ``Exercise.muscles_worked`` and are
+mapped onto a fixed vocabulary ("Gluteus maximus" -> glutes). Equipment is
+recognized from the exercise title ("Dumbbell Goblet Squat" -> dumbbell).
+The loader stores the tags in the tags / exercise_tags tables, and the
+catalog keeps one bitmap per tag so filters are answered with bitwise ANDs.
+"""
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+MUSCLE = "muscle"
+EQUIPMENT = "equipment"
+
+# Canonical muscle tag -> pattern matched against each line of muscles_worked.
+# A line may match several tags, e.g. "Core (abdominals and lower back)".
+MUSCLE_PATTERNS = {
+    "glutes": r"glute|piriformis",
+    "hamstrings": r"hamstring|semitendinosus|semimembranosus|biceps femoris",
+    "quadriceps": r"quadricep|\bquads\b|rectus femoris|vastus",
+    "calves": r"\bcalf\b|calves|gastrocnemius|soleus",
+    "shins": r"tibialis",
+    "adductors": r"adductor|inner thigh|pectineus",
+    "abductors": r"abductor|tensor fasciae latae",
+    "hip flexors": r"hip flexor|iliopsoas|psoas|sartorius",
+    "core": r"\bcore\b|abdomin|\babs\b|transverse",
+    "obliques": r"oblique",
+    "lower back": r"lower back|erector|quadratus lumborum|spinal",
+    "lats": r"latissimus|\blats\b|teres major",
+    "traps": r"trapezius|\btraps\b",
+    "rhomboids": r"rhomboid",
+    "upper back": r"upper back",
+    "back": r"^back\b|\bback muscles",
+    "serratus": r"serratus",
+    "chest": r"chest|pectoral|\bpecs\b",
+    "shoulders": r"shoulder|deltoid|rotator cuff|supraspinatus|infraspinatus|terr?es minor|subscapularis",
+    "biceps": r"\bbiceps?\b(?! femoris)|\bbrachialis\b",
+    "triceps": r"tricep|anconeus",
+    "forearms": r"forearm|brachioradialis|wrist|grip",
+    "neck": r"\bneck\b|sternocleidomastoid|splenius|semispinalis|levator scapulae|scalene|cervical",
+}
+
+# Canonical equipment tag -> pattern matched against the exercise title
+EQUIPMENT_PATTERNS = {
+    "barbell": r"barbell|\bez[ -]bar\b|trap bar",
+    "dumbbell": r"dumbbell",
+    "kettlebell": r"kettlebell",
+    "cable": r"\bcable\b",
+    "band": r"\bbands?\b",
+    "lever machine": r"\blever\b",
+    "smith machine": r"\bsmith\b",
+    "landmine": r"landmine",
+    "medicine ball": r"medicine ball",
+    "stability ball": r"stability ball|swiss ball|exercise ball",
+    "suspension trainer": r"suspension|\btrx\b",
+    "bodyweight": r"bodyweight",
+}
+
+_MUSCLE_REGEXES = {tag: re.compile(pattern) for tag, pattern in MUSCLE_PATTERNS.items()}
+_EQUIPMENT_REGEXES = {tag: re.compile(pattern) for tag, pattern in EQUIPMENT_PATTERNS.items()}
+
+def extract_muscle_tags(muscles_worked: Optional[str]) -> Set[str]:
+    """Canonical muscle tags from a bullet-joined muscles_worked text."""
+    tags = set()
+    for line in (muscles_worked or "").lower().splitlines():
+        line = line.lstrip("•-* ").strip()
+        for tag, regex in _MUSCLE_REGEXES.items():
+            if regex.search(line):
+                tags.add(tag)
+    return tags
+
+def extract_equipment_tags(title: Optional[str]) -> Set[str]:
+    """Equipment tags recognized in an exercise title."""
+    title = (title or "").lower().replace("_", " ")
+    return {tag for tag, regex in _EQUIPMENT_REGEXES.items() if regex.search(title)}
+
+def extract_tags(exercise) -> Set[Tuple[str, str]]:
+    """All (kind, name) tags of an exercise."""
+    return (
+        {(MUSCLE, name) for name in extract_muscle_tags(exercise.muscles_worked)} |
+        {(EQUIPMENT, name) for name in extract_equipment_tags(exercise.title)}
+    )
+
+def parse_tag_list(value: Optional[str]) -> List[str]:
+    """Parse a comma separated filter value such as "glutes, Hamstrings"."""
+    if not value:
+        return []
+    return [part.strip().lower() for part in value.split(",") if part.strip()]
+
+def sync_exercise_tags(db: Session, exercises: Optional[Iterable[models.Exercise]] = None):
+    """
+    Recompute the tags of the given exercises (all by default) and store them
+    with bulk statements: one insert for unknown tags, one delete and one
+    insert for the association rows.
+    """
+    if exercises is None:
+        exercises = db.query(models.Exercise).all()
+    wanted: Dict[int, Set[Tuple[str, str]]] = {exercise.id: extract_tags(exercise) for exercise in exercises}
+    if not wanted:
+        return
+
+    tag_ids = {(kind, name): tag_id for tag_id, kind, name in db.execute(
+        select(models.Tag.id, models.Tag.kind, models.Tag.name)
+    )}
+    new_tags = set().union(*wanted.values()) - tag_ids.keys()
+    if new_tags:
+        rows = db.execute(
+            insert(models.Tag).returning(models.Tag.id, models.Tag.kind, models.Tag.name),
+            [{"kind": kind, "name": name} for kind, name in sorted(new_tags)]
+        )
+        tag_ids.update({(kind, name): tag_id for tag_id, kind, name in rows})
+
+    db.execute(delete(models.exercise_tags).where(models.exercise_tags.c.exercise_id.in_(wanted)))
+    links = [
+        {"exercise_id": exercise_id, "tag_id": tag_ids[tag]}
+        for exercise_id, tags in wanted.items()
+        for tag in tags
+    ]
+    if links:
+        db.execute(insert(models.exercise_tags), links)
+    db.commit()
+    logger.info(f"Tagged {len(wanted)} exercises with {len(links)} muscle/equipment tags")
+
+class TagIndex:
+    """
+    One bitmap per facet value over catalog positions. Bit i is set when the
+    exercise at position i has the value; Python ints are the bitsets.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.all = (1 << size) - 1
+        self.bitmaps: Dict[str, Dict[str, int]] = {}
+
+    def add(self, facet: str, value: Optional[str], position: int):
+        if value is None:
+            return
+        values = self.bitmaps.setdefault(facet, {})
+        values[value] = values.get(value, 0) | (1 << position)
+
+    def match_any(self, facet: str, values: Iterable[str]) -> int:
+        """Positions having at least one of the values."""
+        bitmaps = self.bitmaps.get(facet, {})
+        mask = 0
+        for value in values:
+            mask |= bitmaps.get(value, 0)
+        return mask
+
+    def facet_counts(self, mask: int) -> Dict[str, Dict[str, int]]:
+        """Number of positions in mask per facet value, leaving out zero counts."""
+        counts = {}
+        for facet, values in self.bitmaps.items():
+            facet_counts = {}
+            for value, bitmap in values.items():
+                count = (bitmap & mask).bit_count()
+                if count:
+                    facet_counts[value] = count
+            counts[facet] = dict(sorted(facet_counts.items(), key=lambda item: (-item[1], item[0])))
+        return counts
+
+    @staticmethod
+    def positions(mask: int) -> List[int]:
+        """Set bit positions of mask in ascending order."""
+        result = []
+        while mask:
+            low_bit = mask & -mask
+            result.append(low_bit.bit_length() - 1)
+            mask ^= low_bit
+        return result
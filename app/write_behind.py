@@ -0,0 +1,194 @@
+"""
+Write-behind buffer for logged sets.
+
+With SET_WRITE_BEHIND enabled, POST /workout-tracking/{id}/sets validates the
+sets, queues them and waits. A writer thread takes the queued requests, up to
+SET_BUFFER_BATCH_SIZE of them and at most SET_BUFFER_FLUSH_INTERVAL seconds
+after the first, and writes all their sets with one multi-row insert and one
+commit. Each request is answered once its batch has committed (group commit),
+so an acknowledged set is in the database even if the pod dies right after.
+
+The queue holds at most SET_BUFFER_MAX_PENDING requests; beyond that requests
+are refused with 503 instead of waiting. close() writes what is queued before
+the process exits, and stats() reports the queue depth and batch counters.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from . import leaderboards, models, records, schemas
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+SET_WRITE_BEHIND = os.getenv("SET_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+SET_BUFFER_MAX_PENDING = int(os.getenv("SET_BUFFER_MAX_PENDING", "1000"))
+SET_BUFFER_BATCH_SIZE = int(os.getenv("SET_BUFFER_BATCH_SIZE", "200"))
+SET_BUFFER_FLUSH_INTERVAL = float(os.getenv("SET_BUFFER_FLUSH_INTERVAL", "0.01"))  # seconds
+
+class BufferFull(Exception):
+    """The buffer already holds SET_BUFFER_MAX_PENDING requests."""
+
+class PendingWrite:
+    """The sets of one request and the future answered when they are committed."""
+
+    def __init__(self, session_id: int, rows: List[Dict]):
+        self.session_id = session_id
+        self.rows = rows
+        self.future: Future = Future()
+
+_STOP = object()
+
+def write_batch(db: Session, batch: List[PendingWrite]) -> List[List[schemas.WorkoutSet]]:
+    """
+    Insert the sets of several requests in one statement and update the
+    weekly aggregates and personal records. Returns the written sets of each
+    request; the caller commits.
+    """
+    sessions = {
+        session.id: session for session in
+        db.query(models.WorkoutSession).filter(models.WorkoutSession.id.in_({write.session_id for write in batch}))
+    }
+    missing = {write.session_id for write in batch} - set(sessions)
+    if missing:
+        raise LookupError(f"Workout sessions not found: {sorted(missing)}")
+
+    rows = [
+        {**row, "session_start_time": sessions[write.session_id].start_time}
+        for write in batch for row in write.rows
+    ]
+    written = db.scalars(
+        insert(models.WorkoutSet).returning(models.WorkoutSet, sort_by_parameter_order=True),
+        rows
+    ).all() if rows else []
+
+    results = []
+    offset = 0
+    for write in batch:
+        workout_sets = written[offset:offset + len(write.rows)]
+        offset += len(write.rows)
+        leaderboards.record_sets_logged(db, sessions[write.session_id], workout_sets)
+        records.record_sets(db, sessions[write.session_id], workout_sets)
+        results.append([schemas.WorkoutSet.model_validate(workout_set, from_attributes=True) for workout_set in workout_sets])
+    return results
+
+class SetWriteBuffer:
+    """Bounded queue of set writes and the thread committing them in batches."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        max_pending: int = SET_BUFFER_MAX_PENDING,
+        batch_size: int = SET_BUFFER_BATCH_SIZE,
+        flush_interval: float = SET_BUFFER_FLUSH_INTERVAL
+    ):
+        self.session_factory = session_factory
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.requests_written = 0
+        self.sets_written = 0
+        self.failures = 0
+        self.last_batch_size = 0
+
+    def start(self):
+        # Started on first use rather than at import, so each prefork worker runs its own writer
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="set-write-behind", daemon=True)
+                self._thread.start()
+
+    def submit(self, session_id: int, rows: List[Dict]) -> Future:
+        """Queue the sets of a request; the future resolves to the written sets once committed."""
+        self.start()
+        write = PendingWrite(session_id, rows)
+        try:
+            self._queue.put_nowait(write)
+        except queue.Full:
+            raise BufferFull(f"{self.max_pending} set writes are already pending")
+        return write.future
+
+    def close(self):
+        """Write everything queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join()
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_pending": self.max_pending,
+            "batches": self.batches,
+            "requests_written": self.requests_written,
+            "sets_written": self.sets_written,
+            "failures": self.failures,
+            "last_batch_size": self.last_batch_size,
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    write = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if write is _STOP:
+                    stopping = True
+                    break
+                batch.append(write)
+            self._flush(batch)
+
+    def _flush(self, batch: List[PendingWrite]):
+        try:
+            results = self._commit(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                self.failures += 1
+                logger.error(f"Error writing sets of session {batch[0].session_id}: {str(e)}")
+                batch[0].future.set_exception(e)
+                return
+            # Retry one request at a time so a bad one does not fail the others
+            for write in batch:
+                self._flush([write])
+            return
+
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        for write, workout_sets in zip(batch, results):
+            self.requests_written += 1
+            self.sets_written += len(workout_sets)
+            write.future.set_result(workout_sets)
+
+    def _commit(self, batch: List[PendingWrite]) -> List[List[schemas.WorkoutSet]]:
+        db = self.session_factory()
+        try:
+            results = write_batch(db, batch)
+            db.commit()
+            return results
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+set_buffer = SetWriteBuffer()
@@ -0,0 +1,20 @@
+# gunicorn settings for running the API with several uvicorn workers:
+#     gunicorn app.main:app
+import os
+
+from app.server import after_fork, check_workers, prepare_master, worker_count
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = worker_count()
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+accesslog = "-"
+
+def on_starting(server):
+    prepare_master()
+    check_workers(server.cfg.workers)
+
+def post_fork(server, worker):
+    after_fork()
@@ -1,9 +1,12 @@
-from app.database import Base, engine
+from app.database import Base, engine, ensure_indexes
 from app.load_assets import init_assets
 
 def init_database():
     # Create all tables
     Base.metadata.create_all(bind=engine)
+
+    # Add indexes introduced after the tables were first created
+    ensure_indexes(engine)
     
     # Load all workout assets
     init_assets()
@@ -0,0 +1,48 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import cache, limits
+from app.compression import precompressed
+from app.catalog import catalog
+from app.main import app
+from app.database import Base, get_db, get_read_db, get_session_factory
+
+# Create in-memory SQLite database for testing
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
+
+@pytest.fixture()
+def test_db():
+    # Create the database tables and start from empty response caches, catalog and limits
+    Base.metadata.create_all(bind=engine)
+    cache.clear()
+    catalog.clear()
+    precompressed.clear()
+    limits.reset()
+    yield
+    # Drop the database tables
+    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture()
+def client(test_db):
+    return TestClient(app)
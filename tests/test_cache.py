@@ -0,0 +1,122 @@
+import pytest
+from sqlalchemy import event
+
+from app import cache, models
+from .conftest import TestingSessionLocal, engine
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FakeRedis:
+    """Local stand-in for the subset of the redis client used by RedisCache."""
+
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value.encode()
+
+    def sadd(self, key, member):
+        self.sets.setdefault(key, set()).add(member.encode())
+
+    def expire(self, key, ttl):
+        pass
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+            self.sets.pop(key, None)
+
+    def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        return [key for key in list(self.values) + list(self.sets) if key.startswith(prefix)]
+
+def test_memory_cache_expires_entries():
+    clock = FakeClock()
+    backend = cache.MemoryCache(clock=clock)
+    backend.set("a", {"value": 1}, ttl=10)
+    assert backend.get("a") == {"value": 1}
+    clock.now = 10
+    assert backend.get("a") is None
+
+def test_memory_cache_evicts_least_recently_used():
+    backend = cache.MemoryCache(max_entries=2)
+    backend.set("a", 1, ttl=60)
+    backend.set("b", 2, ttl=60)
+    backend.get("a")
+    backend.set("c", 3, ttl=60)
+    assert backend.get("b") is None
+    assert backend.get("a") == 1
+    assert backend.get("c") == 3
+
+@pytest.mark.parametrize("backend_factory", [
+    lambda: cache.MemoryCache(),
+    lambda: cache.RedisCache(client=FakeRedis()),
+])
+def test_backends_invalidate_by_tag(backend_factory):
+    backend = backend_factory()
+    backend.set("template-1", {"id": 1}, ttl=60, tags=["template:1"])
+    backend.set("template-2", {"id": 2}, ttl=60, tags=["template:2"])
+    backend.set("history", [1, 2], ttl=60, tags=["user:1", "template:1"])
+
+    backend.invalidate_tags(["template:1"])
+    assert backend.get("template-1") is None
+    assert backend.get("history") is None
+    assert backend.get("template-2") == {"id": 2}
+
+    backend.clear()
+    assert backend.get("template-2") is None
+
+@pytest.fixture()
+def template_id(test_db):
+    db = TestingSessionLocal()
+    exercise = models.Exercise(title="Deadlift", category="Strength")
+    db.add(exercise)
+    db.commit()
+    template = models.WorkoutTemplate(title="Pull Day", user_id=1)
+    template.exercises.append(models.WorkoutExercise(exercise_id=exercise.id, sets=3, reps=5, order=1))
+    db.add(template)
+    db.commit()
+    yield template.id
+    db.close()
+
+def count_template_selects(statements):
+    return len([s for s in statements if s.startswith("SELECT") and "FROM workout_templates" in s])
+
+def test_cached_template_reads_and_invalidation(client, template_id):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        first = client.get(f"/workout-templates/{template_id}").json()
+        second = client.get(f"/workout-templates/{template_id}").json()
+        assert first == second
+        assert count_template_selects(statements) == 1
+
+        client.patch(f"/workout-templates/{template_id}", json={"version": first["version"], "title": "Renamed"})
+        statements.clear()
+        third = client.get(f"/workout-templates/{template_id}").json()
+        assert third["title"] == "Renamed"
+        assert count_template_selects(statements) == 1
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+def test_history_invalidated_when_session_starts(client, template_id):
+    assert client.get("/workout-tracking/history?user_id=1").json() == []
+    client.post(f"/workout-tracking/start/{template_id}")
+    assert len(client.get("/workout-tracking/history?user_id=1").json()) == 1
+    assert len(client.get("/workout-tracking/history").json()) == 1
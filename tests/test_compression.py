@@ -0,0 +1,156 @@
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import compression
+from app.compression import BROTLI, GZIP, CompressionMiddleware, Compressor, negotiate
+from app.catalog import catalog
+from app.models import Exercise
+from app.tags import sync_exercise_tags
+from .conftest import TestingSessionLocal
+
+LONG_TEXT = "Keep your core braced and lower under control. " * 100
+
+@pytest.fixture()
+def plain_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse(LONG_TEXT)
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("ok")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter(["first,", "second,", "third"]), media_type="text/csv")
+
+    @app.get("/archive")
+    def archive():
+        return StreamingResponse(iter([gzip.compress(LONG_TEXT.encode())]), media_type="application/gzip")
+
+    @app.get("/encoded")
+    def encoded():
+        return PlainTextResponse(gzip.compress(LONG_TEXT.encode()), headers={"Content-Encoding": "gzip"})
+
+    return TestClient(app)
+
+@pytest.fixture()
+def long_exercises(test_db):
+    db = TestingSessionLocal()
+    db.add_all([
+        Exercise(
+            title=f"Dumbbell Squat {number}",
+            description="Squat holding dumbbells",
+            category="Strength",
+            difficulty="Beginner",
+            instructions=LONG_TEXT,
+            benefits=LONG_TEXT,
+            muscles_worked="Quads, Glutes",
+            variations="Goblet squat"
+        )
+        for number in range(3)
+    ])
+    db.commit()
+    sync_exercise_tags(db)
+    yield
+    db.close()
+
+def test_negotiate_accept_encoding(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert negotiate("gzip, deflate") == GZIP
+    assert negotiate("br, gzip;q=0.5") == GZIP
+    assert negotiate("gzip;q=0, identity") is None
+    assert negotiate("*") == GZIP
+    assert negotiate(None) is None
+
+    monkeypatch.setattr(compression, "brotli", object())
+    assert negotiate("gzip, br") == BROTLI
+    assert negotiate("br;q=0.5, gzip") == GZIP
+
+def test_compresses_large_responses_only(plain_client):
+    response = plain_client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.text == LONG_TEXT
+
+    assert "content-encoding" not in plain_client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in plain_client.get("/large", headers={"Accept-Encoding": "identity"}).headers
+
+def test_streamed_responses_are_compressed_per_chunk(plain_client):
+    response = plain_client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.text == "first,second,third"
+
+    # Each flushed chunk can be decoded before the stream ends
+    compressor = Compressor(GZIP)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decompressor.decompress(compressor.compress(b"first,", final=False)) == b"first,"
+    assert decompressor.decompress(compressor.compress(b"second", final=True)) == b"second"
+
+def test_already_compressed_responses_pass_through(plain_client):
+    archive = plain_client.get("/archive", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in archive.headers
+    assert gzip.decompress(archive.content).decode() == LONG_TEXT
+
+    encoded = plain_client.get("/encoded", headers={"Accept-Encoding": "gzip"})
+    assert encoded.text == LONG_TEXT
+
+def test_brotli_round_trip():
+    brotli = pytest.importorskip("brotli")
+    compressor = Compressor(BROTLI)
+    data = compressor.compress(b"first,", final=False) + compressor.compress(b"second", final=True)
+    assert brotli.decompress(data) == b"first,second"
+
+def test_catalog_responses_are_compressed_once_per_version(client, long_exercises, monkeypatch):
+    calls = []
+    compress = compression.compress
+
+    def counting_compress(body, encoding, level=None):
+        calls.append(encoding)
+        return compress(body, encoding, level)
+
+    monkeypatch.setattr(compression, "compress", counting_compress)
+    url = "/exercises/?equipment=dumbbell&limit=3"
+    first = client.get(url, headers={"Accept-Encoding": "gzip"})
+    second = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.content == second.content
+    assert first.json()["total"] == 3
+    assert calls == [GZIP]
+
+    identity = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.json() == first.json()
+
+    # Reloading the catalog starts a new version
+    db = TestingSessionLocal()
+    catalog.load(db)
+    db.close()
+    client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert calls == [GZIP, GZIP]
+
+def test_exercise_lists_and_details_reuse_compressed_bodies(client, long_exercises, monkeypatch):
+    calls = []
+    compress = compression.compress
+
+    def counting_compress(body, encoding, level=None):
+        calls.append(encoding)
+        return compress(body, encoding, level)
+
+    monkeypatch.setattr(compression, "compress", counting_compress)
+    exercise_id = client.get("/exercises/?limit=1", headers={"Accept-Encoding": "identity"}).json()["exercises"][0]["id"]
+    for url in ("/exercises/", f"/exercises/{exercise_id}"):
+        first = client.get(url, headers={"Accept-Encoding": "gzip"})
+        second = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert first.headers["content-encoding"] == "gzip"
+        assert first.content == second.content
+    assert calls == [GZIP, GZIP]
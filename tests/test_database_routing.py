@@ -0,0 +1,84 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import cache, database, limits, models
+from app.catalog import catalog
+from app.database import Base, DatabaseRouter, get_db, get_read_db
+from app.main import app
+
+@pytest.fixture()
+def two_databases(tmp_path, monkeypatch):
+    """A primary and a lagging replica, each in its own database file."""
+    engines = {
+        name: create_engine(f"sqlite:///{tmp_path / name}.db", connect_args={"check_same_thread": False})
+        for name in ("primary", "replica")
+    }
+    for engine in engines.values():
+        Base.metadata.create_all(bind=engine)
+        with sessionmaker(bind=engine)() as db:
+            db.add(models.User(id=1, email="lifter@example.com", username="lifter", hashed_password="dummyhash"))
+            db.commit()
+
+    router = DatabaseRouter(
+        sessionmaker(autocommit=False, autoflush=False, bind=engines["primary"]),
+        [sessionmaker(autocommit=False, autoflush=False, bind=engines["replica"])],
+        sticky_seconds=5
+    )
+    monkeypatch.setattr(database, "db_router", router)
+    monkeypatch.delitem(app.dependency_overrides, get_db)
+    monkeypatch.delitem(app.dependency_overrides, get_read_db)
+    cache.clear()
+    catalog.clear()
+    limits.reset()
+    yield router
+    for engine in engines.values():
+        engine.dispose()
+
+def test_reads_go_to_replica_until_client_writes(two_databases):
+    writer, other_client = TestClient(app), TestClient(app)
+
+    # A request that writes nothing does not pin the client to the primary
+    assert writer.post("/workout-tracking/999/complete").status_code == 404
+    assert database.STICKY_PRIMARY_COOKIE not in writer.cookies
+
+    response = writer.post("/workout-templates/", json={"title": "Leg Day", "user_id": 1, "exercises": []})
+    assert response.status_code == 200
+    assert database.STICKY_PRIMARY_COOKIE in response.cookies
+
+    # The writer reads its own write from the primary
+    assert [template["title"] for template in writer.get("/workout-templates/").json()] == ["Leg Day"]
+    # Everyone else reads the replica, which has not caught up
+    assert other_client.get("/workout-templates/").json() == []
+    writer.cookies.clear()
+    assert writer.get("/workout-templates/").json() == []
+
+def test_cached_history_reads_own_writes(two_databases, monkeypatch):
+    monkeypatch.setattr(cache, "_backend", cache.MemoryCache())
+    writer, other_client = TestClient(app), TestClient(app)
+    history = "/workout-tracking/history?user_id=1"
+    assert other_client.get(history).json() == []
+
+    template = writer.post("/workout-templates/", json={"title": "Leg Day", "user_id": 1, "exercises": []}).json()
+    assert writer.post(f"/workout-tracking/start/{template['id']}").status_code == 200
+
+    # The lagging replica answers everyone else but does not refill the cache
+    assert other_client.get(history).json() == []
+    assert len(writer.get(history).json()) == 1
+    # Reads on the primary are cached as before
+    assert len(writer.get(history).json()) == 1
+    assert len(other_client.get(history).json()) == 1
+
+def test_read_sessions_reject_writes(two_databases):
+    db = two_databases.read_session()
+    db.add(models.User(email="someone@example.com", username="someone", hashed_password="dummyhash"))
+    with pytest.raises(RuntimeError):
+        db.commit()
+    db.close()
+
+def test_reads_use_primary_without_replicas():
+    router = DatabaseRouter(sessionmaker(info={"database": "primary"}))
+    db = router.read_session()
+    assert db.info["database"] == "primary" and db.info["read_only"]
+    db.close()
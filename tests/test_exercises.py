@@ -1,43 +1,9 @@
 import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 
-from app.main import app
-from app.database import Base, get_db
 from app.models import Exercise
-
-# Create in-memory SQLite database for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Override the dependency
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
-
-@pytest.fixture()
-def test_db():
-    # Create the database tables
-    Base.metadata.create_all(bind=engine)
-    yield
-    # Drop the database tables
-    Base.metadata.drop_all(bind=engine)
-
-@pytest.fixture()
-def client(test_db):
-    return TestClient(app)
+from app.suggest import PrefixIndex
+from app.tags import extract_equipment_tags, extract_muscle_tags, sync_exercise_tags
+from .conftest import TestingSessionLocal
 
 @pytest.fixture()
 def sample_exercises(test_db):
@@ -120,6 +86,59 @@ def test_get_exercises_search(client, sample_exercises):
               "push" in exercise["description"].lower() 
               for exercise in data["exercises"])
 
+def test_get_exercises_summary_view(client, sample_exercises):
+    response = client.get("/exercises/?view=summary&category=Strength")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert data["exercises"][0] == {
+        "id": data["exercises"][0]["id"],
+        "title": "Push-ups",
+        "category": "Strength",
+        "difficulty": "Beginner",
+        "image_path": "pushups.jpg",
+    }
+    assert client.get("/exercises/?view=compact").status_code == 422
+
+def test_get_exercises_sparse_fieldsets(client, tagged_exercises):
+    data = client.get("/exercises/?fields=title,benefits&search=push").json()
+    assert data["exercises"] == [
+        {"id": data["exercises"][0]["id"], "title": "Push-ups", "benefits": "Builds chest and arm strength"}
+    ]
+    # Also applied to lists answered from the catalog, and over the summary view
+    data = client.get("/exercises/?muscles=glutes&fields=title&view=summary").json()
+    assert [set(exercise) for exercise in data["exercises"]] == [{"id", "title"}]
+    assert data["facets"]["muscles"] == {"glutes": 1, "hamstrings": 1}
+
+    response = client.get("/exercises/?fields=title,password")
+    assert response.status_code == 400
+    assert "password" in response.json()["detail"]
+
+def test_exercise_list_schema_covers_projections(client):
+    schema = client.get("/openapi.json").json()
+    response = schema["paths"]["/exercises/"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert {option["$ref"].rsplit("/", 1)[-1] for option in response["anyOf"]} == {
+        "PaginatedWorkoutAssets", "PaginatedExerciseSummaries", "PaginatedExerciseFields"
+    }
+
+def test_get_exercise_batch(client, sample_exercises):
+    push_ups, pull_ups, running = (exercise.id for exercise in sample_exercises)
+    response = client.get(f"/exercises/batch?ids={running},9999,{push_ups},{running}")
+    assert response.status_code == 200
+    data = response.json()
+    assert [exercise["title"] for exercise in data["exercises"]] == ["Running", "Push-ups"]
+    assert data["exercises"][1]["instructions"].startswith("1. Start in plank position")
+    assert data["missing"] == [9999]
+
+    # Served from the catalog once it is loaded, and by POST for long lists
+    client.get("/exercises/suggest?q=run")
+    response = client.post("/exercises/batch", json={"ids": [pull_ups, 9998, push_ups]})
+    assert [exercise["title"] for exercise in response.json()["exercises"]] == ["Advanced Pull-ups", "Push-ups"]
+    assert response.json()["missing"] == [9998]
+
+    assert client.get("/exercises/batch?ids=1,x").status_code == 400
+    assert client.post("/exercises/batch", json={"ids": list(range(201))}).status_code == 422
+
 def test_get_exercise_categories(client, sample_exercises):
     response = client.get("/exercises/categories")
     assert response.status_code == 200
@@ -132,3 +151,117 @@ def test_get_exercise_categories(client, sample_exercises):
     category_names = [cat["category"] for cat in categories]
     assert "Strength" in category_names
     assert "Cardio" in category_names
+
+def test_get_similar_exercises(client, sample_exercises):
+    pushups = client.get("/exercises/?search=Push-ups").json()["exercises"][0]
+    response = client.get(f"/exercises/{pushups['id']}/similar?limit=2")
+    assert response.status_code == 200
+    similar = response.json()
+    assert len(similar) == 2
+    assert pushups["id"] not in [exercise["id"] for exercise in similar]
+    # The other strength exercise shares category and arm muscles, running shares neither title nor muscles
+    assert similar[0]["title"] == "Advanced Pull-ups"
+    assert similar[0]["score"] >= similar[1]["score"]
+
+def test_get_similar_to_group_of_exercises(client, sample_exercises):
+    exercises = client.get("/exercises/").json()["exercises"]
+    ids = [exercise["id"] for exercise in exercises if exercise["category"] == "Strength"]
+    response = client.get(f"/exercises/similar?ids={','.join(map(str, ids))}")
+    assert response.status_code == 200
+    assert [exercise["title"] for exercise in response.json()] == ["Running"]
+
+def test_get_similar_exercises_not_found(client, sample_exercises):
+    assert client.get("/exercises/999/similar").status_code == 404
+    assert client.get("/exercises/similar?ids=1,999").status_code == 404
+    assert client.get("/exercises/similar?ids=a,b").status_code == 400
+
+@pytest.fixture()
+def tagged_exercises(sample_exercises):
+    db = TestingSessionLocal()
+    db.add_all([
+        Exercise(
+            title="Dumbbell Hip Thrust",
+            description="Hip thrust holding a dumbbell",
+            category="Strength",
+            difficulty="Intermediate",
+            muscles_worked="• Gluteus maximus\n• Hamstrings"
+        ),
+        Exercise(
+            title="Barbell Romanian Deadlift",
+            description="Hip hinge with a barbell",
+            category="Strength",
+            difficulty="Advanced",
+            muscles_worked="• Hamstrings\n• Erector spinae"
+        ),
+    ])
+    db.commit()
+    sync_exercise_tags(db)
+    db.close()
+
+def test_extract_tags():
+    assert extract_muscle_tags("• Gluteus maximus\n• Biceps femoris\n• Core (abdominals and lower back)") == {
+        "glutes", "hamstrings", "core", "lower back"
+    }
+    assert extract_equipment_tags("Dumbbell_Goblet_Squat") == {"dumbbell"}
+    assert extract_equipment_tags("Push-ups") == set()
+
+def test_sync_exercise_tags_stores_associations(tagged_exercises):
+    db = TestingSessionLocal()
+    exercise = db.query(Exercise).filter(Exercise.title == "Dumbbell Hip Thrust").one()
+    assert {(tag.kind, tag.name) for tag in exercise.tags} == {
+        ("muscle", "glutes"), ("muscle", "hamstrings"), ("equipment", "dumbbell")
+    }
+    # Syncing again replaces the associations instead of duplicating them
+    sync_exercise_tags(db)
+    db.expire_all()
+    assert len(exercise.tags) == 3
+    db.close()
+
+def test_get_exercises_filter_by_muscles_and_equipment(client, tagged_exercises):
+    response = client.get("/exercises/?muscles=glutes,hamstrings")
+    assert response.status_code == 200
+    data = response.json()
+    assert [exercise["title"] for exercise in data["exercises"]] == [
+        "Dumbbell Hip Thrust", "Barbell Romanian Deadlift"
+    ]
+    assert data["total"] == 2
+    assert data["facets"]["muscles"] == {"hamstrings": 2, "glutes": 1, "lower back": 1}
+    assert data["facets"]["equipment"] == {"barbell": 1, "dumbbell": 1}
+
+    data = client.get("/exercises/?muscles=Hamstrings&equipment=dumbbell").json()
+    assert [exercise["title"] for exercise in data["exercises"]] == ["Dumbbell Hip Thrust"]
+
+def test_get_exercises_tag_filter_combines_with_other_filters(client, tagged_exercises):
+    data = client.get("/exercises/?muscles=hamstrings&difficulty=Advanced").json()
+    assert [exercise["title"] for exercise in data["exercises"]] == ["Barbell Romanian Deadlift"]
+
+    data = client.get("/exercises/?muscles=hamstrings&search=thrust").json()
+    assert data["total"] == 1
+    assert data["facets"]["equipment"] == {"dumbbell": 1}
+
+    data = client.get("/exercises/?muscles=hamstrings&limit=1&skip=1").json()
+    assert data["total"] == 2
+    assert [exercise["title"] for exercise in data["exercises"]] == ["Barbell Romanian Deadlift"]
+
+    data = client.get("/exercises/?equipment=kettlebell").json()
+    assert data["total"] == 0 and data["exercises"] == []
+
+def test_suggest_exercises_by_prefix(client, tagged_exercises):
+    response = client.get("/exercises/suggest?q=pu")
+    assert response.status_code == 200
+    assert [exercise["title"] for exercise in response.json()] == ["Push-ups", "Advanced Pull-ups"]
+
+    # Words inside the title match too, and punctuation is ignored
+    assert [exercise["title"] for exercise in client.get("/exercises/suggest?q=hip thr").json()] == [
+        "Dumbbell Hip Thrust"
+    ]
+    assert [exercise["title"] for exercise in client.get("/exercises/suggest?q=PUSH UP").json()] == ["Push-ups"]
+    assert client.get("/exercises/suggest?q=zzz").json() == []
+    assert client.get("/exercises/suggest?q=%20").json() == []
+
+def test_suggest_exercises_ranks_popular_exercises_first():
+    index = PrefixIndex(["Barbell Squat", "Barbell Row", "Bench Press"], [1, 5, 0])
+    assert index.search("barbell", 10) == [1, 0]
+    assert index.search("b", 2) == [1, 0]
+    assert index.search("b", 10) == [1, 0, 2]
+    assert index.search("row", 10) == [1]
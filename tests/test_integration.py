@@ -1,12 +1,13 @@
 import pytest
 import os
+import gzip
 import json
 from pathlib import Path
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.exc import IntegrityError
-from app import database, load_assets, models
-from datetime import datetime
+from app import database, load_assets, models, partitioning
+from datetime import date, datetime
 
 # Test database configuration from environment variables
 TEST_DB_NAME = os.getenv("POSTGRES_DB", "test_workout_motivator_db")
@@ -15,14 +16,19 @@ TEST_DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "admin")
 TEST_DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
 TEST_DB_PORT = int(os.getenv("POSTGRES_PORT", "5432"))
 
-# Create test database URL
-TEST_DATABASE_URL = f"postgresql://{TEST_DB_USER}:{TEST_DB_PASSWORD}@{TEST_DB_HOST}:{TEST_DB_PORT}/{TEST_DB_NAME}"
+# Create test database URL: TEST_DATABASE_URL, else Postgres when POSTGRES_HOST is set,
+# else a SQLite file in a temporary directory
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if not TEST_DATABASE_URL and os.getenv("POSTGRES_HOST"):
+    TEST_DATABASE_URL = f"postgresql://{TEST_DB_USER}:{TEST_DB_PASSWORD}@{TEST_DB_HOST}:{TEST_DB_PORT}/{TEST_DB_NAME}"
 
 @pytest.fixture(scope="session")
-def test_engine():
+def test_engine(tmp_path_factory):
     """Create a test database engine."""
-    engine = create_engine(TEST_DATABASE_URL)
-    return engine
+    url = TEST_DATABASE_URL or f"sqlite:///{tmp_path_factory.mktemp('db') / 'integration.db'}"
+    engine = database.create_database_engine(url)
+    yield engine
+    engine.dispose()
 
 @pytest.fixture(scope="function")
 def test_db(test_engine):
@@ -93,6 +99,62 @@ def test_backup_and_restore(test_db):
     # Clean up backup file
     os.remove(backup_file)
 
+def test_backup_and_restore_related_rows_in_chunks(test_db):
+    """Test that backups stream related tables and restore them in small chunks."""
+    user = models.User(email="backup@example.com", username="backupuser", hashed_password="dummyhash")
+    exercise = models.Exercise(title="Chunked Backup Exercise", category="Test")
+    test_db.add_all([user, exercise])
+    test_db.commit()
+
+    template = models.WorkoutTemplate(title="Backup Template", user_id=user.id)
+    template.exercises.append(models.WorkoutExercise(exercise_id=exercise.id, sets=3, reps=10, order=1))
+    test_db.add(template)
+    test_db.commit()
+
+    session = models.WorkoutSession(template_id=template.id, user_id=user.id, start_time=datetime(2024, 1, 2, 7, 30))
+    for set_number in range(1, 4):
+        session.sets.append(models.WorkoutSet(exercise_id=exercise.id, set_number=set_number, reps=10, weight=50.0))
+    test_db.add(session)
+    test_db.commit()
+
+    backup_file = database.backup_data(test_db, chunk_size=2)
+    try:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            test_db.execute(table.delete())
+        test_db.commit()
+
+        database.restore_from_backup(backup_file, test_db, chunk_size=2)
+
+        restored_session = test_db.query(models.WorkoutSession).one()
+        assert restored_session.start_time == datetime(2024, 1, 2, 7, 30)
+        assert len(restored_session.sets) == 3
+        assert test_db.query(models.WorkoutExercise).one().order == 1
+    finally:
+        os.remove(backup_file)
+
+def test_backup_of_legacy_schema_database(tmp_path, monkeypatch):
+    """Test backing up a database that lacks the newer tables and columns, and restoring it."""
+    monkeypatch.chdir(tmp_path)
+    legacy_engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy_engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR, username VARCHAR, hashed_password VARCHAR)")
+        connection.exec_driver_sql("CREATE TABLE exercises (id INTEGER PRIMARY KEY, title VARCHAR, category VARCHAR)")
+        connection.exec_driver_sql("INSERT INTO users VALUES (1, 'legacy@example.com', 'legacy', 'dummyhash')")
+        connection.exec_driver_sql("INSERT INTO exercises VALUES (1, 'Squat', 'Strength')")
+
+    with Session(legacy_engine) as legacy_db:
+        backup_file = database.backup_data(legacy_db)
+    legacy_engine.dispose()
+
+    restored_engine = create_engine(f"sqlite:///{tmp_path / 'restored.db'}")
+    models.Base.metadata.create_all(bind=restored_engine)
+    with Session(restored_engine) as restored_db:
+        database.restore_from_backup(backup_file, restored_db)
+        assert restored_db.query(models.User).one().username == "legacy"
+        exercise = restored_db.query(models.Exercise).one()
+        assert (exercise.title, exercise.description) == ("Squat", None)
+    restored_engine.dispose()
+
 def test_load_assets_functionality(test_db, tmp_path):
     """Test asset loading functionality with temporary test assets."""
     # Create temporary asset structure
@@ -199,3 +261,224 @@ def test_database_integrity(test_db):
     
     # Verify session was also deleted
     assert test_db.query(models.WorkoutSession).filter_by(id=session.id).first() is None
+
+def test_sqlite_connections_use_wal(test_engine):
+    """Test the pragmas applied to SQLite connections."""
+    if test_engine.dialect.name != "sqlite":
+        pytest.skip("SQLite only")
+    with test_engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
+
+def test_init_db_on_sqlite_recreates_tables(test_engine, monkeypatch):
+    """Test that init_db drops every table on SQLite, where there is no schema to drop."""
+    if test_engine.dialect.name != "sqlite":
+        pytest.skip("SQLite only")
+    monkeypatch.setattr(database, "engine", test_engine)
+    with test_engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE leftover (id INTEGER PRIMARY KEY)")
+
+    database.init_db(max_retries=1)
+
+    tables = set(inspect(test_engine).get_table_names())
+    assert "leftover" not in tables
+    assert {"exercises", "workout_sessions", "workout_sets"} <= tables
+    models.Base.metadata.drop_all(bind=test_engine)
+
+@pytest.fixture()
+def legacy_schema(test_engine, test_db):
+    """Create the legacy tables with a few rows; Postgres only, like the migration SQL."""
+    if test_engine.dialect.name != "postgresql":
+        pytest.skip("PostgreSQL only")
+    user = models.User(email="legacy@example.com", username="legacyuser", hashed_password="dummyhash")
+    # Already in the catalog, so the legacy asset of the same title maps onto it
+    test_db.add_all([user, models.Exercise(title="Squat", category="Strength")])
+    test_db.commit()
+
+    with test_engine.begin() as connection:
+        connection.exec_driver_sql("""
+            CREATE TABLE workout_assets (
+                id INTEGER PRIMARY KEY, title VARCHAR, description TEXT, category VARCHAR,
+                difficulty VARCHAR, instructions TEXT, benefits TEXT, muscles_worked TEXT,
+                variations TEXT, image_path VARCHAR, animation_path VARCHAR
+            )
+        """)
+        connection.exec_driver_sql("""
+            CREATE TABLE workouts (
+                id INTEGER PRIMARY KEY, title VARCHAR, description TEXT, user_id INTEGER,
+                created_at TIMESTAMP, updated_at TIMESTAMP, date TIMESTAMP, completed BOOLEAN
+            )
+        """)
+        connection.exec_driver_sql("""
+            CREATE TABLE exercise_assets (
+                id INTEGER PRIMARY KEY, workout_id INTEGER, asset_id INTEGER, sets INTEGER,
+                reps INTEGER, weight FLOAT, duration INTEGER, distance FLOAT
+            )
+        """)
+        connection.execute(text("""
+            INSERT INTO workout_assets (id, title, category) VALUES
+                (1, 'Squat', 'Strength'), (2, 'Push-up', 'Strength'), (3, 'Rowing', 'Cardio')
+        """))
+        for workout_id in range(1, 6):
+            connection.execute(text("""
+                INSERT INTO workouts (id, title, user_id, created_at, updated_at, date, completed)
+                VALUES (:id, :title, :user_id, :created_at, :created_at, :created_at, :completed)
+            """), {
+                "id": workout_id, "title": f"Legacy Workout {workout_id}", "user_id": user.id,
+                "created_at": datetime(2023, 1, workout_id, 7), "completed": workout_id % 2 == 1
+            })
+            connection.execute(text("""
+                INSERT INTO exercise_assets (id, workout_id, asset_id, sets, reps, weight) VALUES
+                    (:first, :workout_id, 1, 3, 10, 60.0), (:second, :workout_id, :asset_id, 3, 12, NULL)
+            """), {"first": 2 * workout_id - 1, "second": 2 * workout_id, "workout_id": workout_id, "asset_id": 2 + workout_id % 2})
+    try:
+        yield user.id
+    finally:
+        # End the session's transaction first, its locks would block the DROPs
+        test_db.rollback()
+        with test_engine.begin() as connection:
+            for table in ("exercise_assets", "workouts", "workout_assets", "legacy_id_map"):
+                connection.exec_driver_sql(f"DROP TABLE IF EXISTS {table}")
+
+def test_legacy_migration_resumes_after_failed_chunk(test_engine, test_db, legacy_schema, monkeypatch):
+    """Test that a migration failing mid-chunk resumes without duplicate or missing rows."""
+    backups = []
+    monkeypatch.setattr(database, "engine", test_engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=test_engine))
+    monkeypatch.setattr(database, "backup_data", lambda db: backups.append(db))
+
+    migrate_chunk = database._migrate_legacy_workouts_chunk
+    calls = []
+
+    def failing_chunk(db, after_id, chunk_size):
+        calls.append(after_id)
+        result = migrate_chunk(db, after_id, chunk_size)
+        if len(calls) == 2:
+            # The chunk's statements have run but are not committed yet
+            raise RuntimeError("connection lost")
+        return result
+
+    monkeypatch.setattr(database, "_migrate_legacy_workouts_chunk", failing_chunk)
+    with pytest.raises(RuntimeError):
+        database.migrate_data(chunk_size=2)
+
+    # Assets and the first chunk are committed, the failed chunk is rolled back
+    assert test_db.query(models.WorkoutTemplate).count() == 2
+    assert test_db.query(models.Exercise).count() == 3
+    assert len(backups) == 1
+
+    monkeypatch.setattr(database, "_migrate_legacy_workouts_chunk", migrate_chunk)
+    database.migrate_data(chunk_size=2)
+    # A resumed run builds on the committed chunks instead of taking another backup
+    assert len(backups) == 1
+
+    templates = test_db.query(models.WorkoutTemplate).order_by(models.WorkoutTemplate.title).all()
+    assert [template.title for template in templates] == [f"Legacy Workout {number}" for number in range(1, 6)]
+    assert all(template.user_id == legacy_schema for template in templates)
+    assert test_db.query(models.Exercise).count() == 3
+
+    exercises = {exercise.id: exercise.title for exercise in test_db.query(models.Exercise)}
+    for number, template in enumerate(templates, start=1):
+        rows = sorted(template.exercises, key=lambda row: row.order)
+        assert [(row.order, exercises[row.exercise_id]) for row in rows] == [
+            (1, "Squat"), (2, "Rowing" if number % 2 else "Push-up")
+        ]
+
+    sessions = test_db.query(models.WorkoutSession).all()
+    assert sorted(session.start_time.day for session in sessions) == [1, 3, 5]
+    assert all(session.completed for session in sessions)
+
+    mapped = test_db.execute(text("SELECT kind, count(*) FROM legacy_id_map GROUP BY kind")).all()
+    assert dict(mapped) == {"asset": 3, "workout": 5}
+
+    # Running it again once everything is migrated changes nothing
+    database.migrate_data(chunk_size=2)
+    assert test_db.query(models.WorkoutTemplate).count() == 5
+    assert test_db.query(models.WorkoutExercise).count() == 10
+    assert test_db.query(models.WorkoutSession).count() == 3
+
+def test_archive_keeps_partition_when_archiving_fails(test_engine, tmp_path, monkeypatch):
+    """Test that a failed archive run leaves the partition attached and a rerun archives it."""
+    if test_engine.dialect.name != "postgresql":
+        pytest.skip("PostgreSQL only")
+    monkeypatch.setattr(partitioning, "PARTITION_KEYS", {"archive_check": "created_at"})
+    with test_engine.begin() as connection:
+        connection.exec_driver_sql("""
+            CREATE TABLE archive_check (
+                id SERIAL, created_at TIMESTAMP NOT NULL, PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
+        """)
+        connection.exec_driver_sql(
+            "CREATE TABLE archive_check_2023_01 PARTITION OF archive_check "
+            "FOR VALUES FROM ('2023-01-01') TO ('2023-02-01')"
+        )
+        connection.exec_driver_sql("CREATE TABLE archive_check_default PARTITION OF archive_check DEFAULT")
+        connection.exec_driver_sql("""
+            INSERT INTO archive_check (created_at) VALUES
+                ('2023-01-02'), ('2023-01-15'), ('2023-01-31'), ('2024-05-01')
+        """)
+
+    def partitions():
+        with test_engine.connect() as connection:
+            return partitioning.list_partitions(connection, "archive_check")
+
+    def rows():
+        with test_engine.connect() as connection:
+            return connection.exec_driver_sql("SELECT count(*) FROM archive_check").scalar()
+
+    copy_to_file = partitioning._copy_to_file
+
+    def crashing_copy(connection, table_name, path):
+        copy_to_file(connection, table_name, path)
+        raise RuntimeError("archive volume unavailable")
+
+    try:
+        monkeypatch.setattr(partitioning, "_copy_to_file", crashing_copy)
+        with pytest.raises(RuntimeError):
+            partitioning.archive_partitions(test_engine, 12, str(tmp_path), today=date(2024, 6, 1))
+        assert partitions() == ["archive_check_2023_01", "archive_check_default"]
+        assert rows() == 4
+
+        monkeypatch.setattr(partitioning, "_copy_to_file", copy_to_file)
+        archived = partitioning.archive_partitions(test_engine, 12, str(tmp_path), today=date(2024, 6, 1))
+        assert archived == [str(tmp_path / "archive_check_2023_01.csv.gz")]
+        with gzip.open(archived[0], "rt") as f:
+            assert len(f.read().splitlines()) == 4  # header and three rows
+        assert partitions() == ["archive_check_default"]
+        assert rows() == 1
+    finally:
+        with test_engine.begin() as connection:
+            connection.exec_driver_sql("DROP TABLE IF EXISTS archive_check")
+
+def test_new_partition_takes_rows_from_default_partition(test_engine, monkeypatch):
+    """Test that creating a month's partition moves that month's rows out of the default partition."""
+    if test_engine.dialect.name != "postgresql":
+        pytest.skip("PostgreSQL only")
+    monkeypatch.setattr(partitioning, "PARTITION_KEYS", {"partition_check": "created_at"})
+    with test_engine.begin() as connection:
+        connection.exec_driver_sql("""
+            CREATE TABLE partition_check (
+                id SERIAL, created_at TIMESTAMP NOT NULL, PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
+        """)
+        connection.exec_driver_sql("CREATE TABLE partition_check_default PARTITION OF partition_check DEFAULT")
+        connection.exec_driver_sql("""
+            INSERT INTO partition_check (created_at) VALUES
+                ('2024-06-03'), ('2024-06-30 23:59'), ('2024-07-01'), ('2023-01-01')
+        """)
+
+    try:
+        created = partitioning.ensure_partitions(test_engine, months_ahead=1, today=date(2024, 6, 15))
+        assert created == ["partition_check_2024_06", "partition_check_2024_07"]
+        with test_engine.connect() as connection:
+            assert partitioning.list_partitions(connection, "partition_check") == [
+                "partition_check_2024_06", "partition_check_2024_07", "partition_check_default"
+            ]
+            counts = {
+                name: connection.exec_driver_sql(f"SELECT count(*) FROM {name}").scalar()
+                for name in ("partition_check_2024_06", "partition_check_2024_07", "partition_check_default")
+            }
+        assert counts == {"partition_check_2024_06": 2, "partition_check_2024_07": 1, "partition_check_default": 1}
+    finally:
+        with test_engine.begin() as connection:
+            connection.exec_driver_sql("DROP TABLE IF EXISTS partition_check")
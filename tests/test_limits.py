@@ -0,0 +1,88 @@
+from app import limits
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    limiter = limits.ClientRateLimiter(rate=2, burst=2, clock=clock)
+    assert limiter.allow("a")[0] and limiter.allow("a")[0]
+    allowed, wait = limiter.allow("a")
+    assert not allowed and wait == 0.5
+    # Other clients have their own bucket
+    assert limiter.allow("b")[0]
+    clock.now = 0.5
+    assert limiter.allow("a")[0]
+
+def test_rate_limiter_keeps_only_recent_clients():
+    limiter = limits.ClientRateLimiter(rate=1, burst=1, max_clients=2, clock=FakeClock())
+    for client in ("a", "b", "c"):
+        limiter.allow(client)
+    assert list(limiter._buckets) == ["b", "c"]
+
+def test_adaptive_limit_grows_and_backs_off():
+    clock = FakeClock()
+    limit = limits.AdaptiveConcurrencyLimit(initial=10, minimum=2, maximum=11, target_latency=0.1, clock=clock)
+    for _ in range(20):
+        limit.observe(0.01)
+    assert limit.limit == 11
+
+    clock.now = 1.0
+    limit.observe(0.5)
+    limit.observe(0.5)  # within the same window: only one decrease
+    assert limit.limit == 11 * 0.9
+    for step in range(50):
+        clock.now += 0.2
+        limit.observe(0.5)
+    assert limit.limit == 2
+
+def test_low_priority_requests_are_shed_first():
+    limit = limits.AdaptiveConcurrencyLimit(initial=4)
+    assert [limit.try_acquire(limits.LOW) for _ in range(4)] == [True, True, True, False]
+    assert limit.try_acquire(limits.HIGH)
+    assert not limit.try_acquire(limits.HIGH)
+    limit.release()
+    assert limit.in_flight == 3
+
+def test_request_priority():
+    assert limits.request_priority("POST", "/workout-tracking/start/1") == limits.HIGH
+    assert limits.request_priority("GET", "/exercises/suggest") == limits.LOW
+    assert limits.request_priority("GET", "/workout-tracking/history") == limits.NORMAL
+
+def test_middleware_returns_429_when_client_exceeds_rate(client, monkeypatch):
+    monkeypatch.setattr(limits, "rate_limiter", limits.ClientRateLimiter(rate=0.5, burst=2))
+    assert client.get("/").status_code == 200
+    assert client.get("/").status_code == 200
+    response = client.get("/")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    # Health checks are never limited
+    assert client.get("/health").status_code == 200
+    # A client cannot get a fresh bucket by sending its own X-Forwarded-For
+    assert client.get("/", headers={"X-Forwarded-For": "203.0.113.7"}).status_code == 429
+
+def test_client_key_ignores_forwarded_addresses_set_by_the_client(monkeypatch):
+    scope = {"client": ("10.0.0.1", 51234), "headers": [(b"x-forwarded-for", b"203.0.113.7, 198.51.100.2")]}
+    assert limits.client_key(scope) == "10.0.0.1"
+    assert limits.client_key({"client": None, "headers": []}) == "unknown"
+
+    # Behind the ingress only the address it appended counts
+    monkeypatch.setattr(limits, "TRUSTED_PROXY_HOPS", 1)
+    assert limits.client_key(scope) == "198.51.100.2"
+    assert limits.client_key({"client": ("10.0.0.1", 51234), "headers": []}) == "10.0.0.1"
+
+def test_middleware_sheds_with_503_when_saturated(client, monkeypatch):
+    saturated = limits.AdaptiveConcurrencyLimit(initial=4)
+    saturated.in_flight = 3
+    monkeypatch.setattr(limits, "concurrency_limit", saturated)
+
+    response = client.get("/exercises/")
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    # Tracking writes still fit in the reserved capacity
+    assert client.post("/workout-tracking/999/complete").status_code == 404
+    assert saturated.in_flight == 3
@@ -0,0 +1,175 @@
+import asyncio
+from datetime import datetime
+
+import anyio
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app import live, models
+from .conftest import TestingSessionLocal
+
+@pytest.fixture()
+def live_client(client):
+    # Run every WebSocket of a test on one event loop, like a single server process
+    with anyio.from_thread.start_blocking_portal() as portal:
+        client.portal = portal
+        yield client
+        client.portal = None
+
+@pytest.fixture()
+def live_session(test_db):
+    db = TestingSessionLocal()
+    user = models.User(email="lifter@example.com", username="lifter", hashed_password="dummyhash")
+    squat = models.Exercise(title="Squat", category="Strength", difficulty="Intermediate")
+    db.add_all([user, squat])
+    db.commit()
+    template = models.WorkoutTemplate(title="Leg Day", user_id=user.id)
+    db.add(template)
+    db.commit()
+    session = models.WorkoutSession(template_id=template.id, user_id=user.id, start_time=datetime(2024, 3, 4, 18))
+    db.add(session)
+    db.commit()
+    yield {"session_id": session.id, "exercise_id": squat.id, "user_id": user.id}
+    db.close()
+
+def _sets(session_id):
+    db = TestingSessionLocal()
+    sets = db.query(models.WorkoutSet).filter(models.WorkoutSet.session_id == session_id).all()
+    db.close()
+    return sets
+
+def test_live_updates_are_broadcast_and_coalesced(live_client, live_session):
+    session_id, exercise_id = live_session["session_id"], live_session["exercise_id"]
+    with live_client.websocket_connect(f"/workout-tracking/{session_id}/live") as phone:
+        with live_client.websocket_connect(f"/workout-tracking/{session_id}/live") as watch:
+            phone.send_json({"exercise_id": exercise_id, "set_number": 1, "reps": 5})
+            phone.send_json({"exercise_id": exercise_id, "set_number": 1, "weight": 100.0, "completed": True})
+            for device in (phone, watch):
+                assert device.receive_json() == {
+                    "type": "set", "set": {"exercise_id": exercise_id, "set_number": 1, "reps": 5}
+                }
+                assert device.receive_json()["set"]["completed"] is True
+            # Nothing is written per message
+            assert _sets(session_id) == []
+
+            live_client.portal.call(live.channels._channels[session_id].flush)
+            for device in (phone, watch):
+                assert device.receive_json() == {"type": "flushed", "sets": 1}
+
+    [workout_set] = _sets(session_id)
+    assert (workout_set.set_number, workout_set.reps, workout_set.weight, workout_set.completed) == (1, 5, 100.0, True)
+    db = TestingSessionLocal()
+    assert db.query(models.UserWeeklyStats).one().volume == 500.0
+    db.close()
+
+def test_live_updates_flush_in_batches(live_client, live_session, monkeypatch):
+    monkeypatch.setattr(live, "LIVE_FLUSH_MAX_PENDING", 2)
+    session_id, exercise_id = live_session["session_id"], live_session["exercise_id"]
+    with live_client.websocket_connect(f"/workout-tracking/{session_id}/live") as websocket:
+        for set_number in (1, 2):
+            websocket.send_json({"exercise_id": exercise_id, "set_number": set_number, "reps": 8})
+        assert [websocket.receive_json()["type"] for _ in range(3)] == ["set", "set", "flushed"]
+        assert sorted(workout_set.set_number for workout_set in _sets(session_id)) == [1, 2]
+
+        # Later updates of the same sets update the rows instead of adding new ones
+        websocket.send_json({"exercise_id": exercise_id, "set_number": 2, "reps": 6})
+        websocket.send_json({"exercise_id": 9999, "set_number": 1, "reps": 6})
+        assert [websocket.receive_json()["type"] for _ in range(3)] == ["set", "set", "flushed"]
+    assert sorted((workout_set.set_number, workout_set.reps) for workout_set in _sets(session_id)) == [(1, 8), (2, 6)]
+
+def test_live_rejects_invalid_messages_and_unknown_sessions(live_client, live_session):
+    with live_client.websocket_connect(f"/workout-tracking/{live_session['session_id']}/live") as websocket:
+        websocket.send_json({"set_number": 1})
+        message = websocket.receive_json()
+        assert message["type"] == "error" and "exercise_id" in message["detail"]
+
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with live_client.websocket_connect("/workout-tracking/9999/live") as websocket:
+            websocket.receive_json()
+    assert exc_info.value.code == 1008
+
+def test_in_process_broker_drops_slow_subscribers():
+    async def scenario():
+        broker = live.InProcessBroker()
+        fast = broker.subscribe(1)
+        slow = live.Subscription(1, max_size=2)
+        broker._subscriptions[1].add(slow)
+        other_session = broker.subscribe(2)
+
+        for number in range(3):
+            await broker.publish(1, {"number": number})
+            await fast.queue.get()
+
+        assert slow.overflowed and slow.queue.qsize() == 2
+        assert not fast.overflowed
+        assert other_session.queue.empty()
+
+        broker.unsubscribe(fast)
+        broker.unsubscribe(slow)
+        assert 1 not in broker._subscriptions
+
+    asyncio.run(scenario())
+
+def test_last_connection_leaving_flushes_pending_updates(live_session):
+    session_id, exercise_id = live_session["session_id"], live_session["exercise_id"]
+
+    async def scenario():
+        registry = live.ChannelRegistry()
+        first = registry.join(session_id, TestingSessionLocal)
+        second = registry.join(session_id, TestingSessionLocal)
+        assert first is second
+        await first.add((exercise_id, 1), {"reps": 10})
+        await registry.leave(first)
+        assert _sets(session_id) == []
+        await registry.leave(second)
+
+    asyncio.run(scenario())
+    assert [(workout_set.set_number, workout_set.reps) for workout_set in _sets(session_id)] == [(1, 10)]
+
+def test_failed_flush_keeps_updates_for_the_next_one(live_session, monkeypatch):
+    session_id, exercise_id = live_session["session_id"], live_session["exercise_id"]
+    write_set_updates = live.write_set_updates
+
+    async def scenario():
+        channel = live.Channel(session_id, TestingSessionLocal)
+        subscription = live.get_broker().subscribe(session_id)
+
+        def failing_write(session_factory, session_id, updates):
+            # A newer update of the same set arrives while the batch is being written
+            channel.pending[(exercise_id, 1)] = {"reps": 6}
+            raise RuntimeError("database unavailable")
+
+        monkeypatch.setattr(live, "write_set_updates", failing_write)
+        await channel.add((exercise_id, 1), {"reps": 5, "weight": 100.0})
+        await channel.flush()
+        assert (await subscription.queue.get())["type"] == "error"
+        assert channel.pending == {(exercise_id, 1): {"reps": 6, "weight": 100.0}}
+
+        monkeypatch.setattr(live, "write_set_updates", write_set_updates)
+        await channel.flush()
+        assert await subscription.queue.get() == {"type": "flushed", "sets": 1}
+        live.get_broker().unsubscribe(subscription)
+
+    asyncio.run(scenario())
+    assert [(workout_set.reps, workout_set.weight) for workout_set in _sets(session_id)] == [(6, 100.0)]
+
+def test_edits_of_completed_sets_move_weekly_volume_and_records(live_session):
+    session_id, exercise_id = live_session["session_id"], live_session["exercise_id"]
+
+    def state():
+        db = TestingSessionLocal()
+        volume = db.query(models.UserWeeklyStats.volume).scalar()
+        best = db.query(models.PersonalRecord.value).filter(models.PersonalRecord.kind == "max_weight").scalar()
+        db.close()
+        return volume, best
+
+    live.write_set_updates(TestingSessionLocal, session_id, {(exercise_id, 1): {"reps": 5, "weight": 100.0, "completed": True}})
+    assert state() == (500.0, 100.0)
+
+    # Corrected upwards after completion: the difference is added and the record raised
+    live.write_set_updates(TestingSessionLocal, session_id, {(exercise_id, 1): {"weight": 110.0}})
+    assert state() == (550.0, 110.0)
+
+    # Reopened: its volume is taken back out of the week
+    live.write_set_updates(TestingSessionLocal, session_id, {(exercise_id, 1): {"completed": False}})
+    assert state()[0] == 0.0
@@ -0,0 +1,28 @@
+from datetime import date
+
+from sqlalchemy.dialects import postgresql
+
+from app import models, partitioning
+
+def test_month_arithmetic():
+    assert partitioning.month_start(date(2024, 2, 29)) == date(2024, 2, 1)
+    assert partitioning.add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert partitioning.add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+
+def test_partition_names_round_trip():
+    name = partitioning.partition_name("workout_sets", date(2024, 3, 1))
+    assert name == "workout_sets_2024_03"
+    assert partitioning.parse_partition_month("workout_sets", name) == date(2024, 3, 1)
+    assert partitioning.parse_partition_month("workout_sets", "workout_sets_default") is None
+    assert partitioning.parse_partition_month("workout_sessions", name) is None
+
+def test_partitioned_table_ddl():
+    ddl = partitioning.partitioned_table_ddl(
+        models.WorkoutSet.__table__, "session_start_time", postgresql.dialect()
+    )
+    assert ddl.endswith("PARTITION BY RANGE (session_start_time)")
+    assert "PRIMARY KEY (id, session_start_time)" in ddl
+    assert "session_start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL" in ddl
+    # Foreign keys to regular tables are kept, the one to the partitioned sessions table is not
+    assert "REFERENCES exercises (id)" in ddl
+    assert "REFERENCES workout_sessions" not in ddl
@@ -0,0 +1,180 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import feed, models
+from .conftest import TestingSessionLocal
+
+@pytest.fixture()
+def partners(test_db):
+    db = TestingSessionLocal()
+    users = [
+        models.User(email=f"{name}@example.com", username=name, hashed_password="dummyhash")
+        for name in ("ana", "ben", "cleo", "dan")
+    ]
+    squat = models.Exercise(title="Squat", category="Strength", difficulty="Intermediate")
+    db.add_all(users + [squat])
+    db.commit()
+
+    templates = [models.WorkoutTemplate(title="Leg Day", user_id=user.id) for user in users]
+    db.add_all(templates)
+    db.commit()
+
+    yield {
+        "user_ids": [user.id for user in users],
+        "template_ids": {user.id: template.id for user, template in zip(users, templates)},
+        "exercise_id": squat.id,
+    }
+    db.close()
+
+def _session(user_id, template_id, start_time):
+    db = TestingSessionLocal()
+    session = models.WorkoutSession(template_id=template_id, user_id=user_id, start_time=start_time)
+    db.add(session)
+    db.commit()
+    session_id = session.id
+    db.close()
+    return session_id
+
+def test_add_and_remove_partner(client, partners):
+    ana, ben, _, _ = partners["user_ids"]
+    response = client.post(f"/partners/{ana}/{ben}")
+    assert response.status_code == 200
+    assert [partner["username"] for partner in response.json()] == ["ben"]
+    # Partnerships are mutual and adding twice is harmless
+    assert [partner["id"] for partner in client.post(f"/partners/{ben}/{ana}").json()] == [ana]
+
+    assert client.post(f"/partners/{ana}/{ana}").status_code == 400
+    assert client.post(f"/partners/{ana}/9999").status_code == 404
+
+    assert client.delete(f"/partners/{ben}/{ana}").status_code == 200
+    assert client.get(f"/partners/{ana}").json() == []
+    assert client.delete(f"/partners/{ben}/{ana}").status_code == 404
+
+def test_weekly_leaderboard_from_incremental_aggregates(client, partners):
+    ana, ben, cleo, dan = partners["user_ids"]
+    templates = partners["template_ids"]
+    client.post(f"/partners/{ana}/{ben}")
+    client.post(f"/partners/{ana}/{cleo}")
+
+    # Ana trains twice in the week of Monday 2024-03-04, Ben once with more volume
+    for start_time in (datetime(2024, 3, 4, 7), datetime(2024, 3, 6, 7)):
+        session_id = _session(ana, templates[ana], start_time)
+        response = client.post(f"/workout-tracking/{session_id}/sets", json=[
+            {"exercise_id": partners["exercise_id"], "set_number": 1, "reps": 5, "weight": 100.0, "completed": True},
+        ])
+        assert response.status_code == 200
+        assert response.json()[0]["completed"] is True
+        client.post(f"/workout-tracking/{session_id}/complete")
+
+    session_id = _session(ben, templates[ben], datetime(2024, 3, 10, 20))
+    client.post(f"/workout-tracking/{session_id}/sets", json=[
+        {"exercise_id": partners["exercise_id"], "set_number": set_number, "reps": 10, "weight": 80.0, "completed": True}
+        for set_number in (1, 2)
+    ])
+    client.post(f"/workout-tracking/{session_id}/complete")
+    # Completing again does not count twice
+    client.post(f"/workout-tracking/{session_id}/complete")
+
+    # Dan is not a partner of Ana
+    client.post(f"/workout-tracking/{_session(dan, templates[dan], datetime(2024, 3, 5))}/complete")
+
+    response = client.get(f"/partners/{ana}/leaderboard?week=2024-03-07")
+    assert response.status_code == 200
+    board = response.json()
+    assert board["week_start"] == "2024-03-04"
+    assert [(entry["username"], entry["sessions_completed"], entry["rank"]) for entry in board["entries"]] == [
+        ("ana", 2, 1), ("ben", 1, 2), ("cleo", 0, 3)
+    ]
+
+    board = client.get(f"/partners/{ana}/leaderboard?week=2024-03-04&metric=volume").json()
+    assert [(entry["username"], entry["volume"]) for entry in board["entries"]] == [
+        ("ben", 1600.0), ("ana", 1000.0), ("cleo", 0.0)
+    ]
+
+    assert client.get(f"/partners/{ana}/leaderboard?metric=calories").status_code == 422
+
+def test_streak_counts_consecutive_weeks(client, partners):
+    ana = partners["user_ids"][0]
+    template_id = partners["template_ids"][ana]
+    for start_time in (datetime(2024, 3, 5), datetime(2024, 3, 12), datetime(2024, 3, 13)):
+        client.post(f"/workout-tracking/{_session(ana, template_id, start_time)}/complete")
+
+    entry = client.get(f"/partners/{ana}/leaderboard?week=2024-03-11&metric=streak").json()["entries"][0]
+    assert entry["streak"] == 2
+    # Still alive during the following week until it ends without a session
+    assert client.get(f"/partners/{ana}/leaderboard?week=2024-03-18").json()["entries"][0]["streak"] == 2
+    assert client.get(f"/partners/{ana}/leaderboard?week=2024-03-25").json()["entries"][0]["streak"] == 0
+
+    client.post(f"/workout-tracking/{_session(ana, template_id, datetime(2024, 3, 26))}/complete")
+    db = TestingSessionLocal()
+    stats = db.get(models.UserWeeklyStats, (ana, date(2024, 3, 25)))
+    assert (stats.sessions_completed, stats.streak) == (1, 1)
+    db.close()
+
+def test_log_sets_rejects_unknown_session_or_exercise(client, partners):
+    ana = partners["user_ids"][0]
+    assert client.post("/workout-tracking/9999/sets", json=[]).status_code == 404
+    session_id = _session(ana, partners["template_ids"][ana], datetime(2024, 3, 4))
+    response = client.post(f"/workout-tracking/{session_id}/sets", json=[{"exercise_id": 9999, "set_number": 1}])
+    assert response.status_code == 400
+
+def test_partner_feed_fans_out_workout_events(client, partners):
+    ana, ben, cleo, _ = partners["user_ids"]
+    client.post(f"/partners/{ana}/{ben}")
+    client.post(f"/partners/{cleo}/{ben}")
+
+    session = client.post(f"/workout-tracking/start/{partners['template_ids'][ben]}").json()
+    client.post(f"/workout-tracking/{session['id']}/complete")
+
+    for reader in (ana, cleo):
+        items = client.get(f"/partners/{reader}/feed").json()["items"]
+        assert [(item["actor_id"], item["kind"]) for item in items] == [
+            (ben, "workout_completed"), (ben, "workout_started")
+        ]
+        assert items[1]["details"]["title"] == "Leg Day"
+    # Nobody sees their own events
+    assert client.get(f"/partners/{ben}/feed").json()["items"] == []
+
+def test_partner_feed_keyset_pagination_and_bound(client, partners, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_MAX_ITEMS", 4)
+    ana, ben, _, _ = partners["user_ids"]
+    client.post(f"/partners/{ana}/{ben}")
+    for _ in range(3):
+        client.post(f"/workout-tracking/start/{partners['template_ids'][ben]}")
+    client.post(f"/workout-tracking/start/{partners['template_ids'][ana]}")
+
+    db = TestingSessionLocal()
+    assert db.query(models.FeedItem).filter(models.FeedItem.user_id == ana).count() == 3
+    db.close()
+
+    first = client.get(f"/partners/{ana}/feed?limit=2").json()
+    assert len(first["items"]) == 2 and first["next_before"] == first["items"][-1]["id"]
+    second = client.get(f"/partners/{ana}/feed?limit=2&before={first['next_before']}").json()
+    assert len(second["items"]) == 1 and second["next_before"] is None
+    assert second["items"][0]["id"] < first["items"][-1]["id"]
+
+    for _ in range(3):
+        client.post(f"/workout-tracking/start/{partners['template_ids'][ben]}")
+    db = TestingSessionLocal()
+    kept = [item.event_id for item in db.query(models.FeedItem).filter(models.FeedItem.user_id == ana)]
+    newest = [event.id for event in db.query(models.ActivityEvent).filter(models.ActivityEvent.actor_id == ben)]
+    assert sorted(kept) == sorted(newest)[-4:]
+    db.close()
+
+def test_partner_feed_pulls_events_of_highly_connected_users(client, partners, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_FANOUT_LIMIT", 1)
+    ana, ben, cleo, _ = partners["user_ids"]
+    client.post(f"/partners/{ben}/{ana}")
+    client.post(f"/partners/{ben}/{cleo}")
+    client.post(f"/partners/{cleo}/{ana}")
+
+    # Ben has two partners, over the limit: his events are not fanned out
+    client.post(f"/workout-tracking/start/{partners['template_ids'][ben]}")
+    client.post(f"/workout-tracking/start/{partners['template_ids'][cleo]}")
+    db = TestingSessionLocal()
+    assert db.query(models.FeedItem).count() == 0
+    db.close()
+
+    items = client.get(f"/partners/{ana}/feed").json()["items"]
+    assert [item["actor_id"] for item in items] == [cleo, ben]
@@ -0,0 +1,99 @@
+"""
+Query plan regression tests.
+
+Every SQL statement issued by the hot router endpoints is captured and run
+through EXPLAIN QUERY PLAN against seeded data. A plain full scan of one of
+the indexed tables means an index stopped matching the query.
+"""
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, text
+
+from app import models
+from .conftest import TestingSessionLocal, engine
+
+# Tables that must always be reached through an index by the queries below
+INDEXED_TABLES = {
+    "workout_sessions",
+    "workout_sets",
+    "workout_templates",
+    "workout_template_exercises",
+}
+
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+@pytest.fixture()
+def seeded_db(test_db):
+    db = TestingSessionLocal()
+    users = [
+        models.User(email=f"user{i}@example.com", username=f"user{i}", hashed_password="dummyhash")
+        for i in range(5)
+    ]
+    exercises = [models.Exercise(title=f"Exercise {i}", category="Strength") for i in range(20)]
+    db.add_all(users + exercises)
+    db.commit()
+
+    start = datetime(2024, 1, 1, 7, 0)
+    for user in users:
+        template = models.WorkoutTemplate(title=f"Plan {user.id}", user_id=user.id)
+        for order, exercise in enumerate(exercises[:4], start=1):
+            template.exercises.append(models.WorkoutExercise(exercise_id=exercise.id, sets=3, reps=8, order=order))
+        db.add(template)
+        db.flush()
+        for day in range(40):
+            session = models.WorkoutSession(
+                template_id=template.id,
+                user_id=user.id,
+                start_time=start + timedelta(days=day),
+                completed=day % 3 != 0
+            )
+            for set_number, exercise in enumerate(exercises[day % 10:day % 10 + 4], start=1):
+                session.sets.append(models.WorkoutSet(exercise_id=exercise.id, set_number=set_number, reps=8))
+            db.add(session)
+    db.commit()
+    db.execute(text("ANALYZE"))
+    db.commit()
+
+    yield {"user_id": users[0].id, "template_id": users[0].workout_templates[0].id}
+    db.close()
+
+@pytest.fixture()
+def captured_queries():
+    queries = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "WITH", "INSERT INTO WORKOUT_SETS")):
+            queries.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    yield queries
+    event.remove(engine, "before_cursor_execute", capture)
+
+def full_scans(statement, parameters):
+    with engine.connect() as connection:
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    scanned = set()
+    for row in plan:
+        match = FULL_SCAN.match(row[-1])
+        if match and match.group(1) in INDEXED_TABLES:
+            scanned.add(match.group(1))
+    return scanned
+
+@pytest.mark.parametrize("method, path", [
+    ("get", "/workout-tracking/history?user_id={user_id}"),
+    ("get", "/workout-tracking/history?user_id={user_id}&completed=true"),
+    ("get", "/workout-tracking/stats?user_id={user_id}"),
+    ("get", "/workout-tracking/export?user_id={user_id}"),
+    ("get", "/workout-templates/?user_id={user_id}"),
+    ("get", "/workout-templates/{template_id}"),
+    ("post", "/workout-tracking/start/{template_id}?prefill=true"),
+])
+def test_router_queries_use_indexes(client, seeded_db, captured_queries, method, path):
+    response = getattr(client, method)(path.format(**seeded_db))
+    assert response.status_code == 200
+    assert captured_queries
+
+    for statement, parameters in captured_queries:
+        assert not full_scans(statement, parameters), f"Full table scan in plan for:\n{statement}"
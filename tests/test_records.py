@@ -0,0 +1,154 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import update
+
+from app import models, records
+from .conftest import TestingSessionLocal
+
+@pytest.fixture()
+def lifter(test_db):
+    db = TestingSessionLocal()
+    users = [
+        models.User(email=f"{name}@example.com", username=name, hashed_password="dummyhash")
+        for name in ("ana", "ben")
+    ]
+    squat = models.Exercise(title="Squat", category="Strength", difficulty="Intermediate")
+    rower = models.Exercise(title="Rowing Machine", category="Cardio", difficulty="Beginner")
+    db.add_all(users + [squat, rower])
+    db.commit()
+    template = models.WorkoutTemplate(title="Leg Day", user_id=users[0].id)
+    db.add(template)
+    db.commit()
+    yield {
+        "user_id": users[0].id,
+        "partner_id": users[1].id,
+        "template_id": template.id,
+        "squat_id": squat.id,
+        "rower_id": rower.id,
+    }
+    db.close()
+
+def _log(client, lifter, start_time, sets):
+    db = TestingSessionLocal()
+    session = models.WorkoutSession(template_id=lifter["template_id"], user_id=lifter["user_id"], start_time=start_time)
+    db.add(session)
+    db.commit()
+    session_id = session.id
+    db.close()
+    response = client.post(f"/workout-tracking/{session_id}/sets", json=sets)
+    assert response.status_code == 200
+    return session_id
+
+def _records(client, user_id, **params):
+    response = client.get("/workout-tracking/records", params={"user_id": user_id, **params})
+    assert response.status_code == 200
+    return {(record["kind"], record["at_weight"]): record for record in response.json()}
+
+def test_estimated_1rm():
+    assert records.estimated_1rm(100.0, 1) == 100.0
+    assert records.estimated_1rm(100.0, 5) == 116.67
+
+def test_records_updated_as_sets_are_logged(client, lifter):
+    squat = lifter["squat_id"]
+    first = _log(client, lifter, datetime(2024, 3, 4), [
+        {"exercise_id": squat, "set_number": 1, "reps": 5, "weight": 100.0, "completed": True},
+        {"exercise_id": squat, "set_number": 2, "reps": 8, "weight": 90.0, "completed": True},
+        {"exercise_id": squat, "set_number": 3, "reps": 12, "weight": 120.0, "completed": False},
+        {"exercise_id": lifter["rower_id"], "set_number": 1, "duration": 600, "distance": 2000.0, "completed": True},
+    ])
+    squat_records = _records(client, lifter["user_id"], exercise_id=squat)
+    assert {key: record["value"] for key, record in squat_records.items()} == {
+        ("max_weight", 0.0): 100.0,
+        ("max_reps", 100.0): 5,
+        ("max_reps", 90.0): 8,
+        ("estimated_1rm", 0.0): 116.67,
+    }
+    assert all(record["session_id"] == first for record in squat_records.values())
+    assert set(_records(client, lifter["user_id"], exercise_id=lifter["rower_id"])) == {
+        ("max_duration", 0.0), ("max_distance", 0.0)
+    }
+
+    second = _log(client, lifter, datetime(2024, 3, 6), [
+        {"exercise_id": squat, "set_number": 1, "reps": 3, "weight": 105.0, "completed": True},
+        {"exercise_id": squat, "set_number": 2, "reps": 8, "weight": 90.0, "completed": True},
+    ])
+    squat_records = _records(client, lifter["user_id"], exercise_id=squat)
+    assert squat_records[("max_weight", 0.0)]["value"] == 105.0
+    assert squat_records[("max_weight", 0.0)]["previous_value"] == 100.0
+    # Equalling a record does not take it over
+    assert squat_records[("max_reps", 90.0)]["session_id"] == first
+
+    response = client.get(f"/workout-tracking/{second}/records")
+    assert [(record["kind"], record["at_weight"]) for record in response.json()] == [
+        ("max_reps", 105.0), ("max_weight", 0.0)
+    ]
+    assert client.get("/workout-tracking/9999/records").status_code == 404
+
+def test_beaten_records_are_published_to_partners(client, lifter):
+    client.post(f"/partners/{lifter['user_id']}/{lifter['partner_id']}")
+    squat = lifter["squat_id"]
+    _log(client, lifter, datetime(2024, 3, 4), [{"exercise_id": squat, "set_number": 1, "reps": 5, "weight": 100.0, "completed": True}])
+    # First records of an exercise are not announced
+    assert client.get(f"/partners/{lifter['partner_id']}/feed").json()["items"] == []
+
+    _log(client, lifter, datetime(2024, 3, 6), [{"exercise_id": squat, "set_number": 1, "reps": 5, "weight": 110.0, "completed": True}])
+    items = client.get(f"/partners/{lifter['partner_id']}/feed").json()["items"]
+    assert [item["kind"] for item in items] == ["personal_record"]
+    assert {(record["kind"], record["value"], record["previous_value"]) for record in items[0]["details"]["records"]} == {
+        ("max_weight", 110.0, 100.0), ("estimated_1rm", 128.33, 116.67)
+    }
+
+def test_records_beaten_concurrently_are_not_reported(client, lifter, monkeypatch):
+    squat = lifter["squat_id"]
+    _log(client, lifter, datetime(2024, 3, 4), [{"exercise_id": squat, "set_number": 1, "reps": 5, "weight": 100.0, "completed": True}])
+
+    upsert = records._upsert
+
+    def upsert_after_concurrent_write(db):
+        # Another request sets a better record between the read and the upsert
+        db.execute(
+            update(models.PersonalRecord)
+            .where(models.PersonalRecord.kind == records.MAX_WEIGHT)
+            .values(value=120.0, previous_value=100.0)
+        )
+        return upsert(db)
+
+    monkeypatch.setattr(records, "_upsert", upsert_after_concurrent_write)
+    db = TestingSessionLocal()
+    session = models.WorkoutSession(template_id=lifter["template_id"], user_id=lifter["user_id"], start_time=datetime(2024, 3, 6))
+    db.add(session)
+    db.flush()
+    workout_set = models.WorkoutSet(session_id=session.id, exercise_id=squat, set_number=1, reps=3, weight=110.0, completed=True)
+    db.add(workout_set)
+    written = records.record_sets(db, session, [workout_set])
+    db.commit()
+    # The max weight record was not written, so it is neither returned nor announced
+    assert [(record["kind"], record["at_weight"], record["previous_value"]) for record in written] == [
+        ("estimated_1rm", 0.0, 116.67), ("max_reps", 110.0, None)
+    ]
+    [event] = db.query(models.ActivityEvent).filter(models.ActivityEvent.kind == "personal_record")
+    assert [record["kind"] for record in event.details["records"]] == ["estimated_1rm"]
+    db.close()
+    assert _records(client, lifter["user_id"], exercise_id=squat)[("max_weight", 0.0)]["value"] == 120.0
+
+def test_rebuild_matches_incremental_records(client, lifter):
+    squat = lifter["squat_id"]
+    for day, weight in ((4, 100.0), (6, 95.0), (8, 102.5)):
+        _log(client, lifter, datetime(2024, 3, day), [
+            {"exercise_id": squat, "set_number": 1, "reps": 5, "weight": weight, "completed": True},
+            {"exercise_id": lifter["rower_id"], "set_number": 1, "distance": 1000.0 * day, "completed": True},
+        ])
+    incremental = _records(client, lifter["user_id"])
+
+    db = TestingSessionLocal()
+    db.query(models.PersonalRecord).delete()
+    db.commit()
+    assert records.rebuild(db) == len(incremental)
+    db.close()
+    assert _records(client, lifter["user_id"]) == incremental
+
+    db = TestingSessionLocal()
+    assert records.rebuild(db, user_id=lifter["partner_id"]) == 0
+    db.close()
+    assert _records(client, lifter["user_id"]) == incremental
@@ -0,0 +1,50 @@
+import logging
+
+import pytest
+
+from app import cache, live, server
+
+def test_cgroup_v2_cpu_quota(tmp_path):
+    (tmp_path / "cpu.max").write_text("50000 100000\n")
+    assert server.cgroup_cpu_quota(tmp_path) == 0.5
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert server.cgroup_cpu_quota(tmp_path) is None
+
+def test_cgroup_v1_cpu_quota(tmp_path):
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("150000\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert server.cgroup_cpu_quota(tmp_path) == 1.5
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("-1\n")
+    assert server.cgroup_cpu_quota(tmp_path) is None
+
+def test_worker_count_from_cpu_quota(monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.setattr(server, "per_process_backends", lambda: [])
+    monkeypatch.setattr(server, "cgroup_cpu_quota", lambda: 0.5)
+    assert server.worker_count() == 1
+    monkeypatch.setattr(server, "cgroup_cpu_quota", lambda: 64)
+    monkeypatch.setattr(server.os, "cpu_count", lambda: 64)
+    assert server.worker_count() == server.MAX_WORKERS
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert server.worker_count() == 3
+
+def test_one_worker_on_per_process_backends(monkeypatch, caplog):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.setattr(server, "cgroup_cpu_quota", lambda: 4)
+    monkeypatch.setattr(server.os, "cpu_count", lambda: 4)
+    monkeypatch.setattr(cache, "CACHE_BACKEND", "memory")
+    assert server.per_process_backends() == ["CACHE_BACKEND=memory", "the in-process live broker"]
+    assert server.worker_count() == 1
+    server.check_workers(1)
+    with pytest.raises(RuntimeError, match="CACHE_BACKEND=memory"):
+        server.check_workers(4)
+
+    # Shared backends allow several workers; the limits stay per worker
+    monkeypatch.setattr(cache, "CACHE_BACKEND", "redis")
+    monkeypatch.setattr(live, "_broker", live.Broker())
+    assert server.per_process_backends() == []
+    assert server.worker_count() > 1
+    with caplog.at_level(logging.WARNING, logger=server.__name__):
+        server.check_workers(4)
+    assert "enforced per worker" in caplog.records[0].getMessage()
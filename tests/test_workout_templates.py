@@ -0,0 +1,210 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from app import models
+from .conftest import TestingSessionLocal, engine
+
+@pytest.fixture()
+def sample_catalog(test_db):
+    db = TestingSessionLocal()
+    user = models.User(email="coach@example.com", username="coach", hashed_password="dummyhash")
+    exercises = [
+        models.Exercise(title="Bench Press", category="Strength", difficulty="Intermediate"),
+        models.Exercise(title="Barbell Row", category="Strength", difficulty="Intermediate"),
+        models.Exercise(title="Plank", category="Strength", difficulty="Beginner"),
+    ]
+    db.add(user)
+    db.add_all(exercises)
+    db.commit()
+
+    yield {"user_id": user.id, "exercise_ids": [exercise.id for exercise in exercises]}
+    db.close()
+
+def template_payload(user_id, exercise_ids, title="Upper Body"):
+    return {
+        "title": title,
+        "user_id": user_id,
+        "difficulty": "Intermediate",
+        "exercises": [
+            {"exercise_id": exercise_id, "sets": 3, "reps": 8, "weight": 60.0}
+            for exercise_id in exercise_ids
+        ],
+    }
+
+def test_create_template_with_exercises(client, sample_catalog):
+    payload = template_payload(sample_catalog["user_id"], sample_catalog["exercise_ids"])
+    payload["exercises"][0]["order"] = 5
+
+    response = client.post("/workout-templates/", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["title"] == "Upper Body"
+    assert [exercise["order"] for exercise in data["exercises"]] == [2, 3, 5]
+    assert data["exercises"][-1]["exercise"]["title"] == "Bench Press"
+
+def test_create_template_with_unknown_exercise_creates_nothing(client, sample_catalog):
+    payload = template_payload(sample_catalog["user_id"], sample_catalog["exercise_ids"] + [999])
+
+    response = client.post("/workout-templates/", json=payload)
+    assert response.status_code == 400
+    assert "999" in response.json()["detail"]
+
+    db = TestingSessionLocal()
+    try:
+        assert db.query(models.WorkoutTemplate).count() == 0
+        assert db.query(models.WorkoutExercise).count() == 0
+    finally:
+        db.close()
+
+def test_import_templates(client, sample_catalog):
+    user_id = sample_catalog["user_id"]
+    exercise_ids = sample_catalog["exercise_ids"]
+    payload = [
+        template_payload(user_id, exercise_ids[:2], title="Day A"),
+        template_payload(user_id, exercise_ids[1:], title="Day B"),
+        template_payload(user_id, [], title="Rest Day"),
+    ]
+
+    response = client.post("/workout-templates/import", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert [template["title"] for template in data] == ["Day A", "Day B", "Rest Day"]
+    assert [len(template["exercises"]) for template in data] == [2, 2, 0]
+
+@pytest.fixture()
+def statement_log():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
+
+def test_patch_single_field_writes_one_exercise_row(client, sample_catalog, statement_log):
+    payload = template_payload(sample_catalog["user_id"], sample_catalog["exercise_ids"])
+    template = client.post("/workout-templates/", json=payload).json()
+    exercises = [{"id": exercise["id"]} for exercise in template["exercises"]]
+    exercises[1]["sets"] = 5
+    statement_log.clear()
+
+    response = client.patch(
+        f"/workout-templates/{template['id']}",
+        json={"version": template["version"], "exercises": exercises}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["version"] == template["version"] + 1
+    assert [exercise["sets"] for exercise in data["exercises"]] == [3, 5, 3]
+
+    writes = [statement for statement in statement_log if statement.startswith(("INSERT", "UPDATE", "DELETE"))]
+    assert len([statement for statement in writes if "workout_template_exercises" in statement]) == 1
+    assert not any(statement.startswith(("INSERT", "DELETE")) for statement in writes)
+
+def test_patch_adds_and_removes_exercises(client, sample_catalog):
+    exercise_ids = sample_catalog["exercise_ids"]
+    template = client.post(
+        "/workout-templates/", json=template_payload(sample_catalog["user_id"], exercise_ids[:2])
+    ).json()
+    kept = template["exercises"][0]
+
+    response = client.patch(
+        f"/workout-templates/{template['id']}",
+        json={
+            "version": template["version"],
+            "title": "Renamed",
+            "exercises": [{"id": kept["id"]}, {"exercise_id": exercise_ids[2], "sets": 2, "order": 3}],
+        }
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["title"] == "Renamed"
+    assert data["description"] == template["description"]
+    assert [exercise["exercise_id"] for exercise in data["exercises"]] == [exercise_ids[0], exercise_ids[2]]
+
+def test_patch_with_stale_version_conflicts(client, sample_catalog):
+    template = client.post(
+        "/workout-templates/", json=template_payload(sample_catalog["user_id"], sample_catalog["exercise_ids"])
+    ).json()
+    first = client.patch(f"/workout-templates/{template['id']}", json={"version": template["version"], "title": "A"})
+    assert first.status_code == 200
+
+    second = client.patch(f"/workout-templates/{template['id']}", json={"version": template["version"], "title": "B"})
+    assert second.status_code == 409
+
+def test_put_replaces_template(client, sample_catalog):
+    exercise_ids = sample_catalog["exercise_ids"]
+    template = client.post(
+        "/workout-templates/", json=template_payload(sample_catalog["user_id"], exercise_ids)
+    ).json()
+
+    response = client.put(
+        f"/workout-templates/{template['id']}",
+        json=template_payload(sample_catalog["user_id"], exercise_ids[::-1], title="Reversed")
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["title"] == "Reversed"
+    assert [exercise["exercise_id"] for exercise in data["exercises"]] == exercise_ids[::-1]
+
+def test_expanded_template_with_last_performance(client, sample_catalog):
+    user_id = sample_catalog["user_id"]
+    bench, row, plank = sample_catalog["exercise_ids"]
+    template = client.post("/workout-templates/", json=template_payload(user_id, [bench, row, plank])).json()
+
+    db = TestingSessionLocal()
+    older = models.WorkoutSession(template_id=template["id"], user_id=user_id, start_time=datetime(2024, 3, 4))
+    newer = models.WorkoutSession(template_id=template["id"], user_id=user_id, start_time=datetime(2024, 3, 6))
+    db.add_all([older, newer])
+    db.flush()
+    db.add_all([
+        models.WorkoutSet(session_id=older.id, exercise_id=bench, set_number=1, reps=8, weight=60.0, completed=True),
+        models.WorkoutSet(session_id=older.id, exercise_id=row, set_number=1, reps=10, weight=50.0, completed=True),
+        models.WorkoutSet(session_id=newer.id, exercise_id=bench, set_number=2, reps=6, weight=65.0, completed=True),
+        models.WorkoutSet(session_id=newer.id, exercise_id=bench, set_number=1, reps=8, weight=62.5, completed=True),
+    ])
+    db.commit()
+    newer_id, older_id = newer.id, older.id
+    db.close()
+
+    response = client.get(f"/workout-templates/{template['id']}/expanded")
+    assert response.status_code == 200
+    exercises = response.json()["exercises"]
+    assert [exercise["exercise"]["title"] for exercise in exercises] == ["Bench Press", "Barbell Row", "Plank"]
+
+    bench_performance, row_performance, plank_performance = (exercise["last_performance"] for exercise in exercises)
+    assert bench_performance["session_id"] == newer_id
+    assert [(s["set_number"], s["weight"]) for s in bench_performance["sets"]] == [(1, 62.5), (2, 65.0)]
+    # The last session with a row was the older one
+    assert row_performance["session_id"] == older_id
+    assert plank_performance is None
+
+    # Someone else training with the template has no history yet
+    other = client.get(f"/workout-templates/{template['id']}/expanded?user_id=9999").json()
+    assert all(exercise["last_performance"] is None for exercise in other["exercises"])
+    assert client.get("/workout-templates/9999/expanded").status_code == 404
+
+def test_expanded_template_breaks_ties_on_start_time(client, sample_catalog):
+    user_id = sample_catalog["user_id"]
+    bench = sample_catalog["exercise_ids"][0]
+    template = client.post("/workout-templates/", json=template_payload(user_id, [bench])).json()
+
+    db = TestingSessionLocal()
+    first = models.WorkoutSession(template_id=template["id"], user_id=user_id, start_time=datetime(2024, 3, 6))
+    second = models.WorkoutSession(template_id=template["id"], user_id=user_id, start_time=datetime(2024, 3, 6))
+    db.add_all([first, second])
+    db.flush()
+    db.add_all([
+        models.WorkoutSet(session_id=first.id, exercise_id=bench, set_number=1, reps=8, weight=60.0, completed=True),
+        models.WorkoutSet(session_id=second.id, exercise_id=bench, set_number=1, reps=5, weight=70.0, completed=True),
+    ])
+    db.commit()
+    second_id = second.id
+    db.close()
+
+    [exercise] = client.get(f"/workout-templates/{template['id']}/expanded").json()["exercises"]
+    assert exercise["last_performance"]["session_id"] == second_id
+    assert [s["weight"] for s in exercise["last_performance"]["sets"]] == [70.0]
@@ -0,0 +1,121 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from app import models
+from .conftest import TestingSessionLocal
+
+@pytest.fixture()
+def sample_sessions(test_db):
+    db = TestingSessionLocal()
+    user = models.User(email="lifter@example.com", username="lifter", hashed_password="dummyhash")
+    other_user = models.User(email="runner@example.com", username="runner", hashed_password="dummyhash")
+    squat = models.Exercise(title="Squat", category="Strength", difficulty="Intermediate")
+    db.add_all([user, other_user, squat])
+    db.commit()
+
+    template = models.WorkoutTemplate(title="Leg Day", user_id=user.id)
+    template.exercises.append(models.WorkoutExercise(exercise_id=squat.id, sets=3, reps=5, weight=100.0, order=1))
+    db.add(template)
+    db.commit()
+
+    session = models.WorkoutSession(
+        template_id=template.id,
+        user_id=user.id,
+        start_time=datetime(2024, 3, 1, 18, 0),
+        completed=True
+    )
+    for set_number in range(1, 4):
+        session.sets.append(models.WorkoutSet(exercise_id=squat.id, set_number=set_number, reps=5, weight=100.0))
+    other_session = models.WorkoutSession(
+        template_id=template.id,
+        user_id=other_user.id,
+        start_time=datetime(2024, 3, 2, 18, 0)
+    )
+    db.add_all([session, other_session])
+    db.commit()
+
+    yield {"user_id": user.id, "other_user_id": other_user.id, "template_id": template.id, "exercise_id": squat.id}
+    db.close()
+
+def test_export_csv_flattens_sessions_and_sets(client, sample_sessions):
+    response = client.get("/workout-tracking/export?format=csv")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    # Three sets for the first session plus one line for the session without sets
+    assert len(rows) == 4
+    assert [row["set_number"] for row in rows[:3]] == ["1", "2", "3"]
+    assert rows[3]["set_id"] == ""
+
+def test_export_ndjson_gzip_for_user(client, sample_sessions):
+    response = client.get(f"/workout-tracking/export?format=ndjson&gzip=true&user_id={sample_sessions['user_id']}")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    lines = gzip.decompress(response.content).decode("utf-8").splitlines()
+    records = [json.loads(line) for line in lines]
+    assert len(records) == 3
+    assert all(record["user_id"] == sample_sessions["user_id"] for record in records)
+    assert records[0]["start_time"] == "2024-03-01T18:00:00"
+
+def test_export_range_keeps_sets_with_earlier_timestamps(client, sample_sessions):
+    db = TestingSessionLocal()
+    session = db.query(models.WorkoutSession).filter(models.WorkoutSession.user_id == sample_sessions["user_id"]).one()
+    # Imported with a timestamp from before its session's start
+    session.sets.append(models.WorkoutSet(
+        exercise_id=sample_sessions["exercise_id"], set_number=4, reps=5, weight=100.0, created_at=datetime(2024, 2, 1)
+    ))
+    db.commit()
+    db.close()
+
+    response = client.get("/workout-tracking/export?format=csv&start=2024-03-01T00:00:00&end=2024-03-02T00:00:00")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["set_number"] for row in rows] == ["1", "2", "3", "4"]
+
+def test_export_rejects_unknown_format(client, sample_sessions):
+    response = client.get("/workout-tracking/export?format=xml")
+    assert response.status_code == 422
+
+def test_start_workout_prefills_planned_sets(client, sample_sessions):
+    db = TestingSessionLocal()
+    try:
+        plank = models.Exercise(title="Plank", category="Strength", difficulty="Beginner")
+        db.add(plank)
+        db.commit()
+        db.add(models.WorkoutExercise(
+            template_id=sample_sessions["template_id"], exercise_id=plank.id, sets=2, duration=60, order=0
+        ))
+        db.commit()
+        plank_id = plank.id
+    finally:
+        db.close()
+
+    response = client.post(f"/workout-tracking/start/{sample_sessions['template_id']}?prefill=true")
+    assert response.status_code == 200
+    sets = response.json()["sets"]
+    assert [(s["exercise_id"], s["set_number"]) for s in sets] == [
+        (plank_id, 1), (plank_id, 2),
+        (sample_sessions["exercise_id"], 1), (sample_sessions["exercise_id"], 2), (sample_sessions["exercise_id"], 3),
+    ]
+    assert sets[0]["duration"] == 60
+    assert sets[2]["reps"] == 5 and sets[2]["weight"] == 100.0
+    assert not any(s["completed"] for s in sets)
+
+def test_start_workout_without_prefill_has_no_sets(client, sample_sessions):
+    response = client.post(f"/workout-tracking/start/{sample_sessions['template_id']}")
+    assert response.status_code == 200
+    assert response.json()["sets"] == []
+
+def test_history_date_range(client, sample_sessions):
+    response = client.get("/workout-tracking/history?start=2024-03-02T00:00:00&end=2024-04-01T00:00:00")
+    assert response.status_code == 200
+    sessions = response.json()
+    assert [session["user_id"] for session in sessions] == [sample_sessions["other_user_id"]]
+
+    stats = client.get("/workout-tracking/stats?start=2024-03-01T00:00:00&end=2024-03-02T00:00:00").json()
+    assert stats["total_sessions"] == 1
+    assert stats["completed_sessions"] == 1
@@ -0,0 +1,102 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+from app import models, write_behind
+from .conftest import TestingSessionLocal
+
+@pytest.fixture()
+def session_data(test_db):
+    db = TestingSessionLocal()
+    user = models.User(email="ana@example.com", username="ana", hashed_password="dummyhash")
+    squat = models.Exercise(title="Squat", category="Strength", difficulty="Intermediate")
+    db.add_all([user, squat])
+    db.commit()
+    template = models.WorkoutTemplate(title="Leg Day", user_id=user.id)
+    db.add(template)
+    db.commit()
+    session = models.WorkoutSession(template_id=template.id, user_id=user.id, start_time=datetime(2024, 3, 4, 7))
+    db.add(session)
+    db.commit()
+    yield {"user_id": user.id, "session_id": session.id, "exercise_id": squat.id}
+    db.close()
+
+@pytest.fixture()
+def buffer(monkeypatch):
+    buffer = write_behind.SetWriteBuffer(TestingSessionLocal, flush_interval=0.05)
+    monkeypatch.setattr(write_behind, "set_buffer", buffer)
+    monkeypatch.setattr(write_behind, "SET_WRITE_BEHIND", True)
+    yield buffer
+    buffer.close()
+
+def _rows(session_id, exercise_id, set_numbers, weight=100.0):
+    return [
+        {"session_id": session_id, "exercise_id": exercise_id, "set_number": set_number,
+         "reps": 5, "weight": weight, "completed": True, "created_at": datetime.utcnow()}
+        for set_number in set_numbers
+    ]
+
+def test_log_sets_through_write_behind_buffer(client, session_data, buffer):
+    session_id = session_data["session_id"]
+    response = client.post(f"/workout-tracking/{session_id}/sets", json=[
+        {"exercise_id": session_data["exercise_id"], "set_number": set_number, "reps": 5, "weight": 100.0, "completed": True}
+        for set_number in (1, 2)
+    ])
+    assert response.status_code == 200
+    body = response.json()
+    assert [workout_set["set_number"] for workout_set in body] == [1, 2]
+    assert all(workout_set["id"] and workout_set["completed"] for workout_set in body)
+
+    # Acknowledged sets are committed, together with the weekly volume
+    db = TestingSessionLocal()
+    assert db.query(models.WorkoutSet).filter(models.WorkoutSet.session_id == session_id).count() == 2
+    assert db.query(models.UserWeeklyStats).one().volume == 1000.0
+    db.close()
+
+    assert client.get("/metrics").json()["set_buffer"]["sets_written"] == 2
+    assert client.post("/workout-tracking/9999/sets", json=[]).status_code == 404
+
+def test_concurrent_writes_share_one_commit(session_data, buffer):
+    session_id, exercise_id = session_data["session_id"], session_data["exercise_id"]
+    futures = [buffer.submit(session_id, _rows(session_id, exercise_id, [set_number])) for set_number in range(1, 6)]
+    written = [future.result(timeout=5) for future in futures]
+
+    assert [[workout_set.set_number for workout_set in sets] for sets in written] == [[1], [2], [3], [4], [5]]
+    stats = buffer.stats()
+    assert stats["batches"] == 1 and stats["last_batch_size"] == 5
+    assert (stats["requests_written"], stats["sets_written"], stats["queue_depth"]) == (5, 5, 0)
+
+def test_failed_write_does_not_fail_its_batch(session_data, buffer):
+    session_id, exercise_id = session_data["session_id"], session_data["exercise_id"]
+    good = buffer.submit(session_id, _rows(session_id, exercise_id, [1]))
+    bad = buffer.submit(9999, _rows(9999, exercise_id, [1]))
+
+    assert len(good.result(timeout=5)) == 1
+    with pytest.raises(LookupError):
+        bad.result(timeout=5)
+    assert buffer.stats()["failures"] == 1
+
+def test_full_buffer_refuses_and_close_drains(session_data):
+    session_id, exercise_id = session_data["session_id"], session_data["exercise_id"]
+    release = threading.Event()
+
+    def blocked_session():
+        release.wait(5)
+        return TestingSessionLocal()
+
+    buffer = write_behind.SetWriteBuffer(blocked_session, max_pending=1, batch_size=1, flush_interval=0)
+    first = buffer.submit(session_id, _rows(session_id, exercise_id, [1]))
+    # Wait until the writer holds the first request, then fill the queue
+    while buffer.stats()["queue_depth"]:
+        pass
+    second = buffer.submit(session_id, _rows(session_id, exercise_id, [2]))
+    with pytest.raises(write_behind.BufferFull):
+        buffer.submit(session_id, _rows(session_id, exercise_id, [3]))
+
+    release.set()
+    buffer.close()
+    assert first.done() and second.done()
+    db = TestingSessionLocal()
+    assert db.query(models.WorkoutSet).count() == 2
+    db.close()